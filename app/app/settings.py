@@ -12,20 +12,34 @@ https://docs.djangoproject.com/en/3.0/ref/settings/
 
 import os
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 
-# Quick-start development settings - unsuitable for production
+# DJANGO_ENV=production switches the defaults below to ones suited to
+# serving load; each can still be set by its own variable. Run
+# `manage.py perf_check` to audit the result.
 # See https://docs.djangoproject.com/en/3.0/howto/deployment/checklist/
+PRODUCTION = os.environ.get('DJANGO_ENV', 'development') == 'production'
 
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = 'sy(&ledn!s$d0j-2^h5z=*4-u9h*qf)wan$!b7d6r0&b+lsq6+'
+# The key committed here is for development only.
+if PRODUCTION and not os.environ.get('DJANGO_SECRET_KEY'):
+    raise ImproperlyConfigured('Set DJANGO_SECRET_KEY in production.')
+SECRET_KEY = os.environ.get(
+    'DJANGO_SECRET_KEY',
+    'sy(&ledn!s$d0j-2^h5z=*4-u9h*qf)wan$!b7d6r0&b+lsq6+'
+)
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# Debug also keeps every SQL statement run in memory.
+DEBUG = bool(int(os.environ.get('DEBUG', 0 if PRODUCTION else 1)))
 
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = [
+    h for h in os.environ.get('ALLOWED_HOSTS', '').split(',') if h
+]
 
 
 # Application definition
@@ -41,10 +55,13 @@ INSTALLED_APPS = [
     'rest_framework.authtoken',
     'core',
     'user',
+    'recipe',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.profiling.ProfilingMiddleware',
+    'core.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -84,9 +101,65 @@ DATABASES = {
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('DB_USER'),
         'PASSWORD': os.environ.get('DB_PASS'),
+        # Seconds a connection is reused for; 0 reconnects every request
+        'CONN_MAX_AGE': int(
+            os.environ.get('DB_CONN_MAX_AGE', 60 if PRODUCTION else 0)
+        ),
     }
 }
 
+# Extra shards for recipe data, as a comma separated list of database
+# names on the default host. Each user's recipes, tags and ingredients live
+# on one shard, the default database included; see core.shards.
+SHARD_DATABASES = ['default']
+shard_names = os.environ.get('DB_SHARD_NAMES', '')
+for i, name in enumerate(n for n in shard_names.split(',') if n):
+    alias = f'shard{i + 1}'
+    DATABASES[alias] = dict(DATABASES['default'], NAME=name)
+    SHARD_DATABASES.append(alias)
+# Shards new users are placed on, e.g. all but one being drained. The test
+# runner keeps them on default, see core.testing.TestRunner.
+NEW_USER_SHARDS = list(SHARD_DATABASES)
+
+# Read replicas, as a comma separated list of hosts sharing the default
+# database's name and credentials. Safe requests on the recipe and user
+# views read from them; see core.replicas. DB_REPLICA_NAMES gives each
+# replica its own database name instead, and DB_REPLICA_ENGINE another
+# backend, e.g. a local setup with SQLite files as replicas and no hosts.
+REPLICA_DATABASES = []
+replica_hosts = [h for h in os.environ.get('DB_REPLICA_HOSTS', '').split(',')
+                 if h]
+replica_names = [n for n in os.environ.get('DB_REPLICA_NAMES', '').split(',')
+                 if n]
+replica_engine = os.environ.get('DB_REPLICA_ENGINE',
+                                DATABASES['default']['ENGINE'])
+if len(replica_hosts) > 1 and len(replica_names) > 1 and \
+        len(replica_hosts) != len(replica_names):
+    raise ImproperlyConfigured(
+        'DB_REPLICA_HOSTS and DB_REPLICA_NAMES list different numbers of '
+        'replicas'
+    )
+# A single host or name is shared by every replica
+for i in range(max(len(replica_hosts), len(replica_names))):
+    alias = f'replica{i + 1}'
+    DATABASES[alias] = dict(
+        DATABASES['default'], ENGINE=replica_engine,
+        TEST={'MIRROR': 'default'}
+    )
+    if replica_hosts:
+        DATABASES[alias]['HOST'] = replica_hosts[i % len(replica_hosts)]
+    if replica_names:
+        DATABASES[alias]['NAME'] = replica_names[i % len(replica_names)]
+    REPLICA_DATABASES.append(alias)
+
+# Seconds a user keeps reading from the primary after a write
+REPLICA_STICKY_SECONDS = int(os.environ.get('DB_REPLICA_STICKY_SECONDS', 5))
+
+DATABASE_ROUTERS = [
+    'core.shards.ShardRouter',
+    'core.replicas.ReplicaRouter',
+]
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
@@ -131,3 +204,107 @@ MEDIA_ROOT = '/vol/web/media'
 STATIC_ROOT = '/vol/web/static'
 
 AUTH_USER_MODEL = 'core.User'
+
+TEST_RUNNER = 'core.testing.TestRunner'
+
+# Comma separated memcached servers. The cache must be shared by every
+# process, as it holds the replica pins and the similarity index versions;
+# without one each process has its own.
+CACHE_LOCATION = os.environ.get('CACHE_LOCATION', '')
+if CACHE_LOCATION:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+            'LOCATION': CACHE_LOCATION.split(','),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Bytes of a request body, and of each uploaded file, held in memory before
+# Django rejects the body or spools the file to disk
+DATA_UPLOAD_MAX_MEMORY_SIZE = int(
+    os.environ.get('DATA_UPLOAD_MAX_MEMORY_SIZE', 2621440)
+)
+FILE_UPLOAD_MAX_MEMORY_SIZE = int(
+    os.environ.get('FILE_UPLOAD_MAX_MEMORY_SIZE', 2621440)
+)
+
+# Recipe image uploads, checked while they stream in by
+# core.uploads.ImageUploadHandler. Bodies up to RECIPE_IMAGE_MEMORY_SIZE are
+# kept in memory and larger ones spooled to a temp file.
+RECIPE_IMAGE_MAX_SIZE = int(
+    os.environ.get('RECIPE_IMAGE_MAX_SIZE', 5 * 1024 * 1024)
+)
+RECIPE_IMAGE_MAX_PIXELS = int(
+    os.environ.get('RECIPE_IMAGE_MAX_PIXELS', 25 * 1000 * 1000)
+)
+RECIPE_IMAGE_MEMORY_SIZE = int(
+    os.environ.get('RECIPE_IMAGE_MEMORY_SIZE', 512 * 1024)
+)
+RECIPE_IMAGE_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP')
+
+# Number of users whose recipe similarity index is kept in memory by each
+# process
+SIMILARITY_INDEX_MAX_USERS = int(
+    os.environ.get('SIMILARITY_INDEX_MAX_USERS', 100)
+)
+
+# Number of users whose tag and ingredient names are kept in memory by each
+# process for autocomplete, once they looked up
+# AUTOCOMPLETE_INDEX_MIN_LOOKUPS times; 0 answers every lookup from the db
+AUTOCOMPLETE_INDEX_MAX_USERS = int(
+    os.environ.get('AUTOCOMPLETE_INDEX_MAX_USERS', 100)
+)
+AUTOCOMPLETE_INDEX_MIN_LOOKUPS = int(
+    os.environ.get('AUTOCOMPLETE_INDEX_MIN_LOOKUPS', 3)
+)
+
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.FastJSONRenderer',
+    ] + (['rest_framework.renderers.BrowsableAPIRenderer'] if DEBUG else []),
+}
+
+# Responses smaller than this many bytes are not compressed, and larger
+# ones of at least COMPRESSION_STREAM_MIN_SIZE are compressed as streamed
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))
+COMPRESSION_STREAM_MIN_SIZE = int(
+    os.environ.get('COMPRESSION_STREAM_MIN_SIZE', 256 * 1024)
+)
+COMPRESSION_GZIP_LEVEL = int(os.environ.get('COMPRESSION_GZIP_LEVEL', 6))
+COMPRESSION_BROTLI_QUALITY = int(
+    os.environ.get('COMPRESSION_BROTLI_QUALITY', 4)
+)
+
+# Seconds of changes resent by each sync, covering rows saved while the
+# previous sync ran and clock skew between servers
+SYNC_CURSOR_OVERLAP_SECONDS = int(
+    os.environ.get('SYNC_CURSOR_OVERLAP_SECONDS', 5)
+)
+# Days deletions are remembered for; older cursors get a full resync
+SYNC_TOMBSTONE_DAYS = int(os.environ.get('SYNC_TOMBSTONE_DAYS', 30))
+
+# Background jobs, see core.jobs. A failed job is tried again after
+# JOB_RETRY_BACKOFF_SECONDS, doubling each time up to the max. A running
+# job's worker renews its lease every JOB_HEARTBEAT_SECONDS; one not renewed
+# for JOB_LEASE_SECONDS is assumed lost and requeued.
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 5))
+JOB_RETRY_BACKOFF_SECONDS = int(os.environ.get('JOB_RETRY_BACKOFF_SECONDS', 10))
+JOB_RETRY_BACKOFF_MAX_SECONDS = int(
+    os.environ.get('JOB_RETRY_BACKOFF_MAX_SECONDS', 3600)
+)
+JOB_HEARTBEAT_SECONDS = int(os.environ.get('JOB_HEARTBEAT_SECONDS', 30))
+JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', 300))
+
+# Request profiling, see core.profiling. Staff can ask for a profile with
+# the X-Profile header and PROFILING_SAMPLE_RATE of all requests are
+# profiled; the PROFILING_MAX_FILES newest profiles are kept. Profiling is
+# off when PROFILING_DIR is empty.
+PROFILING_DIR = os.environ.get('PROFILING_DIR', '')
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0))
+PROFILING_MAX_FILES = int(os.environ.get('PROFILING_MAX_FILES', 50))
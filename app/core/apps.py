@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        # Connects the recipe_count handlers, registers the performance
+        # checks run by perf_check and check --deploy and the job tasks
+        from core import checks, signals, tasks  # noqa: F401
@@ -0,0 +1,111 @@
+from django.conf import settings
+from django.core.checks import Error, Warning, register
+from django.template import engines
+from django.template.backends.django import DjangoTemplates
+
+from core import renderers
+
+# Uploads kept in memory above this size hold a worker's RAM per request
+MAX_UPLOAD_MEMORY_SIZE = 10 * 1024 * 1024
+
+# Caches that aren't shared between processes
+PER_PROCESS_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register('performance', deploy=True)
+def check_debug(app_configs, **kwargs):
+    if settings.DEBUG:
+        return [Error(
+            'DEBUG is on, so every SQL statement run is kept in memory.',
+            hint='Set DJANGO_ENV=production or DEBUG=0.',
+            id='core.E001',
+        )]
+    return []
+
+
+@register('performance', deploy=True)
+def check_persistent_connections(app_configs, **kwargs):
+    return [
+        Error(
+            f'Database {alias} opens a connection for every request.',
+            hint='Set DB_CONN_MAX_AGE to keep connections open.',
+            id='core.E002',
+        )
+        for alias, options in settings.DATABASES.items()
+        if not options.get('CONN_MAX_AGE')
+    ]
+
+
+@register('performance', deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    backend = settings.CACHES['default']['BACKEND']
+    if backend in PER_PROCESS_CACHES:
+        return [Error(
+            f'The default cache ({backend}) is not shared between '
+            f'processes, so replica pins and similarity index versions '
+            f'are only seen by the worker that set them.',
+            hint='Set CACHE_LOCATION to a memcached server.',
+            id='core.E003',
+        )]
+    return []
+
+
+@register('performance', deploy=True)
+def check_cached_templates(app_configs, **kwargs):
+    errors = []
+    for engine in engines.all():
+        if not isinstance(engine, DjangoTemplates):
+            continue
+        loaders = [loader[0] if isinstance(loader, (list, tuple)) else loader
+                   for loader in engine.engine.loaders]
+        if 'django.template.loaders.cached.Loader' not in loaders:
+            errors.append(Error(
+                f'Templates of engine {engine.name} are parsed on every '
+                f'render.',
+                hint='Turn template debug off or use the cached loader.',
+                id='core.E004',
+            ))
+    return errors
+
+
+@register('performance', deploy=True)
+def check_upload_memory(app_configs, **kwargs):
+    errors = []
+    for name in ('FILE_UPLOAD_MAX_MEMORY_SIZE', 'DATA_UPLOAD_MAX_MEMORY_SIZE'):
+        size = getattr(settings, name)
+        if size is None or size > MAX_UPLOAD_MEMORY_SIZE:
+            errors.append(Error(
+                f'{name} is {size}, so a request may hold that much memory.',
+                hint=f'Keep it at most {MAX_UPLOAD_MEMORY_SIZE} bytes.',
+                id='core.E005',
+            ))
+    return errors
+
+
+@register('performance', deploy=True)
+def check_api_rendering(app_configs, **kwargs):
+    warnings = []
+    renderer_classes = getattr(settings, 'REST_FRAMEWORK', {}) \
+        .get('DEFAULT_RENDERER_CLASSES', [])
+    if 'rest_framework.renderers.BrowsableAPIRenderer' in renderer_classes:
+        warnings.append(Warning(
+            'The browsable API renderer is enabled; it runs extra queries '
+            'to render forms.',
+            id='core.W001',
+        ))
+    if renderers.orjson is None:
+        warnings.append(Warning(
+            'orjson is not installed, so JSON is rendered by the standard '
+            'library.',
+            id='core.W002',
+        ))
+    if 'core.middleware.CompressionMiddleware' not in settings.MIDDLEWARE:
+        warnings.append(Warning(
+            'Responses are not compressed.',
+            hint='Add core.middleware.CompressionMiddleware to MIDDLEWARE.',
+            id='core.W003',
+        ))
+    return warnings
@@ -0,0 +1,169 @@
+"""Background jobs kept in the database and run by `manage.py run_worker`.
+
+Register a function with @task('name') and queue a call to it with
+enqueue('name', *args, **kwargs); arguments must be JSON serializable.
+A job failing is retried with exponential backoff until it has been tried
+max_attempts times. While a job runs its worker renews a lease on it, so
+only jobs whose worker died are handed to another.
+"""
+import json
+import logging
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from core.models import Job
+
+logger = logging.getLogger(__name__)
+
+# Task name -> function, filled by the @task decorator
+registry = {}
+
+
+def task(name):
+    """Register the decorated function to run as jobs named name"""
+    def decorator(func):
+        registry[name] = func
+        return func
+    return decorator
+
+
+def enqueue(name, *args, run_at=None, max_attempts=None, **kwargs):
+    """Queue a call to the task name and return its job"""
+    if name not in registry:
+        raise KeyError(f'No task registered as {name}')
+    return Job.objects.create(
+        task=name,
+        payload=json.dumps({'args': args, 'kwargs': kwargs}),
+        run_at=run_at or timezone.now(),
+        max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+    )
+
+
+def retry_delay(attempts):
+    """Return how long to wait before the next try after attempts failed"""
+    return timedelta(seconds=min(
+        settings.JOB_RETRY_BACKOFF_SECONDS * 2 ** (attempts - 1),
+        settings.JOB_RETRY_BACKOFF_MAX_SECONDS,
+    ))
+
+
+def requeue_stale(now=None):
+    """Queue again the running jobs whose lease wasn't renewed for
+    JOB_LEASE_SECONDS, as their worker most likely died, and return how many
+    there were"""
+    now = now or timezone.now()
+    cutoff = now - timedelta(seconds=settings.JOB_LEASE_SECONDS)
+    # Jobs claimed before heartbeats existed only have started_at
+    return Job.objects.filter(
+        Q(heartbeat_at__lt=cutoff) |
+        Q(heartbeat_at__isnull=True, started_at__lt=cutoff),
+        status=Job.RUNNING,
+    ).update(status=Job.QUEUED, locked_by='', run_at=now)
+
+
+class Heartbeat(threading.Thread):
+    """Renew the lease of a running job every JOB_HEARTBEAT_SECONDS, however
+    long it runs. Used as a context manager around the job."""
+
+    def __init__(self, job):
+        super().__init__(name=f'heartbeat-{job.pk}', daemon=True)
+        self.job = job
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(settings.JOB_HEARTBEAT_SECONDS):
+                if not self.beat():
+                    logger.warning('Job %s lost its lease', self.job)
+                    return
+        finally:
+            # This thread's own connections
+            connections.close_all()
+
+    def beat(self, now=None):
+        """Renew the lease, returning False if the job was taken away"""
+        return bool(Job.objects.filter(
+            id=self.job.id, status=Job.RUNNING, locked_by=self.job.locked_by
+        ).update(heartbeat_at=now or timezone.now()))
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.join()
+
+
+def claim(worker, limit=1):
+    """Mark up to limit due jobs as running for worker and return them.
+
+    On databases with SKIP LOCKED the due rows are locked and claimed in
+    one transaction, skipping rows other workers hold. Elsewhere each row
+    is claimed by an update conditional on it still being queued, so a job
+    is never handed to two workers either way.
+    """
+    now = timezone.now()
+    due = Job.objects.filter(status=Job.QUEUED, run_at__lte=now) \
+        .order_by('run_at', 'id')
+    changes = dict(status=Job.RUNNING, locked_by=worker, started_at=now,
+                   heartbeat_at=now, finished_at=None,
+                   attempts=F('attempts') + 1)
+    alias = router.db_for_write(Job)
+
+    if connections[alias].features.has_select_for_update_skip_locked:
+        with transaction.atomic(using=alias):
+            ids = list(due.using(alias).select_for_update(skip_locked=True)
+                       .values_list('id', flat=True)[:limit])
+            Job.objects.using(alias).filter(id__in=ids).update(**changes)
+    else:
+        ids = []
+        for pk in due.using(alias).values_list('id', flat=True)[:limit * 4]:
+            if Job.objects.using(alias) \
+                    .filter(id=pk, status=Job.QUEUED).update(**changes):
+                ids.append(pk)
+                if len(ids) == limit:
+                    break
+    return list(Job.objects.using(alias).filter(id__in=ids).order_by('id'))
+
+
+def run_job(job):
+    """Run a claimed job and record how it went. Returns True if it
+    succeeded."""
+    worker = job.locked_by
+    try:
+        func = registry[job.task]
+        payload = json.loads(job.payload)
+        with Heartbeat(job):
+            func(*payload.get('args', ()), **payload.get('kwargs', {}))
+    except Exception:
+        logger.exception('Job %s failed', job)
+        job.last_error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            job.status = Job.QUEUED
+            job.run_at = timezone.now() + retry_delay(job.attempts)
+        else:
+            job.status = Job.FAILED
+        succeeded = False
+    else:
+        job.status = Job.DONE
+        job.last_error = ''
+        succeeded = True
+
+    job.finished_at = timezone.now()
+    job.locked_by = ''
+    # Skipped if the job was requeued as stale meanwhile and another worker
+    # holds it now
+    Job.objects.filter(
+        id=job.id, status=Job.RUNNING, locked_by=worker
+    ).update(
+        status=job.status, run_at=job.run_at, last_error=job.last_error,
+        finished_at=job.finished_at, locked_by='',
+    )
+    return succeeded
@@ -0,0 +1,372 @@
+"""Asyncio HTTP load generator behind `manage.py loadgen`.
+
+Speaks just enough HTTP/1.1 over asyncio streams to keep one connection
+per simulated user, so it needs no client library and goes through the
+whole server stack, unlike the test client.
+"""
+import asyncio
+import json
+import math
+import random
+import ssl
+import time
+import uuid
+from collections import Counter, defaultdict
+from io import BytesIO
+from urllib.parse import urlencode, urlsplit
+
+from PIL import Image
+
+# Upper bounds of the latency histogram buckets in ms; slower requests go
+# to a last, unbounded bucket
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+# Operation -> relative weight
+DEFAULT_MIX = {'list': 50, 'filter': 20, 'detail': 20, 'create': 8,
+               'upload': 2}
+
+RECIPES = '/api/recipe/recipes/'
+
+
+def parse_mix(value):
+    """Parse 'list=50,detail=20' into an operation -> weight dict"""
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise ValueError(f'Unknown operation {name}')
+        mix[name] = int(weight)
+        if mix[name] < 0:
+            raise ValueError(f'Negative weight for {name}')
+    if not any(mix.values()):
+        raise ValueError('The mix has no operation to run')
+    return mix
+
+
+def parse_url(url):
+    """Split a base url into host, port, TLS context and path prefix"""
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https'):
+        raise ValueError(f'Unsupported scheme {parts.scheme or "(none)"}')
+    if not parts.hostname:
+        raise ValueError('No host given')
+    https = parts.scheme == 'https'
+    context = ssl.create_default_context() if https else None
+    port = parts.port or (443 if https else 80)
+    return parts.hostname, port, context, parts.path.rstrip('/')
+
+
+def _jpeg():
+    image = BytesIO()
+    Image.new('RGB', (64, 64), (200, 120, 40)).save(image, format='JPEG')
+    return image.getvalue()
+
+
+class Connection:
+    """Keep-alive HTTP/1.1 connection to one server, sending every path
+    under prefix"""
+
+    def __init__(self, host, port, timeout, ssl=None, prefix=''):
+        self.host, self.port, self.timeout = host, port, timeout
+        self.ssl, self.prefix = ssl, prefix
+        self.reader = self.writer = None
+
+    async def request(self, method, path, body=b'', headers=()):
+        """Send a request and return its status and body, reconnecting
+        once if the server closed an idle connection"""
+        for retry in (True, False):
+            reused = self.writer is not None
+            if not reused:
+                self.reader, self.writer = await asyncio.wait_for(
+                    asyncio.open_connection(self.host, self.port,
+                                            ssl=self.ssl),
+                    self.timeout
+                )
+            try:
+                return await asyncio.wait_for(
+                    self._exchange(method, path, body, headers),
+                    self.timeout
+                )
+            except (ConnectionError, asyncio.IncompleteReadError):
+                self.close()
+                if not (retry and reused):
+                    raise
+            except asyncio.TimeoutError:
+                self.close()
+                raise
+
+    async def _exchange(self, method, path, body, headers):
+        lines = [f'{method} {self.prefix}{path} HTTP/1.1',
+                 f'Host: {self.host}',
+                 f'Content-Length: {len(body)}', *headers]
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode() + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError('Connection closed by the server')
+        status = int(status_line.split()[1])
+        response_headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+
+        if response_headers.get('transfer-encoding', '').lower() == \
+                'chunked':
+            body = await self._read_chunked()
+        elif 'content-length' in response_headers:
+            body = await self.reader.readexactly(
+                int(response_headers['content-length'])
+            )
+        elif status in (204, 304):
+            body = b''
+        else:
+            body = await self.reader.read()
+            response_headers['connection'] = 'close'
+        if response_headers.get('connection', '').lower() == 'close':
+            self.close()
+        return status, body
+
+    async def _read_chunked(self):
+        chunks = []
+        while True:
+            size = int((await self.reader.readline()).split(b';')[0], 16)
+            if not size:
+                # Skip the trailers
+                while (await self.reader.readline()) not in (b'\r\n', b''):
+                    pass
+                return b''.join(chunks)
+            chunks.append(await self.reader.readexactly(size))
+            await self.reader.readline()
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+class Stats:
+    """Latencies and errors per operation"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(Counter)
+
+    def record(self, operation, seconds, error=None):
+        self.latencies[operation].append(seconds * 1000)
+        if error is not None:
+            self.errors[operation][error] += 1
+
+    def summary(self, elapsed):
+        """Return the results of every operation as a JSON ready dict"""
+        return {
+            operation: self._summarize(operation, latencies, elapsed)
+            for operation, latencies in sorted(self.latencies.items())
+        }
+
+    def _summarize(self, operation, latencies, elapsed):
+        latencies = sorted(latencies)
+        errors = sum(self.errors[operation].values())
+        histogram = [0] * (len(BUCKETS_MS) + 1)
+        bucket = 0
+        for latency in latencies:
+            while bucket < len(BUCKETS_MS) and latency > BUCKETS_MS[bucket]:
+                bucket += 1
+            histogram[bucket] += 1
+        return {
+            'requests': len(latencies),
+            'errors': dict(self.errors[operation]),
+            'error_rate': errors / len(latencies),
+            'throughput': len(latencies) / elapsed if elapsed else 0.0,
+            'mean_ms': sum(latencies) / len(latencies),
+            'p50_ms': percentile(latencies, 50),
+            'p90_ms': percentile(latencies, 90),
+            'p99_ms': percentile(latencies, 99),
+            'max_ms': latencies[-1],
+            'histogram': histogram,
+        }
+
+
+def percentile(ordered, q):
+    """Return the nearest-rank q-th percentile of sorted values"""
+    rank = max(math.ceil(q / 100 * len(ordered)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+class VirtualUser:
+    """One simulated user with its own account, data and connection"""
+
+    def __init__(self, connection, rng):
+        self.connection = connection
+        self.rng = rng
+        self.token = None
+        self.tags, self.ingredients, self.recipes = [], [], []
+
+    async def call(self, method, path, data=None, files=None):
+        """Send a JSON or multipart request and return its status and
+        parsed body"""
+        headers = ['Accept: application/json']
+        if self.token:
+            headers.append(f'Authorization: Token {self.token}')
+        body = b''
+        if files:
+            boundary = uuid.uuid4().hex
+            headers.append(
+                f'Content-Type: multipart/form-data; boundary={boundary}'
+            )
+            body = b''.join(
+                f'--{boundary}\r\nContent-Disposition: form-data; '
+                f'name="{name}"; filename="{filename}"\r\n'
+                f'Content-Type: image/jpeg\r\n\r\n'.encode() + content +
+                b'\r\n'
+                for name, (filename, content) in files.items()
+            ) + f'--{boundary}--\r\n'.encode()
+        elif data is not None:
+            headers.append('Content-Type: application/json')
+            body = json.dumps(data).encode()
+
+        status, content = await self.connection.request(
+            method, path, body, headers
+        )
+        try:
+            return status, json.loads(content) if content else None
+        except ValueError:
+            return status, None
+
+    async def expect(self, method, path, data=None, files=None):
+        status, body = await self.call(method, path, data, files)
+        if status >= 400:
+            raise RuntimeError(f'{method} {path} answered {status}: {body}')
+        return body
+
+    async def sign_up(self, email, password, recipes):
+        """Create the account and its starting data; not measured"""
+        await self.expect('POST', '/api/user/create/',
+                          {'email': email, 'password': password,
+                           'name': 'Load generator'})
+        body = await self.expect('POST', '/api/user/token/',
+                                 {'email': email, 'password': password})
+        self.token = body['token']
+        for i in range(3):
+            tag = await self.expect('POST', '/api/recipe/tags/',
+                                    {'name': f'Tag {i}'})
+            self.tags.append(tag['id'])
+            ingredient = await self.expect(
+                'POST', '/api/recipe/ingredients/',
+                {'name': f'Ingredient {i}'}
+            )
+            self.ingredients.append(ingredient['id'])
+        for _ in range(recipes):
+            recipe = await self.expect('POST', RECIPES, self._new_recipe())
+            self.recipes.append(recipe['id'])
+
+    def _new_recipe(self):
+        rng = self.rng
+        return {
+            'title': f'Recipe {rng.randrange(10 ** 6)}',
+            'time_minutes': rng.randint(5, 120),
+            'price': f'{rng.uniform(1, 50):.2f}',
+            'tags': rng.sample(self.tags, rng.randint(0, len(self.tags))),
+            'ingredients': rng.sample(
+                self.ingredients, rng.randint(1, len(self.ingredients))
+            ),
+        }
+
+    def _recipe_id(self):
+        return self.rng.choice(self.recipes)
+
+    # The operations of the mix; each returns the response status
+
+    async def list(self):
+        return (await self.call('GET', RECIPES))[0]
+
+    async def filter(self):
+        params = urlencode({
+            'time_minutes_max': self.rng.choice((15, 30, 60)),
+            'ordering': self.rng.choice(('price', '-time_minutes')),
+            'tags': self.rng.choice(self.tags),
+        })
+        return (await self.call('GET', f'{RECIPES}?{params}'))[0]
+
+    async def detail(self):
+        return (await self.call('GET', f'{RECIPES}{self._recipe_id()}/'))[0]
+
+    async def create(self):
+        status, body = await self.call('POST', RECIPES, self._new_recipe())
+        if status == 201:
+            self.recipes.append(body['id'])
+        return status
+
+    async def upload(self):
+        status, _ = await self.call(
+            'POST', f'{RECIPES}{self._recipe_id()}/upload-image/',
+            files={'image': ('load.jpg', JPEG)}
+        )
+        return status
+
+
+JPEG = _jpeg()
+
+
+async def run(url, users=10, duration=30.0, requests=0, mix=None, seed=None,
+              timeout=10.0, recipes=5, password='loadgen-pass'):
+    """Sign up the users, replay the mix until the duration or request
+    count is reached and return the results"""
+    host, port, context, prefix = parse_url(url)
+    mix = mix or DEFAULT_MIX
+    rng = random.Random(seed)
+    run_id = uuid.uuid4().hex[:8]
+
+    vusers = [
+        VirtualUser(Connection(host, port, timeout, context, prefix),
+                    random.Random(rng.random()))
+        for _ in range(users)
+    ]
+    try:
+        await asyncio.gather(*(
+            vuser.sign_up(f'loadgen-{run_id}-{i}@example.com', password,
+                          recipes)
+            for i, vuser in enumerate(vusers)
+        ))
+
+        stats = Stats()
+        operations, weights = zip(*mix.items())
+        budget = {'left': requests or None}
+        deadline = time.perf_counter() + duration if duration else None
+
+        async def replay(vuser):
+            while deadline is None or time.perf_counter() < deadline:
+                if budget['left'] is not None:
+                    if budget['left'] <= 0:
+                        return
+                    budget['left'] -= 1
+                operation = vuser.rng.choices(operations, weights)[0]
+                start = time.perf_counter()
+                try:
+                    status = await getattr(vuser, operation)()
+                    error = str(status) if status >= 400 else None
+                except asyncio.TimeoutError:
+                    error = 'timeout'
+                except (OSError, asyncio.IncompleteReadError) as exc:
+                    error = type(exc).__name__
+                stats.record(operation, time.perf_counter() - start, error)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(replay(vuser) for vuser in vusers))
+        elapsed = time.perf_counter() - start
+    finally:
+        for vuser in vusers:
+            vuser.connection.close()
+
+    total = sum(len(latencies) for latencies in stats.latencies.values())
+    return {
+        'config': {'url': url, 'users': users, 'duration': duration,
+                   'requests': requests, 'mix': mix, 'seed': seed},
+        'elapsed': elapsed,
+        'throughput': total / elapsed if elapsed else 0.0,
+        'operations': stats.summary(elapsed),
+    }
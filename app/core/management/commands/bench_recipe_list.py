@@ -0,0 +1,68 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from core import middleware
+from core.renderers import FastJSONRenderer
+from recipe import views
+
+RENDERERS = (('json', JSONRenderer), ('fast', FastJSONRenderer))
+
+
+class Command(BaseCommand):
+    """Django command to benchmark rendering the recipe list endpoint"""
+    help = 'Report bytes sent and CPU time per request of the recipe list ' \
+           'for each JSON renderer and content encoding'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', required=True,
+            help='Email of the user whose recipes are listed'
+        )
+        parser.add_argument(
+            '--requests', type=int, default=20,
+            help='Number of requests timed per combination'
+        )
+
+    def handle(self, *args, **options):
+        user = get_user_model().objects.filter(email=options['user']).first()
+        if user is None:
+            raise CommandError('No matching user found')
+
+        codings = ['identity', 'gzip']
+        if middleware.brotli is not None:
+            codings.append('br')
+
+        self.stdout.write(f'{"renderer":10}{"encoding":10}'
+                          f'{"bytes":>12}{"cpu ms/req":>12}')
+        for name, renderer in RENDERERS:
+            view = views.RecipeViewSet.as_view(
+                {'get': 'list'}, renderer_classes=[renderer]
+            )
+            for coding in codings:
+                size, cpu = self._bench(view, user, coding,
+                                        options['requests'])
+                self.stdout.write(f'{name:10}{coding:10}'
+                                  f'{size:>12}{cpu * 1000:>12.2f}')
+
+    def _bench(self, view, user, coding, requests):
+        """Return the body size and mean CPU seconds of a request"""
+        factory = APIRequestFactory()
+        handler = middleware.CompressionMiddleware(
+            lambda request: view(request).render()
+        )
+        # The first request warms up caches and isn't timed
+        size = self._request(factory, handler, user, coding)
+        start = time.process_time()
+        for _ in range(requests):
+            self._request(factory, handler, user, coding)
+        return size, (time.process_time() - start) / max(requests, 1)
+
+    def _request(self, factory, handler, user, coding):
+        request = factory.get('/api/recipe/recipes/',
+                              HTTP_ACCEPT_ENCODING=coding)
+        force_authenticate(request, user)
+        return len(b''.join(handler(request)))
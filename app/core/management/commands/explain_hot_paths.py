@@ -0,0 +1,121 @@
+import re
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from django.db import connections
+from django.db.models import Count
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from core.models import Tag, Ingredient, Recipe
+from core.shards import use_shard
+from recipe import views
+
+# Plan nodes that usually mean an index is missing, per db vendor. Only
+# node lines match, not details such as PostgreSQL's "Sort Key:".
+WARNING_MARKERS = {
+    'postgresql': (
+        re.compile(r'^\s*(->\s*)?(Parallel )?Seq Scan\b'),
+        re.compile(r'^\s*(->\s*)?(Incremental )?Sort\b(?! (Key|Method))'),
+    ),
+    'sqlite': (
+        re.compile(r'SCAN TABLE'),
+        re.compile(r'USE TEMP B-TREE'),
+    ),
+}
+
+
+class Command(BaseCommand):
+    """Django command to EXPLAIN the querysets served by the api viewsets"""
+    help = 'Run EXPLAIN on every viewset queryset and flag scans and sorts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            help='Email of the user to build the querysets for '
+                 '(defaults to the user with the most recipes)'
+        )
+        parser.add_argument(
+            '--strict', action='store_true',
+            help='Exit with an error if any plan was flagged'
+        )
+
+    def handle(self, *args, **options):
+        user = self._get_user(options['user'])
+        markers = WARNING_MARKERS.get(connections[user.shard].vendor, ())
+
+        with use_shard(user.shard):
+            flagged = self._explain_hot_paths(user, markers)
+
+        if flagged and options['strict']:
+            raise CommandError(f'{flagged} plan line(s) flagged')
+        self.stdout.write(self.style.SUCCESS(
+            f'{flagged} plan line(s) flagged'
+        ))
+
+    def _explain_hot_paths(self, user, markers):
+        """Print the plan of every hot path and return the flagged count"""
+        flagged = 0
+        for name, queryset in self._hot_paths(user):
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(str(queryset.query))
+            for line in self._explain(queryset).splitlines():
+                if any(marker.search(line) for marker in markers):
+                    flagged += 1
+                    self.stdout.write(self.style.WARNING(line))
+                else:
+                    self.stdout.write(line)
+            self.stdout.write('')
+        return flagged
+
+    def _get_user(self, email):
+        """Return the user whose data the plans are run against"""
+        users = get_user_model().objects.all()
+        if email:
+            user = users.filter(email=email).first()
+        else:
+            user = users.filter(id=self._busiest_user_id()).first() \
+                or users.first()
+        if user is None:
+            raise CommandError('No matching user found')
+        return user
+
+    def _busiest_user_id(self):
+        """Return the id of the user with the most recipes on any shard"""
+        busiest = []
+        for alias in settings.SHARD_DATABASES:
+            top = Recipe.objects.using(alias).values('user_id') \
+                .annotate(n=Count('id')).order_by('-n').first()
+            if top:
+                busiest.append((top['n'], top['user_id']))
+        return max(busiest)[1] if busiest else None
+
+    def _hot_paths(self, user):
+        """Yield a name and the queryset each viewset would run for user"""
+        tag = Tag.objects.filter(user=user).values_list('id', flat=True)
+        ingredient = Ingredient.objects.filter(user=user) \
+            .values_list('id', flat=True)
+        tag_id = tag.first() or 0
+        ingredient_id = ingredient.first() or 0
+
+        paths = (
+            ('tags', views.TagViewSet, {}),
+            ('ingredients', views.IngredientViewSet, {}),
+            ('recipes', views.RecipeViewSet, {}),
+            ('recipes?tags', views.RecipeViewSet, {'tags': tag_id}),
+            ('recipes?ingredients', views.RecipeViewSet,
+             {'ingredients': ingredient_id}),
+        )
+        factory = APIRequestFactory()
+        for name, viewset, params in paths:
+            request = Request(factory.get('/', params))
+            request.user = user
+            view = viewset(request=request, format_kwarg=None, action='list')
+            yield name, view.get_queryset()
+
+    def _explain(self, queryset):
+        """Return the query plan, with runtime statistics where supported"""
+        if connections[queryset.db].vendor == 'postgresql':
+            return queryset.explain(analyze=True, buffers=True)
+        return queryset.explain()
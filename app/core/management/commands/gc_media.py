@@ -0,0 +1,162 @@
+import itertools
+import json
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.models import Recipe
+
+
+def walk_sorted(root, rel_dir='', after=()):
+    """Yield the relative paths under root in sorted order, one at a time.
+
+    Only one directory listing is held in memory per level. Subtrees that
+    sort entirely before the `after` checkpoint are skipped without being
+    listed.
+    """
+    abs_dir = os.path.join(root, rel_dir)
+    try:
+        entries = sorted(os.scandir(abs_dir), key=lambda e: e.name)
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        # Skip dotfiles, including our own checkpoint file
+        if entry.name.startswith('.'):
+            continue
+        rel_path = os.path.join(rel_dir, entry.name)
+        parts = tuple(rel_path.split(os.sep))
+        if entry.is_dir(follow_symlinks=False):
+            if parts < after[:len(parts)]:
+                continue
+            yield from walk_sorted(root, rel_path, after)
+        elif entry.is_file(follow_symlinks=False) and parts > after:
+            yield rel_path
+
+
+def batched(iterable, size):
+    """Group an iterable into lists of at most size items"""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Command(BaseCommand):
+    """Django command to delete media files no recipe refers to"""
+    help = 'Delete files under MEDIA_ROOT not referenced by Recipe.image'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--prefix', default='uploads/recipe',
+            help='Directory under MEDIA_ROOT to scan'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Number of files checked against the db per query'
+        )
+        parser.add_argument(
+            '--limit', type=int, default=0,
+            help='Stop after examining this many files (0 for no limit)'
+        )
+        parser.add_argument(
+            '--min-age', type=int, default=3600,
+            help='Ignore files modified less than this many seconds ago'
+        )
+        parser.add_argument(
+            '--rate', type=float, default=0,
+            help='Maximum deletions per second (0 for no limit)'
+        )
+        parser.add_argument(
+            '--checkpoint',
+            default=os.path.join(settings.MEDIA_ROOT, '.gc_media.json'),
+            help='File used to resume an interrupted run'
+        )
+        parser.add_argument('--reset', action='store_true',
+                            help='Ignore the checkpoint and start over')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report the orphaned files')
+
+    def handle(self, *args, **options):
+        root = settings.MEDIA_ROOT
+        prefix = options['prefix'].strip('/')
+        checkpoint = options['checkpoint']
+        after = () if options['reset'] else self._load_checkpoint(checkpoint)
+        newest = time.time() - options['min_age']
+        delay = 1 / options['rate'] if options['rate'] else 0
+
+        files = walk_sorted(root, prefix, after)
+        if options['limit']:
+            files_to_check = itertools.islice(files, options['limit'])
+        else:
+            files_to_check = files
+        examined = orphans = 0
+        for batch in batched(files_to_check, options['batch_size']):
+            referenced = set()
+            for alias in settings.SHARD_DATABASES:
+                referenced.update(
+                    Recipe.objects.using(alias).filter(image__in=batch)
+                    .values_list('image', flat=True)
+                )
+            for name in batch:
+                if name in referenced:
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    if os.path.getmtime(path) > newest:
+                        continue
+                except FileNotFoundError:
+                    # Removed since the directory was listed
+                    continue
+                if options['dry_run']:
+                    orphans += 1
+                    self.stdout.write(f'Would delete {name}')
+                    continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                orphans += 1
+                self.stdout.write(f'Deleted {name}')
+                if delay:
+                    time.sleep(delay)
+            examined += len(batch)
+            if not options['dry_run']:
+                self._save_checkpoint(checkpoint, batch[-1])
+
+        # Start over next time once the whole tree has been walked
+        finished = next(files, None) is None
+        if finished and not options['dry_run']:
+            self._clear_checkpoint(checkpoint)
+
+        verb = 'Found' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {orphans} orphaned file(s) out of {examined} examined'
+        ))
+
+    def _load_checkpoint(self, path):
+        """Return the last path processed by a previous run as parts"""
+        try:
+            with open(path) as f:
+                return tuple(json.load(f)['last'].split(os.sep))
+        except (FileNotFoundError, ValueError, KeyError):
+            return ()
+
+    def _save_checkpoint(self, path, last):
+        """Atomically record the last path processed"""
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'last': last}, f)
+        os.replace(tmp, path)
+
+    def _clear_checkpoint(self, path):
+        """Remove the checkpoint once a full pass has completed"""
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
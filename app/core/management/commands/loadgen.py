@@ -0,0 +1,164 @@
+import asyncio
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import loadgen
+
+COLUMNS = ('requests', 'error_rate', 'throughput', 'p50_ms', 'p90_ms',
+           'p99_ms', 'max_ms')
+
+
+class Command(BaseCommand):
+    """Django command to load test a running server"""
+    help = 'Replay a mix of recipe API calls as many concurrent users ' \
+           'against a running server and report throughput, latencies ' \
+           'and errors. Creates a fresh account per user, so point it at ' \
+           'a development database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url', default='http://127.0.0.1:8000',
+            help='Base url of the server, http or https, with any path '
+                 'prefix the API is mounted under'
+        )
+        parser.add_argument(
+            '--users', type=int, default=10,
+            help='Number of concurrent users'
+        )
+        parser.add_argument(
+            '--duration', type=float, default=30,
+            help='Seconds to run for, 0 to stop after --requests only'
+        )
+        parser.add_argument(
+            '--requests', type=int, default=0,
+            help='Stop after this many requests in all, 0 for no limit'
+        )
+        parser.add_argument(
+            '--mix', default=','.join(
+                f'{name}={weight}'
+                for name, weight in loadgen.DEFAULT_MIX.items()
+            ),
+            help='Relative weights of the operations, out of ' +
+                 ', '.join(loadgen.DEFAULT_MIX)
+        )
+        parser.add_argument(
+            '--recipes', type=int, default=5,
+            help='Recipes created per user before the run'
+        )
+        parser.add_argument(
+            '--timeout', type=float, default=10,
+            help='Seconds to wait for each response'
+        )
+        parser.add_argument(
+            '--seed', type=int,
+            help='Seed the choice of operations and data, for repeat runs'
+        )
+        parser.add_argument(
+            '--output',
+            help='File to save the results to, loadgen-<time>.json by '
+                 'default'
+        )
+        parser.add_argument(
+            '--compare',
+            help='Results file of an earlier run to compare with'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            mix = loadgen.parse_mix(options['mix'])
+        except ValueError as exc:
+            raise CommandError(f'Invalid --mix: {exc}')
+        try:
+            loadgen.parse_url(options['url'])
+        except ValueError as exc:
+            raise CommandError(f'Invalid --url: {exc}')
+        if not options['duration'] and not options['requests']:
+            raise CommandError('Give a --duration or a number of --requests')
+        if options['users'] < 1:
+            raise CommandError('--users must be at least 1')
+        # Detail and upload need a recipe to pick from
+        recipes = max(options['recipes'], 1)
+
+        previous = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as f:
+                    previous = json.load(f)
+            except (OSError, ValueError) as exc:
+                raise CommandError(f'Invalid --compare file: {exc}')
+            if not isinstance(previous, dict) or \
+                    not isinstance(previous.get('operations'), dict):
+                raise CommandError(
+                    f'Invalid --compare file: {options["compare"]} holds no '
+                    f'loadgen results'
+                )
+
+        try:
+            results = asyncio.run(loadgen.run(
+                options['url'], users=options['users'],
+                duration=options['duration'], requests=options['requests'],
+                mix=mix, seed=options['seed'], timeout=options['timeout'],
+                recipes=recipes
+            ))
+        except (OSError, asyncio.TimeoutError) as exc:
+            raise CommandError(f'Could not reach {options["url"]}: {exc}')
+        except RuntimeError as exc:
+            # Signing up the users failed
+            raise CommandError(str(exc))
+
+        self._report(results, previous)
+        output = options['output'] or \
+            time.strftime('loadgen-%Y%m%d-%H%M%S.json')
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+        self.stdout.write(f'Results saved to {output}')
+
+    def _report(self, results, previous):
+        self.stdout.write(
+            f'{results["elapsed"]:.1f}s, {results["throughput"]:.1f} req/s'
+        )
+        self.stdout.write(f'{"operation":10}{"reqs":>8}{"err %":>8}'
+                          f'{"req/s":>9}{"p50 ms":>9}{"p90 ms":>9}'
+                          f'{"p99 ms":>9}{"max ms":>9}')
+        for name, result in results['operations'].items():
+            requests, error_rate, *rest = [result[key] for key in COLUMNS]
+            self.stdout.write(
+                f'{name:10}{requests:>8}{error_rate * 100:>8.1f}' +
+                ''.join(f'{value:>9.1f}' for value in rest)
+            )
+            if result['errors']:
+                self.stdout.write('  errors: ' + ', '.join(
+                    f'{error} x{count}'
+                    for error, count in sorted(result['errors'].items())
+                ))
+
+        self.stdout.write('\nLatency histogram (requests per bucket)')
+        bounds = [f'<={bound}' for bound in loadgen.BUCKETS_MS] + \
+            [f'>{loadgen.BUCKETS_MS[-1]}']
+        self.stdout.write(f'{"ms":10}' + ''.join(
+            f'{bound:>7}' for bound in bounds
+        ))
+        for name, result in results['operations'].items():
+            self.stdout.write(f'{name:10}' + ''.join(
+                f'{count:>7}' for count in result['histogram']
+            ))
+
+        if previous is not None:
+            self._compare(results, previous)
+
+    def _compare(self, results, previous):
+        self.stdout.write('\nChange from the earlier run')
+        self.stdout.write(f'{"operation":10}{"req/s":>10}{"p50 ms":>10}'
+                          f'{"p99 ms":>10}{"err %":>10}')
+        for name, result in results['operations'].items():
+            before = previous['operations'].get(name)
+            if before is None:
+                continue
+            deltas = [result[key] - before[key] for key in
+                      ('throughput', 'p50_ms', 'p99_ms', 'error_rate')]
+            deltas[-1] *= 100
+            self.stdout.write(f'{name:10}' + ''.join(
+                f'{delta:>+10.1f}' for delta in deltas
+            ))
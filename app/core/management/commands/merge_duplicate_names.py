@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.models import Tag, Ingredient, Recipe
+from core.utils import find_duplicate_names, merge_duplicate_names, \
+    reconcile_recipe_counts
+
+
+class Command(BaseCommand):
+    """Django command to fold tags and ingredients differing only by case"""
+    help = 'Merge duplicate tag and ingredient names of each user'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report the duplicate groups')
+
+    def handle(self, *args, **options):
+        targets = (
+            (Tag, Recipe.tags.through, 'tag_id'),
+            (Ingredient, Recipe.ingredients.through, 'ingredient_id'),
+        )
+        for alias in settings.SHARD_DATABASES:
+            for model, through, column in targets:
+                self._merge(alias, model, through, column, options['dry_run'])
+
+    def _merge(self, alias, model, through, column, dry_run):
+        name = model._meta.verbose_name_plural
+        if dry_run:
+            for group in find_duplicate_names(model, alias):
+                self.stdout.write(
+                    f"{alias}: user {group['user_id']}: {group['count']} "
+                    f"{name} named '{group['lower_name']}'"
+                )
+            return
+
+        removed = merge_duplicate_names(model, through, column, alias)
+        # The bulk relinking bypasses the recipe_count signal handlers
+        reconcile_recipe_counts(model, through, column, alias)
+        self.stdout.write(self.style.SUCCESS(
+            f'{alias}: merged {removed} duplicate {name}'
+        ))
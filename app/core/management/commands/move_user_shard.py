@@ -0,0 +1,149 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from core.models import Tag, Ingredient, Recipe, Tombstone
+from core.utils import delete_ids
+
+# Fields copied verbatim; ids are reassigned as each shard has its own
+# sequences
+ATTR_FIELDS = ('name', 'recipe_count')
+RECIPE_FIELDS = ('title', 'time_minutes', 'price', 'link', 'image')
+
+
+class Command(BaseCommand):
+    """Django command to move a user's recipe data to another shard"""
+    help = 'Move the recipes, tags and ingredients of a user between shards'
+
+    def add_arguments(self, parser):
+        parser.add_argument('email', help='Email of the user to move')
+        parser.add_argument('shard', help='Database alias to move to')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of rows inserted per query and deleted per '
+                 'transaction'
+        )
+
+    def handle(self, *args, **options):
+        target = options['shard']
+        if target not in settings.SHARD_DATABASES:
+            raise CommandError(f'{target} is not one of SHARD_DATABASES')
+        user = get_user_model().objects.filter(email=options['email']).first()
+        if user is None:
+            raise CommandError('No matching user found')
+        self.batch_size = options['batch_size']
+
+        source = user.shard
+        if source != target:
+            # The user can't authenticate while the data is copied, so no
+            # write made on the source shard gets lost
+            was_active = user.is_active
+            user.is_active = False
+            user.save(update_fields=['is_active'])
+            try:
+                counts = self._copy(user, source, target)
+                user.shard = target
+            finally:
+                user.is_active = was_active
+                user.save(update_fields=['is_active', 'shard'])
+            self.stdout.write(
+                f'Copied {counts[0]} recipes, {counts[1]} tags and '
+                f'{counts[2]} ingredients from {source} to {target}'
+            )
+
+        # Also clears leftovers of a move interrupted after the switch.
+        # Clients resync from scratch after a move, see
+        # recipe.views.SyncView.
+        for alias in settings.SHARD_DATABASES:
+            if alias != user.shard:
+                self._delete(user, alias, Tombstone)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{user.email} is on {user.shard}'
+        ))
+
+    def _copy(self, user, source, target):
+        """Copy the user's rows from source to target in one transaction,
+        returning the number of recipes, tags and ingredients copied"""
+        with transaction.atomic(using=target):
+            # Start from a clean slate if an earlier copy was interrupted
+            self._delete(user, target)
+
+            tag_ids = self._copy_rows(Tag, ATTR_FIELDS, user, source, target)
+            ingredient_ids = self._copy_rows(
+                Ingredient, ATTR_FIELDS, user, source, target
+            )
+            recipe_ids = self._copy_rows(
+                Recipe, RECIPE_FIELDS, user, source, target
+            )
+            self._copy_links(Recipe.tags.through, 'tag_id', tag_ids,
+                             recipe_ids, user, source, target)
+            self._copy_links(Recipe.ingredients.through, 'ingredient_id',
+                             ingredient_ids, recipe_ids, user, source, target)
+
+        return len(recipe_ids), len(tag_ids), len(ingredient_ids)
+
+    def _delete(self, user, alias, *extra_models):
+        """Delete the user's recipes, their links, tags, ingredients and
+        extra_models on alias a chunk per transaction.
+
+        Raw deletes skip the collector and the signals, which would record
+        tombstones, recount, bump the data version and update the similarity
+        index for a user in the middle of a move. Image files are left
+        alone, as the copies point to them.
+        """
+        for model in (Recipe, Tag, Ingredient) + extra_models:
+            while True:
+                with transaction.atomic(using=alias):
+                    ids = list(
+                        model.objects.using(alias).filter(user=user)
+                        .order_by('id').values_list('id', flat=True)
+                        [:self.batch_size]
+                    )
+                    if not ids:
+                        break
+                    if model is Recipe:
+                        for through in (Recipe.tags.through,
+                                        Recipe.ingredients.through):
+                            delete_ids(through, alias, 'recipe_id', ids)
+                    delete_ids(model, alias, 'id', ids)
+
+    def _copy_rows(self, model, fields, user, source, target):
+        """Copy the user's rows of model and return {old id: new id}"""
+        rows = model.objects.using(source).filter(user=user) \
+            .order_by('id').values_list('id', *fields)
+        ids = {}
+        batch = []
+        for row in rows.iterator(chunk_size=self.batch_size):
+            obj = model(user=user, **dict(zip(fields, row[1:])))
+            batch.append((row[0], obj))
+            if len(batch) == self.batch_size:
+                ids.update(self._insert(model, batch, target))
+                batch = []
+        if batch:
+            ids.update(self._insert(model, batch, target))
+        return ids
+
+    def _insert(self, model, batch, target):
+        """Insert a batch of (old id, obj) pairs and map them to new ids"""
+        objs = [obj for _, obj in batch]
+        if connections[target].features.can_return_rows_from_bulk_insert:
+            model.objects.using(target).bulk_create(objs)
+        else:
+            for obj in objs:
+                obj.save(using=target)
+        return {old_id: obj.id for old_id, obj in batch}
+
+    def _copy_links(self, through, column, attr_ids, recipe_ids, user,
+                    source, target):
+        """Copy the recipe through rows, translating both ids"""
+        links = through.objects.using(source) \
+            .filter(recipe__user=user) \
+            .values_list('recipe_id', column)
+        through.objects.using(target).bulk_create(
+            (through(recipe_id=recipe_ids[recipe_id],
+                     **{column: attr_ids[attr_id]})
+             for recipe_id, attr_id in links.iterator()),
+            batch_size=self.batch_size
+        )
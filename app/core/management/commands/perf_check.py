@@ -0,0 +1,34 @@
+from django.core import checks
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    """Django command to audit the settings for throughput and memory"""
+    help = 'Check the active settings for options known to hurt ' \
+           'throughput or memory use'
+    requires_system_checks = False
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fail-on-warning', action='store_true',
+            help='Exit with an error on warnings too'
+        )
+
+    def handle(self, *args, **options):
+        messages = checks.run_checks(
+            tags=['performance'], include_deployment_checks=True
+        )
+        fail_level = checks.WARNING if options['fail_on_warning'] \
+            else checks.ERROR
+
+        for message in messages:
+            style = self.style.ERROR if message.is_serious() \
+                else self.style.WARNING
+            self.stdout.write(style(str(message)))
+
+        failed = [m for m in messages if m.level >= fail_level]
+        if failed:
+            raise CommandError(f'{len(failed)} performance issue(s) found')
+        self.stdout.write(self.style.SUCCESS(
+            f'Performance check passed with {len(messages)} warning(s)'
+        ))
@@ -0,0 +1,81 @@
+import json
+import os
+import subprocess
+import sys
+from statistics import median
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+PHASES = ('import', 'models', 'ready')
+STAGES = ('settings', 'setup', 'middleware', 'urlconf')
+
+
+class Command(BaseCommand):
+    """Django command to time a cold start, per installed app"""
+    help = 'Report the import and app registry time of each installed app ' \
+           'in a fresh process'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--runs', type=int, default=3,
+            help='Number of fresh processes measured; medians are reported'
+        )
+        parser.add_argument(
+            '--json', action='store_true',
+            help='Print the medians as JSON'
+        )
+
+    def handle(self, *args, **options):
+        runs = [self._measure() for _ in range(max(options['runs'], 1))]
+        report = {
+            'apps': {
+                label: {
+                    phase: median(run['apps'].get(label, {}).get(phase, 0)
+                                  for run in runs)
+                    for phase in PHASES
+                }
+                for label in runs[0]['apps']
+            },
+        }
+        report.update({
+            stage: median(run[stage] for run in runs) for stage in STAGES
+        })
+
+        if options['json']:
+            self.stdout.write(json.dumps(report))
+        else:
+            self._print(report)
+
+    def _measure(self):
+        """Time a cold start in a new interpreter"""
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        env.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
+        result = subprocess.run(
+            [sys.executable, '-m', 'core.startup'],
+            cwd=settings.BASE_DIR, env=env,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        if result.returncode:
+            raise CommandError(result.stderr.decode(errors='replace'))
+        return json.loads(result.stdout.decode().splitlines()[-1])
+
+    def _print(self, report):
+        self.stdout.write(f'{"app":24}' + ''.join(
+            f'{phase + " ms":>12}' for phase in PHASES + ('total',)
+        ))
+        apps = sorted(report['apps'].items(),
+                      key=lambda item: -sum(item[1].values()))
+        for label, phases in apps:
+            values = [phases[phase] for phase in PHASES]
+            self.stdout.write(f'{label:24}' + ''.join(
+                f'{value * 1000:>12.1f}' for value in values + [sum(values)]
+            ))
+
+        self.stdout.write('')
+        for stage in STAGES:
+            self.stdout.write(f'{stage:24}{report[stage] * 1000:>12.1f}')
+        total = sum(report[stage] for stage in STAGES)
+        self.stdout.write(self.style.SUCCESS(
+            f'{"cold start":24}{total * 1000:>12.1f}'
+        ))
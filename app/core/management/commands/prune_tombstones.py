@@ -0,0 +1,22 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import Tombstone
+
+
+class Command(BaseCommand):
+    """Django command to delete tombstones older than the sync window"""
+    help = 'Delete the tombstones older than SYNC_TOMBSTONE_DAYS on every ' \
+           'shard'
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=settings.SYNC_TOMBSTONE_DAYS)
+        # Cursors older than the cutoff get a full resync, so these are no
+        # longer read
+        for alias in settings.SHARD_DATABASES:
+            deleted, _ = Tombstone.objects.using(alias) \
+                .filter(deleted_at__lt=cutoff).delete()
+            self.stdout.write(f'{alias}: deleted {deleted} tombstone(s)')
@@ -0,0 +1,90 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.models import Tag, Ingredient, Recipe, Tombstone
+from core.utils import delete_ids
+
+
+class Command(BaseCommand):
+    """Django command to delete closed accounts and their data"""
+    help = 'Purge the data of closed accounts in bounded, committed chunks ' \
+           'and then the accounts. Safe to stop and run again.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', help='Email of the one closed account to purge'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Number of rows deleted per transaction'
+        )
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        users = get_user_model().objects \
+            .filter(deleted_at__isnull=False, is_active=False) \
+            .order_by('deleted_at')
+        if options['user']:
+            users = users.filter(email=options['user'])
+
+        purged = 0
+        for user in users:
+            self._purge(user)
+            purged += 1
+        self.stdout.write(self.style.SUCCESS(f'Purged {purged} account(s)'))
+
+    def _purge(self, user):
+        self.stdout.write(f'Purging {user.email} from {user.shard}')
+        recipes, images = self._purge_recipes(user)
+        self.stdout.write(f'  {recipes} recipe(s), {images} image(s)')
+        for model in (Tag, Ingredient, Tombstone):
+            count = self._purge_rows(model, user)
+            self.stdout.write(
+                f'  {count} {model._meta.verbose_name_plural}'
+            )
+        # Only small rows like the auth token are left to cascade
+        user.delete()
+
+    def _purge_recipes(self, user):
+        """Delete the user's recipes, their links and images, a chunk per
+        transaction, and return how many recipes and images went"""
+        alias = user.shard
+        storage = Recipe._meta.get_field('image').storage
+        recipes = images = 0
+        while True:
+            rows = list(
+                Recipe.objects.using(alias).filter(user=user)
+                .order_by('id').values_list('id', 'image')[:self.batch_size]
+            )
+            if not rows:
+                return recipes, images
+
+            # Files go first: if the rows' deletion then fails, a rerun
+            # finds the same rows and their files already gone
+            for _, image in rows:
+                if image:
+                    storage.delete(image)
+                    images += 1
+            ids = [pk for pk, _ in rows]
+            with transaction.atomic(using=alias):
+                for through in (Recipe.tags.through,
+                                Recipe.ingredients.through):
+                    delete_ids(through, alias, 'recipe_id', ids)
+                recipes += delete_ids(Recipe, alias, 'id', ids)
+            self.stdout.write(f'  ... {recipes} recipe(s) deleted')
+
+    def _purge_rows(self, model, user):
+        """Delete the user's rows of model a chunk per transaction"""
+        alias = user.shard
+        deleted = 0
+        while True:
+            with transaction.atomic(using=alias):
+                ids = list(
+                    model.objects.using(alias).filter(user=user)
+                    .order_by('id').values_list('id', flat=True)
+                    [:self.batch_size]
+                )
+                if not ids:
+                    return deleted
+                deleted += delete_ids(model, alias, 'id', ids)
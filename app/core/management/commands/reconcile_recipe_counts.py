@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.models import Tag, Ingredient, Recipe
+from core.utils import reconcile_recipe_counts
+
+
+class Command(BaseCommand):
+    """Django command to repair drifted tag and ingredient usage counters"""
+    help = 'Recompute Tag and Ingredient recipe_count from the through tables'
+
+    def handle(self, *args, **options):
+        targets = (
+            (Tag, Recipe.tags.through, 'tag_id'),
+            (Ingredient, Recipe.ingredients.through, 'ingredient_id'),
+        )
+        for alias in settings.SHARD_DATABASES:
+            for model, through, column in targets:
+                fixed = reconcile_recipe_counts(model, through, column, alias)
+                self.stdout.write(self.style.SUCCESS(
+                    f'{alias}: fixed {fixed} '
+                    f'{model._meta.verbose_name_plural}'
+                ))
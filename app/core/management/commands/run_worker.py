@@ -0,0 +1,135 @@
+import os
+import signal
+import socket
+import threading
+import time
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from core import jobs
+
+
+class Command(BaseCommand):
+    """Django command to run the queued background jobs"""
+    help = 'Run the jobs queued in the database, retrying failures with ' \
+           'backoff, and report timings per task on exit'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=1,
+            help='Number of jobs run at once, each in its own thread'
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help='Seconds to wait when no job is due'
+        )
+        parser.add_argument(
+            '--burst', action='store_true',
+            help='Exit once no job is due instead of waiting for more'
+        )
+        parser.add_argument(
+            '--max-jobs', type=int, default=0,
+            help='Exit after running this many jobs; 0 for no limit'
+        )
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.worker = f'{socket.gethostname()}:{os.getpid()}'
+        self.stopping = threading.Event()
+        self.lock = threading.Lock()
+        self.started = 0
+        self.stats = defaultdict(lambda: {
+            'done': 0, 'retried': 0, 'failed': 0,
+            'seconds': 0.0, 'max': 0.0, 'waited': 0.0,
+        })
+
+        previous = signal.signal(signal.SIGTERM,
+                                 lambda *args: self.stopping.set())
+        self.stdout.write(f'Worker {self.worker} started')
+        try:
+            if options['concurrency'] <= 1:
+                self._work()
+            else:
+                threads = [
+                    threading.Thread(target=self._work_in_thread)
+                    for _ in range(options['concurrency'])
+                ]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+        except KeyboardInterrupt:
+            self.stopping.set()
+        finally:
+            signal.signal(signal.SIGTERM, previous)
+        self._report()
+
+    def _work_in_thread(self):
+        try:
+            self._work()
+        finally:
+            # Each thread has its own connections
+            connections.close_all()
+
+    def _next_job(self):
+        """Claim a due job, or return None once the worker should exit"""
+        while not self.stopping.is_set():
+            with self.lock:
+                if self.options['max_jobs'] and \
+                        self.started >= self.options['max_jobs']:
+                    return None
+                claimed = jobs.claim(self.worker)
+                if claimed:
+                    self.started += 1
+                    return claimed[0]
+                # Idle, so look for jobs whose worker died
+                if jobs.requeue_stale():
+                    continue
+            if self.options['burst']:
+                return None
+            self.stopping.wait(self.options['poll_interval'])
+        return None
+
+    def _work(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            # How long the job was due before a worker picked it up
+            waited = (job.started_at - job.run_at).total_seconds()
+            start = time.perf_counter()
+            succeeded = jobs.run_job(job)
+            self._record(job, succeeded, time.perf_counter() - start, waited)
+
+    def _record(self, job, succeeded, seconds, waited):
+        if succeeded:
+            outcome = 'done'
+        elif job.status == job.FAILED:
+            outcome = 'failed'
+        else:
+            outcome = 'retried'
+        with self.lock:
+            stats = self.stats[job.task]
+            stats[outcome] += 1
+            stats['seconds'] += seconds
+            stats['max'] = max(stats['max'], seconds)
+            stats['waited'] += waited
+        if self.options['verbosity'] > 1:
+            self.stdout.write(f'{job}: {outcome} in {seconds * 1000:.1f} ms')
+
+    def _report(self):
+        self.stdout.write(
+            f'{"task":30}{"done":>8}{"retried":>8}{"failed":>8}'
+            f'{"mean ms":>10}{"max ms":>10}{"wait ms":>10}'
+        )
+        for name, stats in sorted(self.stats.items()):
+            runs = stats['done'] + stats['retried'] + stats['failed']
+            self.stdout.write(
+                f'{name:30}{stats["done"]:>8}{stats["retried"]:>8}'
+                f'{stats["failed"]:>8}'
+                f'{stats["seconds"] * 1000 / runs:>10.1f}'
+                f'{stats["max"] * 1000:>10.1f}'
+                f'{stats["waited"] * 1000 / runs:>10.1f}'
+            )
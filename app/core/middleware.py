@@ -0,0 +1,148 @@
+import re
+import zlib
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+re_coding = re.compile(r'^\s*([\w*-]+)\s*(?:;\s*q=([0-9.]+))?\s*$')
+
+# Bodies are fed to the compressor in chunks of this size when streamed
+CHUNK_SIZE = 64 * 1024
+
+# Media types worth compressing besides text/*. Images and other media are
+# compressed already.
+COMPRESSIBLE_TYPES = {
+    'application/json', 'application/javascript', 'application/xml',
+    'image/svg+xml',
+}
+
+
+def compressible(content_type):
+    """Return whether a Content-Type is worth compressing"""
+    media_type = content_type.split(';')[0].strip().lower()
+    return media_type.startswith('text/') or \
+        media_type in COMPRESSIBLE_TYPES or media_type.endswith('+json')
+
+
+def accepted_encoding(header):
+    """Pick the best encoding we support from an Accept-Encoding header,
+    preferring brotli over gzip when the client likes both as much"""
+    weights = {}
+    for part in header.split(','):
+        match = re_coding.match(part)
+        if match:
+            coding, q = match.groups()
+            try:
+                weights[coding.lower()] = float(q) if q else 1.0
+            except ValueError:
+                continue
+
+    available = ('br', 'gzip') if brotli is not None else ('gzip',)
+    best, best_q = None, 0
+    for coding in available:
+        q = weights.get(coding, weights.get('*', 0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def _compressor(coding):
+    """Return (compress, flush) callables of a new compressor"""
+    if coding == 'br':
+        compressor = brotli.Compressor(
+            quality=settings.COMPRESSION_BROTLI_QUALITY
+        )
+        return compressor.process, compressor.finish
+    # wbits 31 writes a gzip header and trailer
+    compressor = zlib.compressobj(settings.COMPRESSION_GZIP_LEVEL,
+                                  zlib.DEFLATED, 31)
+    return compressor.compress, compressor.flush
+
+
+def compress_chunks(chunks, coding):
+    """Compress an iterable of bytes lazily, yielding compressed chunks"""
+    compress, flush = _compressor(coding)
+    for chunk in chunks:
+        data = compress(chunk)
+        if data:
+            yield data
+    yield flush()
+
+
+def _split(content):
+    for start in range(0, len(content), CHUNK_SIZE):
+        yield content[start:start + CHUNK_SIZE]
+
+
+class CompressionMiddleware:
+    """Compress responses with brotli or gzip as the client negotiates.
+
+    Only text and JSON like content types are compressed, and never pages
+    carrying a CSRF token: compressing the token along with input
+    reflected from the request leaks it through the size (BREACH).
+    Bodies under COMPRESSION_MIN_SIZE are sent as they are. Streaming
+    responses, and bodies of COMPRESSION_STREAM_MIN_SIZE or more, are
+    compressed chunk by chunk while being sent so the first bytes go out
+    before the whole body is compressed.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        if response.has_header('Content-Encoding') or \
+                not compressible(response.get('Content-Type', '')) or \
+                request.META.get('CSRF_COOKIE_USED'):
+            return response
+        if not response.streaming and \
+                len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        coding = accepted_encoding(
+            request.META.get('HTTP_ACCEPT_ENCODING', '')
+        )
+        if coding is None:
+            return response
+
+        if response.streaming:
+            response.streaming_content = compress_chunks(
+                response.streaming_content, coding
+            )
+            del response['Content-Length']
+        elif len(response.content) >= settings.COMPRESSION_STREAM_MIN_SIZE:
+            response = self._stream(response, coding)
+        else:
+            compress, flush = _compressor(coding)
+            content = compress(response.content) + flush()
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response['Content-Length'] = str(len(content))
+
+        # A strong ETag can't describe the compressed bytes (RFC 7232 2.1)
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = coding
+        return response
+
+    def _stream(self, response, coding):
+        """Turn a large response into a streaming one compressing its body"""
+        streaming = StreamingHttpResponse(
+            compress_chunks(_split(response.content), coding),
+            status=response.status_code
+        )
+        for header, value in response.items():
+            if header.lower() != 'content-length':
+                streaming[header] = value
+        streaming.cookies = response.cookies
+        return streaming
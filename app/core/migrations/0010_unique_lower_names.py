@@ -0,0 +1,68 @@
+from django.db import migrations
+from django.db.models import Count, Min
+from django.db.models.functions import Lower
+
+import core.models
+
+
+# Frozen copy of core.utils.merge_duplicate_names as of this migration, so
+# later changes to the helper don't change what the migration does
+def merge_duplicate_names(model, through, column, using):
+    groups = (
+        model.objects.using(using)
+        .annotate(lower_name=Lower('name'))
+        .values('user_id', 'lower_name')
+        .annotate(count=Count('id'), keep_id=Min('id'))
+        .filter(count__gt=1)
+        .order_by('user_id', 'lower_name')
+    )
+    for group in groups:
+        duplicate_ids = list(
+            model.objects.using(using)
+            .annotate(lower_name=Lower('name'))
+            .filter(user_id=group['user_id'], lower_name=group['lower_name'])
+            .exclude(id=group['keep_id'])
+            .values_list('id', flat=True)
+        )
+        links = through.objects.using(using) \
+            .filter(**{f'{column}__in': duplicate_ids})
+        recipe_ids = links.values_list('recipe_id', flat=True).distinct()
+        through.objects.using(using).bulk_create(
+            [through(recipe_id=recipe_id, **{column: group['keep_id']})
+             for recipe_id in recipe_ids],
+            ignore_conflicts=True
+        )
+        links.delete()
+        model.objects.using(using).filter(id__in=duplicate_ids).delete()
+
+
+def merge_duplicates(apps, schema_editor):
+    """Fold existing duplicates so the unique indexes can be built"""
+    Recipe = apps.get_model('core', 'Recipe')
+    merge_duplicate_names(
+        apps.get_model('core', 'Tag'), Recipe.tags.through, 'tag_id',
+        schema_editor.connection.alias
+    )
+    merge_duplicate_names(
+        apps.get_model('core', 'Ingredient'), Recipe.ingredients.through,
+        'ingredient_id', schema_editor.connection.alias
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='tag',
+            index=core.models.UserLowerNameIndex(name='core_tag_user_lower_name_uniq'),
+        ),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=core.models.UserLowerNameIndex(name='core_ingr_user_lower_name_uniq'),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 3.0.14 on 2026-10-19 09:23
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+# Frozen copy of core.utils.reconcile_recipe_counts as of this migration,
+# so later changes to the helper don't change what the migration does. Every
+# count starts at 0 here, so all rows are set rather than only drifted ones.
+def reconcile_recipe_counts(model, through, column, using):
+    counts = Subquery(
+        through.objects.using(using)
+        .filter(**{column: OuterRef('pk')})
+        .order_by()
+        .values(column)
+        .annotate(count=Count('*'))
+        .values('count')
+    )
+    model.objects.using(using).update(recipe_count=Coalesce(counts, 0))
+
+
+def populate_recipe_counts(apps, schema_editor):
+    """Count the existing recipe links of every tag and ingredient"""
+    Recipe = apps.get_model('core', 'Recipe')
+    reconcile_recipe_counts(
+        apps.get_model('core', 'Tag'), Recipe.tags.through, 'tag_id',
+        schema_editor.connection.alias
+    )
+    reconcile_recipe_counts(
+        apps.get_model('core', 'Ingredient'), Recipe.ingredients.through,
+        'ingredient_id', schema_editor.connection.alias
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_unique_lower_names'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='recipe_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='recipe_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_recipe_counts,
+                             migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['user', '-recipe_count'], name='core_ingr_user_count_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['user', '-recipe_count'], name='core_tag_user_count_idx'),
+        ),
+    ]
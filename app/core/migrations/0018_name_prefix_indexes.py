@@ -0,0 +1,22 @@
+# Generated by Django 3.0.14 on 2026-10-19 09:58
+
+import core.models
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_recipe_ordering_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=core.models.UserLowerNamePrefixIndex(name='core_ingr_user_name_prefix_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=core.models.UserLowerNamePrefixIndex(name='core_tag_user_name_prefix_idx'),
+        ),
+    ]
@@ -1,9 +1,15 @@
 import uuid
 import os
-from django.db import models
+from django.db import models, connections, transaction, router, \
+    IntegrityError
+from django.db.backends.ddl_references import Statement, Table
+from django.db.models.signals import post_save
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager,\
                                     PermissionsMixin
 from django.conf import settings
+from django.utils import timezone
+
+from core.shards import assign_shard
 
 
 def recipe_image_file_path(instance, filename):
@@ -23,7 +29,9 @@ class UserManager(BaseUserManager):
         """Creates and saves a new user"""
         if not email:
             raise ValueError('Users must have an email address')
-        user = self.model(email=self.normalize_email(email), **extra_fields)
+        email = self.normalize_email(email)
+        extra_fields.setdefault('shard', assign_shard(email))
+        user = self.model(email=email, **extra_fields)
         user.set_password(password)
         user.save(using=self._db)
 
@@ -45,21 +53,160 @@ class User(AbstractBaseUser, PermissionsMixin):
     name = models.CharField(max_length=255)
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    # Database alias holding the user's recipes, tags and ingredients
+    shard = models.CharField(max_length=64, default='default')
+    # Bumped on every change to the user's recipe data, see core.versions
+    data_version = models.BigIntegerField(default=0)
+    # Set when the account is closed; purge_deleted_users then removes the
+    # user's data in chunks and finally the user
+    deleted_at = models.DateTimeField(null=True, blank=True)
     # Overeriting objects and USERNAME_FIELD
     objects = UserManager()
 
     USERNAME_FIELD = 'email'
 
 
+class UserLowerNameIndex(models.Index):
+    """Unique index on (user_id, lower(name)).
+
+    Functional indexes can't be declared in Meta before Django 4.0, so the
+    SQL is written here. Declaring it as an Index keeps it in the migration
+    state, which SQLite needs to rebuild it when a table is remade.
+    """
+
+    def __init__(self, name):
+        super().__init__(fields=['user', 'name'], name=name)
+
+    def create_sql(self, model, schema_editor, using='', **kwargs):
+        quote_name = schema_editor.quote_name
+        return Statement(
+            'CREATE UNIQUE INDEX %(name)s ON %(table)s '
+            '(%(user)s, lower(%(col)s))',
+            name=quote_name(self.name),
+            table=Table(model._meta.db_table, quote_name),
+            user=quote_name(model._meta.get_field('user').column),
+            col=quote_name(model._meta.get_field('name').column),
+        )
+
+    def deconstruct(self):
+        path, args, kwargs = super().deconstruct()
+        return path, args, {'name': self.name}
+
+
+class UserLowerNamePrefixIndex(UserLowerNameIndex):
+    """Index on (user_id, lower(name)) for prefix searches.
+
+    The unique index compares with the database collation, which can't
+    serve LIKE 'prefix%' on PostgreSQL; text_pattern_ops compares by
+    character and can.
+    """
+
+    def create_sql(self, model, schema_editor, using='', **kwargs):
+        quote_name = schema_editor.quote_name
+        opclass = ' text_pattern_ops' \
+            if schema_editor.connection.vendor == 'postgresql' else ''
+        return Statement(
+            'CREATE INDEX %(name)s ON %(table)s '
+            '(%(user)s, lower(%(col)s)%(opclass)s)',
+            name=quote_name(self.name),
+            table=Table(model._meta.db_table, quote_name),
+            user=quote_name(model._meta.get_field('user').column),
+            col=quote_name(model._meta.get_field('name').column),
+            opclass=opclass,
+        )
+
+
+class ShardedManager(models.Manager):
+    """Manager for the models stored on their user's shard"""
+
+    def for_user(self, user):
+        """Return the user's objects, read from the user's shard"""
+        return self.db_manager(user.shard).filter(user=user)
+
+
+class RecipeAttrManager(ShardedManager):
+    """Manager for the user owned, uniquely named recipe attributes"""
+
+    def get_or_create_by_name(self, user, name):
+        """Return (obj, created) for the user's obj named name, ignoring
+        case, creating it if needed"""
+        db = self._db or router.db_for_write(self.model, **self._hints)
+        connection = connections[db]
+        if connection.vendor == 'postgresql':
+            return self._upsert(connection, user, name)
+
+        try:
+            with transaction.atomic(using=db):
+                return self.db_manager(db).create(user=user, name=name), True
+        except IntegrityError:
+            return self.db_manager(db).get(user=user, name__iexact=name), \
+                False
+
+    def _upsert(self, connection, user, name):
+        """Insert or fetch the row in a single round trip. The no-op update
+        makes RETURNING yield the existing row on conflict, and xmax is only
+        zero for freshly inserted rows."""
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        sql = (
+            f'INSERT INTO {table} '
+            f'(name, user_id, recipe_count, created_at, updated_at) '
+            f'VALUES (%s, %s, 0, %s, %s) '
+            f'ON CONFLICT (user_id, lower(name)) '
+            f'DO UPDATE SET name = {table}.name '
+            f'RETURNING id, name, xmax = 0'
+        )
+        now = timezone.now()
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [name, user.pk, now, now])
+            pk, stored_name, created = cursor.fetchone()
+
+        obj = self.model(id=pk, name=stored_name, user=user)
+        obj._state.adding = False
+        obj._state.db = connection.alias
+        if created:
+            # The raw insert bypasses save(), so tell the receivers
+            post_save.send(sender=self.model, instance=obj, created=True,
+                           update_fields=None, raw=False,
+                           using=connection.alias)
+        return obj, created
+
+
 class Tag(models.Model):
     """Tags to be used for a recipe"""
     name = models.CharField(max_length=255)
     # Instead of referencing User directly, set the 1st arg (model) by settings
+    # No db constraint: users live on the default database, while their
+    # recipe data may be on another shard
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
-        on_delete=models.CASCADE
+        on_delete=models.CASCADE,
+        db_constraint=False
     )
 
+    # Names are unique per user regardless of case, see UserLowerNameIndex
+    objects = RecipeAttrManager()
+
+    # Number of recipes using the tag, kept in sync by core.signals
+    recipe_count = models.PositiveIntegerField(default=0)
+
+    # Change tracking for the sync endpoint
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # Matches BaseRecipeAttrViewSet.get_queryset: filter user, order -name
+        # or by usage
+        indexes = [
+            models.Index(fields=['user', '-name'],
+                         name='core_tag_user_name_idx'),
+            models.Index(fields=['user', '-recipe_count'],
+                         name='core_tag_user_count_idx'),
+            UserLowerNameIndex(name='core_tag_user_lower_name_uniq'),
+            models.Index(fields=['user', 'updated_at'],
+                         name='core_tag_user_updated_idx'),
+            UserLowerNamePrefixIndex(name='core_tag_user_name_prefix_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -69,9 +216,31 @@ class Ingredient(models.Model):
     name = models.CharField(max_length=255)
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
-        on_delete=models.CASCADE
+        on_delete=models.CASCADE,
+        db_constraint=False
     )
 
+    objects = RecipeAttrManager()
+
+    recipe_count = models.PositiveIntegerField(default=0)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-name'],
+                         name='core_ingr_user_name_idx'),
+            models.Index(fields=['user', '-recipe_count'],
+                         name='core_ingr_user_count_idx'),
+            UserLowerNameIndex(name='core_ingr_user_lower_name_uniq'),
+            models.Index(fields=['user', 'updated_at'],
+                         name='core_ingr_user_updated_idx'),
+            UserLowerNamePrefixIndex(
+                name='core_ingr_user_name_prefix_idx'
+            ),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -80,7 +249,8 @@ class Recipe(models.Model):
     """Recipe object"""
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
-        on_delete=models.CASCADE
+        on_delete=models.CASCADE,
+        db_constraint=False
     )
     title = models.CharField(max_length=255)
     time_minutes = models.IntegerField()
@@ -91,5 +261,92 @@ class Recipe(models.Model):
     tags = models.ManyToManyField('tag')
     image = models.ImageField(null=True, upload_to=recipe_image_file_path)
 
+    # Also bumped when the recipe's tags or ingredients change, see
+    # core.signals
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ShardedManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id'],
+                         name='core_recipe_user_id_idx'),
+            models.Index(fields=['user', 'updated_at'],
+                         name='core_recipe_user_updated_idx'),
+            # The orderings of the recipe list, see RecipeViewSet
+            models.Index(fields=['user', 'title', 'id'],
+                         name='core_recipe_user_title_idx'),
+            models.Index(fields=['user', 'time_minutes', 'id'],
+                         name='core_recipe_user_time_idx'),
+            models.Index(fields=['user', 'price', 'id'],
+                         name='core_recipe_user_price_idx'),
+        ]
+
     def __str__(self):
         return self.title
+
+
+class Tombstone(models.Model):
+    """Record of a deleted tag, ingredient or recipe, so syncing clients
+    learn about the deletion"""
+    TAG = 'tag'
+    INGREDIENT = 'ingredient'
+    RECIPE = 'recipe'
+    KINDS = ((TAG, 'Tag'), (INGREDIENT, 'Ingredient'), (RECIPE, 'Recipe'))
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        db_constraint=False
+    )
+    kind = models.CharField(max_length=16, choices=KINDS)
+    object_id = models.IntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    objects = ShardedManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'deleted_at'],
+                         name='core_tomb_user_deleted_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} {self.object_id}'
+
+
+class Job(models.Model):
+    """Unit of work for the background worker, see core.jobs"""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = ((QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'),
+                (FAILED, 'Failed'))
+
+    task = models.CharField(max_length=255)
+    # JSON encoded {"args": [...], "kwargs": {...}}
+    payload = models.TextField(default='{}')
+    status = models.CharField(max_length=16, choices=STATUSES,
+                              default=QUEUED)
+    # Not run before; pushed back when a failed attempt is retried
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    locked_by = models.CharField(max_length=255, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Renewed by the worker while the job runs; see core.jobs.Heartbeat
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_at'],
+                         name='core_job_status_run_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.task} #{self.pk}'
@@ -0,0 +1,185 @@
+"""Opt-in profiling of single requests.
+
+A request is profiled when a staff user sends the X-Profile header with
+their token, or when it falls in the PROFILING_SAMPLE_RATE sample. Its
+cProfile stats and SQL timeline are written to PROFILING_DIR, which keeps
+the PROFILING_MAX_FILES most recent profiles; GET /api/profiles/ lists
+them. With PROFILING_DIR unset the middleware is left out entirely.
+"""
+import cProfile
+import json
+import os
+import pstats
+import random
+import re
+import time
+import uuid
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils import timezone
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+# Functions kept in the summary of a profile, by cumulative time
+TOP_FUNCTIONS = 40
+
+re_name = re.compile(r'^\d+-[0-9a-f]{8}$')
+
+
+class SQLTimeline:
+    """Database execute wrapper recording when each query ran"""
+
+    def __init__(self, alias, start):
+        self.alias, self.start = alias, start
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        began = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            ended = time.perf_counter()
+            self.queries.append({
+                'db': self.alias,
+                'start_ms': (began - self.start) * 1000,
+                'duration_ms': (ended - began) * 1000,
+                'sql': sql,
+            })
+
+
+def top_functions(profiler, limit=TOP_FUNCTIONS):
+    """Return the functions taking the most cumulative time"""
+    stats = pstats.Stats(profiler).stats
+    rows = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)
+    return [
+        {
+            'function': f'{filename}:{line}({name})',
+            'calls': calls,
+            'tottime_ms': tottime * 1000,
+            'cumtime_ms': cumtime * 1000,
+        }
+        for (filename, line, name), (_, calls, tottime, cumtime, _)
+        in rows[:limit]
+    ]
+
+
+def profile_path(name, extension):
+    return os.path.join(settings.PROFILING_DIR, f'{name}.{extension}')
+
+
+def list_profiles():
+    """Return the names of the stored profiles, newest first"""
+    try:
+        files = os.listdir(settings.PROFILING_DIR)
+    except FileNotFoundError:
+        return []
+    return sorted(
+        (name[:-5] for name in files
+         if name.endswith('.json') and re_name.match(name[:-5])),
+        reverse=True
+    )
+
+
+def read_profile(name):
+    """Return a stored profile, or None if there is no such profile"""
+    if not re_name.match(name):
+        return None
+    try:
+        with open(profile_path(name, 'json')) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_profile(profiler, summary):
+    """Write the stats and summary of a profile and drop the oldest ones
+    past PROFILING_MAX_FILES. Returns the profile name."""
+    os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+    # Names sort by time, so the ring needs no shared counter
+    name = f'{time.time_ns()}-{uuid.uuid4().hex[:8]}'
+    profiler.dump_stats(profile_path(name, 'prof'))
+    summary['name'] = name
+    tmp = profile_path(name, 'json.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(summary, f)
+    # Listed only once complete
+    os.replace(tmp, profile_path(name, 'json'))
+
+    for old in list_profiles()[settings.PROFILING_MAX_FILES:]:
+        for extension in ('json', 'prof'):
+            try:
+                os.remove(profile_path(old, extension))
+            except FileNotFoundError:
+                # Pruned by another process
+                pass
+    return name
+
+
+class ProfilingMiddleware:
+    """Profile requests asked for by staff or sampled.
+
+    Requests not profiled cost a header lookup, plus a random() call when
+    sampling is on.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_DIR:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = settings.PROFILING_SAMPLE_RATE
+
+    def __call__(self, request):
+        if 'HTTP_X_PROFILE' in request.META:
+            reason = 'requested' if self._is_staff(request) else None
+        elif self.sample_rate and random.random() < self.sample_rate:
+            reason = 'sampled'
+        else:
+            reason = None
+        if reason is None:
+            return self.get_response(request)
+        return self._profile(request, reason)
+
+    def _is_staff(self, request):
+        # The header arrives before DRF authenticates the request
+        try:
+            found = TokenAuthentication().authenticate(request)
+        except AuthenticationFailed:
+            return False
+        return found is not None and found[0].is_staff
+
+    def _profile(self, request, reason):
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        timelines = [SQLTimeline(alias, start) for alias in connections]
+        with ExitStack() as stack:
+            for timeline in timelines:
+                stack.enter_context(
+                    connections[timeline.alias].execute_wrapper(timeline)
+                )
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        duration = time.perf_counter() - start
+
+        queries = sorted(
+            (query for timeline in timelines for query in timeline.queries),
+            key=lambda query: query['start_ms']
+        )
+        name = save_profile(profiler, {
+            'reason': reason,
+            'created_at': timezone.now().isoformat(),
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'duration_ms': duration * 1000,
+            'sql_ms': sum(query['duration_ms'] for query in queries),
+            'queries': queries,
+            'functions': top_functions(profiler),
+        })
+        response['X-Profile-Id'] = name
+        return response
@@ -0,0 +1,103 @@
+import random
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.permissions import SAFE_METHODS
+
+# Replica serving the reads of the current request, if any. One is picked
+# per request so every read in it sees the same replication state.
+_replica_reads = ContextVar('replica_reads', default=None)
+
+
+def _pick_replica():
+    replicas = settings.REPLICA_DATABASES
+    return random.choice(replicas) if replicas else None
+
+
+def current_replica():
+    """Return the replica the current reads go to, or None"""
+    return _replica_reads.get()
+
+
+@contextmanager
+def replica_reads():
+    """Send the reads made inside the block to a replica"""
+    token = _replica_reads.set(_pick_replica())
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def _pin_key(user):
+    return f'replica-pin:{user.pk}'
+
+
+def pin_to_primary(user):
+    """Read from the primary for a while after user wrote something, so
+    they see their own writes despite replication lag"""
+    cache.set(_pin_key(user), True, settings.REPLICA_STICKY_SECONDS)
+
+
+def is_pinned_to_primary(user):
+    return bool(cache.get(_pin_key(user)))
+
+
+class ReplicaRouter:
+    """Route reads to settings.REPLICA_DATABASES when enabled for the
+    current request, and everything else to the default database"""
+    hits = Counter()
+
+    def db_for_read(self, model, **hints):
+        replica = _replica_reads.get()
+        if replica is not None:
+            self.hits['replica'] += 1
+            return replica
+        self.hits['primary'] += 1
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == 'default'
+
+
+def hit_counts():
+    """Return how many reads this process sent to the primary and replicas"""
+    return {
+        'primary': ReplicaRouter.hits['primary'],
+        'replica': ReplicaRouter.hits['replica'],
+    }
+
+
+class ReplicaReadMixin:
+    """View mixin reading from a replica for safe methods, unless the user
+    wrote recently. Unsafe methods pin the user to the primary, except for
+    the viewset actions in read_only_actions, which only read despite
+    their method (e.g. a query too large for a GET)."""
+    read_only_actions = frozenset()
+
+    def initial(self, request, *args, **kwargs):
+        # Authentication happens here, so the user is known afterwards
+        super().initial(request, *args, **kwargs)
+        read_only = request.method in SAFE_METHODS or \
+            getattr(self, 'action', None) in self.read_only_actions
+        if not read_only:
+            pin_to_primary(request.user)
+        elif not is_pinned_to_primary(request.user):
+            self._replica_token = _replica_reads.set(_pick_replica())
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_replica_token', None)
+        if token is not None:
+            _replica_reads.reset(token)
+            self._replica_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -0,0 +1,84 @@
+import zlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+# Shard of the user whose request is being served
+_current_shard = ContextVar('current_shard', default=None)
+
+# Models whose rows live on their owner's shard, including the through
+# tables of Recipe.tags and Recipe.ingredients
+SHARDED_MODELS = {
+    'core.tag', 'core.ingredient', 'core.recipe',
+    'core.recipe_tags', 'core.recipe_ingredients', 'core.tombstone',
+}
+
+
+def is_sharded(model):
+    return model._meta.label_lower in SHARDED_MODELS
+
+
+def assign_shard(email):
+    """Pick the shard a new user's recipe data is placed on"""
+    shards = settings.NEW_USER_SHARDS
+    return shards[zlib.crc32(email.lower().encode()) % len(shards)]
+
+
+@contextmanager
+def use_shard(alias):
+    """Route the sharded queries made inside the block to alias"""
+    token = _current_shard.set(alias)
+    try:
+        yield
+    finally:
+        _current_shard.reset(token)
+
+
+class ShardRouter:
+    """Route recipe data to the shard of the user it belongs to.
+
+    The shard comes from the instance the query is about or, failing that,
+    from the current request (see ShardedViewMixin). Queries on the default
+    shard, and on every other model, are left to the next router.
+    """
+
+    def _shard_for(self, model, hints):
+        if not is_sharded(model):
+            return None
+        instance = hints.get('instance')
+        if instance is not None and \
+                instance._state.db in settings.SHARD_DATABASES:
+            alias = instance._state.db
+        else:
+            alias = _current_shard.get()
+        return None if alias == 'default' else alias
+
+    def db_for_read(self, model, **hints):
+        return self._shard_for(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._shard_for(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        if db in settings.SHARD_DATABASES:
+            return True
+        return None
+
+
+class ShardedViewMixin:
+    """View mixin routing the request's recipe queries to the user's shard"""
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self._shard_token = _current_shard.set(request.user.shard)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_shard_token', None)
+        if token is not None:
+            _current_shard.reset(token)
+            self._shard_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
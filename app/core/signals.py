@@ -0,0 +1,150 @@
+from contextvars import ContextVar
+
+from django.db.models import F
+from django.db.models.signals import m2m_changed, pre_delete, post_delete, \
+    post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from core.models import User, Tag, Ingredient, Recipe, Tombstone
+from core.versions import bump_data_version
+
+# Ids of the users being deleted, whose data needs no tombstones
+_deleting_users = ContextVar('deleting_users', default=frozenset())
+
+# Through model -> (counted model, its column on the through table)
+COUNTED_RELATIONS = {
+    Recipe.tags.through: (Tag, 'tag_id'),
+    Recipe.ingredients.through: (Ingredient, 'ingredient_id'),
+}
+
+
+def _bump(model, using, delta, **filters):
+    """Add delta to recipe_count of the rows matching filters in place"""
+    model.objects.using(using).filter(**filters) \
+        .update(recipe_count=F('recipe_count') + delta)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def update_recipe_count(sender, instance, action, reverse, pk_set, using,
+                        **kwargs):
+    """Keep Tag/Ingredient.recipe_count in step with the through rows.
+
+    Forward changes (recipe.tags.add(...)) come with the tag ids, reverse
+    ones (tag.recipe_set.add(...)) with the recipe ids.
+    """
+    counted, column = COUNTED_RELATIONS[sender]
+
+    if action == 'post_add' and pk_set:
+        # Django only reports the ids that were actually added
+        if reverse:
+            _bump(counted, using, len(pk_set), pk=instance.pk)
+        else:
+            _bump(counted, using, 1, pk__in=pk_set)
+
+    elif action in ('pre_remove', 'pre_clear'):
+        # remove() reports the requested ids, so count the existing links
+        if reverse:
+            links = sender.objects.using(using).filter(**{column: instance.pk})
+            if pk_set is not None:
+                links = links.filter(recipe_id__in=pk_set)
+            _bump(counted, using, -links.count(), pk=instance.pk)
+        else:
+            links = sender.objects.using(using).filter(recipe_id=instance.pk)
+            if pk_set is not None:
+                links = links.filter(**{f'{column}__in': pk_set})
+            _bump(counted, using, -1, pk__in=links.values(column))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def touch_relinked_recipes(sender, instance, action, reverse, pk_set, using,
+                           **kwargs):
+    """Bump updated_at of recipes whose tags or ingredients changed, so
+    the sync endpoint sends them again"""
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            instance.updated_at = timezone.now()
+            Recipe.objects.using(using).filter(pk=instance.pk) \
+                .update(updated_at=instance.updated_at)
+    elif action in ('post_add', 'post_remove') and pk_set:
+        Recipe.objects.using(using).filter(pk__in=pk_set) \
+            .update(updated_at=timezone.now())
+    elif action == 'pre_clear':
+        _touch_linked_recipes(sender, COUNTED_RELATIONS[sender][1],
+                              instance, using)
+
+
+def _touch_linked_recipes(through, column, instance, using):
+    links = through.objects.using(using).filter(**{column: instance.pk})
+    Recipe.objects.using(using).filter(pk__in=links.values('recipe_id')) \
+        .update(updated_at=timezone.now())
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def touch_recipes_of_deleted(sender, instance, using, **kwargs):
+    """The cascade drops the links of a deleted tag or ingredient without
+    sending m2m_changed, so bump their recipes here"""
+    for through, (counted, column) in COUNTED_RELATIONS.items():
+        if counted is sender:
+            _touch_linked_recipes(through, column, instance, using)
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_delete, sender=Recipe)
+def record_tombstone(sender, instance, using, **kwargs):
+    """Remember the deletion for the sync endpoint"""
+    if instance.user_id in _deleting_users.get():
+        return
+    Tombstone.objects.using(using).create(
+        user_id=instance.user_id,
+        kind=sender._meta.model_name,
+        object_id=instance.pk,
+    )
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_delete, sender=Recipe)
+def bump_version_on_change(sender, instance, **kwargs):
+    """Invalidate the ETags of the owner's recipe data"""
+    if instance.user_id not in _deleting_users.get():
+        bump_data_version(instance.user_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def bump_version_on_relink(sender, instance, action, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove') and pk_set or \
+            action == 'post_clear':
+        bump_data_version(instance.user_id)
+
+
+@receiver(pre_delete, sender=Recipe)
+def release_recipe_counts(sender, instance, using, **kwargs):
+    """Decrement the counts of everything linked to a deleted recipe, as
+    the cascade removes the through rows without sending m2m_changed"""
+    for through, (counted, column) in COUNTED_RELATIONS.items():
+        links = through.objects.using(using).filter(recipe_id=instance.pk)
+        _bump(counted, using, -1, pk__in=links.values(column))
+
+
+@receiver(pre_delete, sender=User)
+def delete_sharded_data(sender, instance, using, **kwargs):
+    """Delete the user's recipe data kept on another shard, which the
+    cascade on the default database can't reach"""
+    _deleting_users.set(_deleting_users.get() | {instance.pk})
+    if instance.shard != using:
+        for model in (Recipe, Tag, Ingredient, Tombstone):
+            model.objects.for_user(instance).delete()
+
+
+@receiver(post_delete, sender=User)
+def forget_deleted_user(sender, instance, **kwargs):
+    _deleting_users.set(_deleting_users.get() - {instance.pk})
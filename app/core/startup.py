@@ -0,0 +1,78 @@
+"""Measure Django's cold start, per installed app.
+
+Run as `python -m core.startup` in a fresh interpreter, with
+DJANGO_SETTINGS_MODULE set; prints the timings as JSON. Used by the
+profile_startup command, since an already started process can't be
+measured.
+"""
+import json
+import time
+from collections import defaultdict
+
+
+def _timed(timings, label, phase, func, *args):
+    start = time.perf_counter()
+    try:
+        return func(*args)
+    finally:
+        timings[label][phase] += time.perf_counter() - start
+
+
+def measure():
+    """Set Django up with each app registry phase timed per app and return
+    the timings in seconds"""
+    import django
+    from django.apps.config import AppConfig
+    from django.conf import settings
+
+    timings = defaultdict(lambda: defaultdict(float))
+    create = AppConfig.create.__func__
+    import_models = AppConfig.import_models
+
+    def timed_create(cls, entry):
+        # Imports the app's module and its AppConfig
+        start = time.perf_counter()
+        app_config = create(cls, entry)
+        timings[app_config.label]['import'] += time.perf_counter() - start
+        return app_config
+
+    def timed_import_models(app_config):
+        _timed(timings, app_config.label, 'models',
+               import_models, app_config)
+        ready = app_config.ready
+        app_config.ready = lambda: _timed(
+            timings, app_config.label, 'ready', ready
+        )
+
+    AppConfig.create = classmethod(timed_create)
+    AppConfig.import_models = timed_import_models
+    try:
+        start = time.perf_counter()
+        settings.INSTALLED_APPS
+        setting_up = time.perf_counter()
+        django.setup(set_prefix=False)
+        set_up = time.perf_counter()
+    finally:
+        AppConfig.create = classmethod(create)
+        AppConfig.import_models = import_models
+
+    # What the first request pays on top: the middleware chain and urlconf
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.urls import get_resolver
+
+    WSGIHandler()
+    handler = time.perf_counter()
+    get_resolver().url_patterns
+    urls = time.perf_counter()
+
+    return {
+        'apps': {label: dict(phases) for label, phases in timings.items()},
+        'settings': setting_up - start,
+        'setup': set_up - setting_up,
+        'middleware': handler - set_up,
+        'urlconf': urls - handler,
+    }
+
+
+if __name__ == '__main__':
+    print(json.dumps(measure()))
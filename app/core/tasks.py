@@ -0,0 +1,9 @@
+from django.core.management import call_command
+
+from core.jobs import task
+
+
+@task('purge_deleted_user')
+def purge_deleted_user(email):
+    """Purge the data of a closed account"""
+    call_command('purge_deleted_users', user=email)
@@ -0,0 +1,157 @@
+"""Test helpers, mostly for keeping the number of queries per request in
+check.
+
+Subclass QueryBudgetTestCase, implement populate() and declare an Endpoint
+per (url name, method) in `endpoints`. Each endpoint is requested once per
+data size in `sizes`; the test fails if it runs more queries on the larger
+data than on the smaller, or more than its budget, and prints the SQL
+that was added.
+"""
+import difflib
+import re
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.test import TestCase
+from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver, reverse
+from rest_framework.test import APIClient
+
+# budget: most queries allowed. kwargs, data: called with what populate()
+# returned, giving the url kwargs and the request data or query params.
+Endpoint = namedtuple(
+    'Endpoint', ['budget', 'kwargs', 'data', 'format'],
+    defaults=[None, None, 'json']
+)
+
+# Methods every view answers without a handler of its own
+IMPLICIT_METHODS = {'head', 'options'}
+
+_NUMBER = re.compile(r'\b\d+(\.\d+)?\b')
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_IN_LIST = re.compile(r'IN \([^()]*\)')
+_SAVEPOINT = re.compile(r'"s\d+_x\d+"')
+
+
+class TestRunner(DiscoverRunner):
+    """Test runner keeping the users tests create on the default shard.
+
+    Tests write their fixtures without a request, which goes to default, so
+    their users' data must be there too whatever DB_SHARD_NAMES is. Tests
+    of sharding pass the shard to create_user.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._new_user_shards = settings.NEW_USER_SHARDS
+        settings.NEW_USER_SHARDS = ['default']
+
+    def teardown_test_environment(self, **kwargs):
+        settings.NEW_USER_SHARDS = self._new_user_shards
+        super().teardown_test_environment(**kwargs)
+
+
+def routes(urlpatterns, namespace):
+    """Return the (url name, method) of every route in urlpatterns"""
+    found = set()
+    for pattern in urlpatterns:
+        if isinstance(pattern, URLResolver):
+            found |= routes(pattern.url_patterns, namespace)
+            continue
+        callback = pattern.callback
+        actions = getattr(callback, 'actions', None)
+        if actions is None:
+            view_class = callback.view_class
+            actions = [method for method in view_class.http_method_names
+                       if method not in IMPLICIT_METHODS and
+                       hasattr(view_class, method)]
+        found |= {(f'{namespace}:{pattern.name}', method)
+                  for method in actions}
+    return found
+
+
+def normalize_sql(sql):
+    """Blank out the values in sql, so the same statement run for other
+    rows compares equal"""
+    sql = _SAVEPOINT.sub('"savepoint"', sql)
+    sql = _STRING.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _NUMBER.sub('?', sql)
+
+
+def sql_diff(smaller, larger):
+    """Return a diff of the statements run on the smaller and larger data"""
+    return '\n'.join(difflib.unified_diff(
+        [normalize_sql(sql) for sql in smaller],
+        [normalize_sql(sql) for sql in larger],
+        'smaller data', 'larger data', lineterm=''
+    ))
+
+
+class QueryBudgetTestCase(TestCase):
+    """Check every declared endpoint against its query budget"""
+    # Number of rows of each kind populate() is asked for
+    sizes = (2, 20)
+    # (url name, method) -> Endpoint
+    endpoints = {}
+
+    def populate(self, size):
+        """Create the data for a run and return what Endpoint callables get.
+        Authenticate self.client here."""
+        raise NotImplementedError
+
+    def reset(self):
+        """Drop state kept between requests, such as in-process caches"""
+
+    def measure(self, name, method, endpoint, size):
+        """Request the endpoint on fresh data of the size and return the
+        SQL run. The data is rolled back afterwards."""
+        with transaction.atomic():
+            self.reset()
+            self.client = APIClient()
+            context = self.populate(size)
+            url = reverse(
+                name, kwargs=endpoint.kwargs(context)
+                if endpoint.kwargs else None
+            )
+            data = endpoint.data(context) if endpoint.data else None
+            with CaptureQueriesContext(connection) as queries:
+                response = getattr(self.client, method)(
+                    url, data, format=endpoint.format
+                )
+            transaction.set_rollback(True)
+
+        self.assertLess(response.status_code, 400,
+                        f'{method.upper()} {name} failed: {response.data}')
+        return [query['sql'] for query in queries.captured_queries]
+
+    def assertWithinBudget(self, name, method, endpoint):
+        smaller, larger = [self.measure(name, method, endpoint, size)
+                           for size in self.sizes]
+        label = f'{method.upper()} {name}'
+        if len(larger) > len(smaller):
+            self.fail(
+                f'{label} ran {len(smaller)} queries on {self.sizes[0]} '
+                f'rows but {len(larger)} on {self.sizes[-1]}:\n'
+                f'{sql_diff(smaller, larger)}'
+            )
+        if len(larger) > endpoint.budget:
+            self.fail(
+                f'{label} ran {len(larger)} queries, over its budget of '
+                f'{endpoint.budget}:\n' +
+                '\n'.join(normalize_sql(sql) for sql in larger)
+            )
+
+    def assertRoutesBudgeted(self, urlpatterns, namespace):
+        """Fail for every route lacking a declared endpoint"""
+        missing = routes(urlpatterns, namespace) - set(self.endpoints)
+        self.assertFalse(
+            missing, f'Routes without a query budget: {sorted(missing)}'
+        )
+
+    def test_query_budgets(self):
+        for (name, method), endpoint in sorted(self.endpoints.items()):
+            with self.subTest(f'{method.upper()} {name}'):
+                self.assertWithinBudget(name, method, endpoint)
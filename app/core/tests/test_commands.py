@@ -1,7 +1,23 @@
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
 from unittest.mock import patch
-from django.core.management import call_command
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command, CommandError
+from django.db import connection
 from django.db.utils import OperationalError
-from django.test import TestCase
+from django.test import LiveServerTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from core import loadgen
+from core.management.commands import (
+    explain_hot_paths, gc_media, purge_deleted_users
+)
+from core.models import Recipe, Tag, Ingredient, Tombstone
 
 
 class CommandTests(TestCase):
@@ -19,3 +35,546 @@ class CommandTests(TestCase):
             gi.side_effect = [OperationalError] * 5 + [True]
             call_command('wait_for_db')
             self.assertEqual(gi.call_count, 6)
+
+
+class GcMediaCommandTests(TestCase):
+    # The command goes through every shard
+    databases = '__all__'
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.upload_dir = os.path.join(self.media_root, 'uploads/recipe')
+        os.makedirs(self.upload_dir)
+        user = get_user_model().objects.create_user('test@ufc.br', 'testpass')
+        for name in ('a.jpg', 'b.jpg', 'c.jpg', 'd.jpg'):
+            open(os.path.join(self.upload_dir, name), 'w').close()
+        Recipe.objects.create(
+            user=user, title='Kept', time_minutes=5, price=5.00,
+            image='uploads/recipe/b.jpg'
+        )
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+    def test_gc_media_deletes_orphans(self):
+        """Test that unreferenced files are removed and referenced kept"""
+        call_command('gc_media', min_age=0, batch_size=2, stdout=StringIO())
+
+        self.assertEqual(os.listdir(self.upload_dir), ['b.jpg'])
+
+    def test_gc_media_dry_run(self):
+        """Test that a dry run reports orphans without deleting them"""
+        out = StringIO()
+        call_command('gc_media', min_age=0, dry_run=True, stdout=out)
+
+        self.assertEqual(len(os.listdir(self.upload_dir)), 4)
+        self.assertIn('Would delete uploads/recipe/a.jpg', out.getvalue())
+
+    def test_gc_media_skips_recent_files(self):
+        """Test that freshly uploaded files are left alone"""
+        call_command('gc_media', stdout=StringIO())
+
+        self.assertEqual(len(os.listdir(self.upload_dir)), 4)
+
+    def test_gc_media_resumes_from_checkpoint(self):
+        """Test that a limited run picks up where the last one stopped"""
+        call_command('gc_media', min_age=0, limit=2, stdout=StringIO())
+
+        self.assertEqual(
+            sorted(os.listdir(self.upload_dir)), ['b.jpg', 'c.jpg', 'd.jpg']
+        )
+        self.assertTrue(
+            os.path.exists(os.path.join(self.media_root, '.gc_media.json'))
+        )
+
+        call_command('gc_media', min_age=0, limit=2, stdout=StringIO())
+
+        self.assertEqual(os.listdir(self.upload_dir), ['b.jpg'])
+        self.assertFalse(
+            os.path.exists(os.path.join(self.media_root, '.gc_media.json'))
+        )
+
+    def test_gc_media_file_removed_during_scan(self):
+        """Test that a file removed after being listed is skipped"""
+        walk_sorted = gc_media.walk_sorted
+
+        def walk_then_remove(*args):
+            for name in walk_sorted(*args):
+                yield name
+                # Gone before the batch is checked
+                os.remove(os.path.join(self.media_root, name))
+
+        out = StringIO()
+        with patch.object(gc_media, 'walk_sorted', walk_then_remove):
+            call_command('gc_media', min_age=0, stdout=out)
+
+        self.assertEqual(os.listdir(self.upload_dir), [])
+        self.assertIn('Deleted 0 orphaned file(s) out of 4', out.getvalue())
+
+    @patch('time.sleep', return_value=True)
+    def test_gc_media_rate_limit(self, ts):
+        """Test that deletions are throttled when a rate is given"""
+        call_command('gc_media', min_age=0, rate=10, stdout=StringIO())
+
+        self.assertEqual(ts.call_count, 3)
+
+
+class ExplainHotPathsCommandTests(TestCase):
+    # The command goes through every shard
+    databases = '__all__'
+
+    def test_postgresql_markers_flag_nodes_only(self):
+        """Test each scan or sort node is flagged once, not its details"""
+        plan = [
+            ('Sort  (cost=10.1..10.2 rows=4 width=8)', True),
+            ('  Sort Key: name', False),
+            ('  Sort Method: quicksort  Memory: 25kB', False),
+            ('  ->  Incremental Sort  (cost=0.3..9.1 rows=4 width=8)', True),
+            ('        Presorted Key: user_id', False),
+            ('        ->  Seq Scan on core_tag  (cost=0.0..1.1 rows=4)',
+             True),
+            ('  ->  Parallel Seq Scan on core_recipe', True),
+            ('  ->  Index Scan using core_tag_user_name_idx', False),
+        ]
+        markers = explain_hot_paths.WARNING_MARKERS['postgresql']
+        for line, flagged in plan:
+            self.assertEqual(
+                any(marker.search(line) for marker in markers), flagged, line
+            )
+
+    def test_explain_hot_paths_reports_every_viewset(self):
+        """Test that a plan is printed for each viewset queryset"""
+        user = get_user_model().objects.create_user('test@ufc.br', 'testpass')
+        Tag.objects.create(user=user, name='Vegan')
+        out = StringIO()
+        call_command('explain_hot_paths', stdout=out)
+
+        output = out.getvalue()
+        for name in ('tags', 'ingredients', 'recipes', 'recipes?tags',
+                     'recipes?ingredients'):
+            self.assertIn(f'{name}\n', output)
+        self.assertIn('plan line(s) flagged', output)
+
+    def test_explain_hot_paths_unknown_user(self):
+        """Test that an unknown user email is an error"""
+        with self.assertRaises(CommandError):
+            call_command('explain_hot_paths', user='nobody@ufc.br',
+                         stdout=StringIO())
+
+
+class BenchRecipeListCommandTests(TestCase):
+
+    def test_bench_recipe_list(self):
+        """Test that every renderer and encoding is reported"""
+        user = get_user_model().objects.create_user('test@ufc.br', 'testpass')
+        Recipe.objects.create(
+            user=user, title='Soup', time_minutes=5, price=5.00
+        )
+        out = StringIO()
+        call_command('bench_recipe_list', user='test@ufc.br', requests=2,
+                     stdout=out)
+
+        lines = out.getvalue().splitlines()
+        self.assertIn('cpu ms/req', lines[0])
+        for renderer in ('json', 'fast'):
+            for coding in ('identity', 'gzip'):
+                self.assertTrue(any(
+                    line.split()[:2] == [renderer, coding] for line in lines
+                ))
+
+
+# A configuration perf_check accepts
+FAST_SETTINGS = {
+    'DEBUG': False,
+    'CACHES': {'default': {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': 'cache:11211',
+    }},
+    'FILE_UPLOAD_MAX_MEMORY_SIZE': 2621440,
+    'DATA_UPLOAD_MAX_MEMORY_SIZE': 2621440,
+}
+
+
+class PerfCheckCommandTests(TestCase):
+
+    def setUp(self):
+        # connections share the settings dicts, so patch them in place
+        for options in settings.DATABASES.values():
+            patcher = patch.dict(options, CONN_MAX_AGE=60)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @override_settings(**FAST_SETTINGS)
+    def test_perf_check_passes(self):
+        """Test that a production like configuration passes"""
+        out = StringIO()
+        call_command('perf_check', stdout=out)
+
+        self.assertIn('Performance check passed', out.getvalue())
+
+    @override_settings(**dict(FAST_SETTINGS, DEBUG=True))
+    def test_perf_check_debug(self):
+        """Test that debug mode fails the check"""
+        out = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('perf_check', stdout=out)
+
+        self.assertIn('core.E001', out.getvalue())
+
+    @override_settings(**FAST_SETTINGS)
+    def test_perf_check_connection_per_request(self):
+        """Test that databases without persistent connections fail"""
+        out = StringIO()
+        with patch.dict(settings.DATABASES['default'], CONN_MAX_AGE=0):
+            with self.assertRaises(CommandError):
+                call_command('perf_check', stdout=out)
+
+        self.assertIn('core.E002', out.getvalue())
+
+    @override_settings(**dict(
+        FAST_SETTINGS,
+        CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'
+        }},
+        FILE_UPLOAD_MAX_MEMORY_SIZE=None
+    ))
+    def test_perf_check_cache_and_uploads(self):
+        """Test that per process caches and unbounded uploads fail"""
+        out = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('perf_check', stdout=out)
+
+        self.assertIn('core.E003', out.getvalue())
+        self.assertIn('core.E005', out.getvalue())
+
+    @override_settings(**dict(FAST_SETTINGS, MIDDLEWARE=[]))
+    def test_perf_check_warnings(self):
+        """Test that warnings fail only when asked to"""
+        call_command('perf_check', stdout=StringIO())
+
+        with self.assertRaises(CommandError):
+            call_command('perf_check', fail_on_warning=True,
+                         stdout=StringIO())
+
+
+class ProfileStartupCommandTests(TestCase):
+
+    def test_profile_startup(self):
+        """Test that every installed app and startup stage is timed"""
+        out = StringIO()
+        call_command('profile_startup', runs=1, json=True, stdout=out)
+
+        report = json.loads(out.getvalue())
+        for label in ('core', 'recipe', 'user', 'auth'):
+            self.assertEqual(
+                set(report['apps'][label]), {'import', 'models', 'ready'}
+            )
+        for stage in ('settings', 'setup', 'middleware', 'urlconf'):
+            self.assertGreater(report[stage], 0)
+
+
+class PruneTombstonesCommandTests(TestCase):
+    # The command goes through every shard
+    databases = '__all__'
+
+    def test_prune_tombstones(self):
+        """Test that only tombstones past the sync window are deleted"""
+        user = get_user_model().objects.create_user('test@ufc.br', 'testpass')
+        Tombstone.objects.create(user=user, kind='tag', object_id=1)
+        Tombstone.objects.create(
+            user=user, kind='tag', object_id=2,
+            deleted_at=timezone.now() - timedelta(days=31)
+        )
+
+        with override_settings(SYNC_TOMBSTONE_DAYS=30):
+            call_command('prune_tombstones', stdout=StringIO())
+
+        self.assertEqual(
+            list(Tombstone.objects.values_list('object_id', flat=True)), [1]
+        )
+
+
+class PurgeDeletedUsersCommandTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        os.makedirs(os.path.join(self.media_root, 'uploads/recipe'))
+
+        self.user = get_user_model().objects.create_user(
+            'test@ufc.br', 'testpass'
+        )
+        self.other = get_user_model().objects.create_user(
+            'other@ufc.br', 'testpass'
+        )
+        self.images = []
+        for i in range(5):
+            image = f'uploads/recipe/{i}.jpg'
+            open(os.path.join(self.media_root, image), 'w').close()
+            self.images.append(image)
+            recipe = Recipe.objects.create(
+                user=self.user, title=f'Recipe {i}', time_minutes=5,
+                price=5.00, image=image
+            )
+            recipe.tags.add(
+                Tag.objects.create(user=self.user, name=f'Tag {i}')
+            )
+            recipe.ingredients.add(
+                Ingredient.objects.create(user=self.user, name=f'I {i}')
+            )
+        Recipe.objects.create(
+            user=self.other, title='Kept', time_minutes=5, price=5.00
+        ).delete()
+        Recipe.objects.create(
+            user=self.other, title='Kept', time_minutes=5, price=5.00
+        )
+        self.user.is_active = False
+        self.user.deleted_at = timezone.now()
+        self.user.save()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+    def assertPurged(self):
+        self.assertFalse(
+            get_user_model().objects.filter(id=self.user.id).exists()
+        )
+        for model in (Recipe, Tag, Ingredient, Tombstone):
+            self.assertFalse(model.objects.filter(user=self.user).exists())
+        for through in (Recipe.tags.through, Recipe.ingredients.through):
+            self.assertFalse(through.objects.exists())
+        for image in self.images:
+            self.assertFalse(
+                os.path.exists(os.path.join(self.media_root, image))
+            )
+        self.assertEqual(Recipe.objects.filter(user=self.other).count(), 1)
+        self.assertEqual(Tombstone.objects.filter(user=self.other).count(), 1)
+
+    def test_purge_deleted_users(self):
+        """Test that closed accounts and all their data are removed"""
+        out = StringIO()
+        call_command('purge_deleted_users', batch_size=2, stdout=out)
+
+        self.assertPurged()
+        self.assertIn('5 recipe(s), 5 image(s)', out.getvalue())
+        self.assertIn('Purged 1 account(s)', out.getvalue())
+
+    def test_purge_resumes(self):
+        """Test that an interrupted purge finishes when run again"""
+        # Fail deleting the second chunk's rows, after its files went
+        real_delete_ids = purge_deleted_users.delete_ids
+        calls = []
+
+        def failing_delete_ids(*args):
+            calls.append(args)
+            if len(calls) > 3:
+                raise OperationalError
+            return real_delete_ids(*args)
+
+        with patch.object(purge_deleted_users, 'delete_ids',
+                          failing_delete_ids):
+            with self.assertRaises(OperationalError):
+                call_command('purge_deleted_users', batch_size=2,
+                             stdout=StringIO())
+
+        # The first chunk was committed
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 3)
+        call_command('purge_deleted_users', batch_size=2, stdout=StringIO())
+
+        self.assertPurged()
+
+    def test_active_users_kept(self):
+        """Test that accounts not closed are left alone"""
+        call_command('purge_deleted_users', user='other@ufc.br',
+                     stdout=StringIO())
+
+        self.assertTrue(
+            get_user_model().objects.filter(id=self.other.id).exists()
+        )
+
+
+class MergeDuplicateNamesCommandTests(TestCase):
+    # The command goes through every shard
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@ufc.br', 'testpass'
+        )
+
+    def test_merge_duplicate_names(self):
+        """Test that duplicate tags are folded and recipes relinked"""
+        recipe1 = Recipe.objects.create(
+            user=self.user, title='Curry', time_minutes=5, price=5.00
+        )
+        recipe2 = Recipe.objects.create(
+            user=self.user, title='Salad', time_minutes=5, price=5.00
+        )
+        keep = Tag.objects.create(user=self.user, name='Vegan')
+        recipe1.tags.add(keep)
+        # Simulate rows created before the unique index existed
+        with connection.cursor() as cursor:
+            cursor.execute('DROP INDEX core_tag_user_lower_name_uniq')
+        try:
+            dup1 = Tag.objects.create(user=self.user, name='vegan')
+            dup2 = Tag.objects.create(user=self.user, name='VEGAN')
+            recipe1.tags.add(dup1)
+            recipe2.tags.add(dup2)
+
+            call_command('merge_duplicate_names', stdout=StringIO())
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'CREATE UNIQUE INDEX core_tag_user_lower_name_uniq '
+                    'ON core_tag (user_id, lower(name))'
+                )
+
+        self.assertEqual(list(Tag.objects.all()), [keep])
+        self.assertEqual(list(recipe1.tags.all()), [keep])
+        self.assertEqual(list(recipe2.tags.all()), [keep])
+
+
+class ReconcileRecipeCountsCommandTests(TestCase):
+    # The command goes through every shard
+    databases = '__all__'
+
+    def test_reconcile_recipe_counts(self):
+        """Test that drifted usage counts are recomputed"""
+        user = get_user_model().objects.create_user('test@ufc.br', 'testpass')
+        recipe = Recipe.objects.create(
+            user=user, title='Curry', time_minutes=5, price=5.00
+        )
+        tag = Tag.objects.create(user=user, name='Vegan')
+        ingredient = Ingredient.objects.create(user=user, name='Rice')
+        recipe.tags.add(tag)
+        recipe.ingredients.add(ingredient)
+        Tag.objects.update(recipe_count=7)
+        Ingredient.objects.update(recipe_count=0)
+
+        call_command('reconcile_recipe_counts', stdout=StringIO())
+
+        tag.refresh_from_db()
+        ingredient.refresh_from_db()
+        self.assertEqual(tag.recipe_count, 1)
+        self.assertEqual(ingredient.recipe_count, 1)
+
+
+class LoadgenTests(TestCase):
+
+    def test_parse_mix(self):
+        """Test that the mix is parsed and unknown operations rejected"""
+        self.assertEqual(loadgen.parse_mix('list=3, detail=1'),
+                         {'list': 3, 'detail': 1})
+        for mix in ('list=1,search=1', 'list=0', 'list=-1', 'list'):
+            with self.assertRaises(ValueError):
+                loadgen.parse_mix(mix)
+
+    def test_parse_url(self):
+        """Test the scheme picks the port and TLS and the path is kept"""
+        self.assertEqual(loadgen.parse_url('http://api:8000'),
+                         ('api', 8000, None, ''))
+
+        host, port, context, prefix = loadgen.parse_url(
+            'https://example.com/v1/'
+        )
+        self.assertEqual((host, port, prefix), ('example.com', 443, '/v1'))
+        self.assertIsNotNone(context)
+
+        for url in ('ftp://example.com', 'example.com:8000', 'http:///v1'):
+            with self.assertRaises(ValueError):
+                loadgen.parse_url(url)
+
+    def test_stats_summary(self):
+        """Test the percentiles, histogram and error rate"""
+        stats = loadgen.Stats()
+        for ms in range(1, 101):
+            stats.record('list', ms / 1000, '500' if ms > 95 else None)
+        result = stats.summary(elapsed=2)['list']
+
+        self.assertEqual(result['requests'], 100)
+        self.assertEqual(result['throughput'], 50)
+        self.assertEqual(result['errors'], {'500': 5})
+        self.assertEqual(result['error_rate'], 0.05)
+        self.assertAlmostEqual(result['p50_ms'], 50)
+        self.assertAlmostEqual(result['p99_ms'], 99)
+        self.assertAlmostEqual(result['max_ms'], 100)
+        self.assertEqual(sum(result['histogram']), 100)
+        # 51..100 ms
+        self.assertEqual(result['histogram'][
+            loadgen.BUCKETS_MS.index(100)], 50)
+
+
+class LoadgenCommandTests(LiveServerTestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def test_loadgen(self):
+        """Test a run against a live server is reported and saved"""
+        output = os.path.join(self.tmpdir, 'run.json')
+        out = StringIO()
+        # One user each, since the SQLite test database locks its tables
+        # under concurrent writes
+        with override_settings(MEDIA_ROOT=self.tmpdir):
+            call_command('loadgen', url=self.live_server_url, users=1,
+                         duration=0, requests=30, recipes=2, seed=1,
+                         output=output, stdout=out)
+            call_command('loadgen', url=self.live_server_url, users=1,
+                         duration=0, requests=10, recipes=1, seed=1,
+                         mix='list=1,upload=1',
+                         output=os.path.join(self.tmpdir, 'again.json'),
+                         compare=output, stdout=out)
+
+        with open(output) as f:
+            results = json.load(f)
+        operations = results['operations']
+        self.assertEqual(
+            sum(result['requests'] for result in operations.values()), 30
+        )
+        for name, result in operations.items():
+            self.assertEqual(result['errors'], {}, name)
+        self.assertEqual(get_user_model().objects.count(), 2)
+        self.assertIn('Change from the earlier run', out.getvalue())
+
+    def test_loadgen_no_server(self):
+        """Test an unreachable server is reported"""
+        with self.assertRaises(CommandError):
+            call_command('loadgen', url='http://127.0.0.1:1', users=1,
+                         requests=1, output=os.devnull, stdout=StringIO())
+
+    def test_loadgen_path_prefix(self):
+        """Test the path of the url is sent before every request path"""
+        with self.assertRaisesMessage(CommandError, '404'):
+            call_command('loadgen', url=f'{self.live_server_url}/nowhere',
+                         users=1, requests=1, output=os.devnull,
+                         stdout=StringIO())
+
+    def test_loadgen_bad_compare_file(self):
+        """Test a missing or malformed --compare file is rejected before
+        the run starts"""
+        malformed = os.path.join(self.tmpdir, 'malformed.json')
+        not_results = os.path.join(self.tmpdir, 'list.json')
+        with open(malformed, 'w') as f:
+            f.write('{"operations": ')
+        with open(not_results, 'w') as f:
+            f.write('[]')
+
+        for compare in (os.path.join(self.tmpdir, 'missing.json'),
+                        malformed, not_results):
+            with self.assertRaisesMessage(CommandError,
+                                          'Invalid --compare file'):
+                call_command('loadgen', url='http://127.0.0.1:1', users=1,
+                             requests=1, compare=compare,
+                             output=os.devnull, stdout=StringIO())
+
+    def test_loadgen_bad_scheme(self):
+        """Test a url the load generator can't speak is rejected"""
+        with self.assertRaisesMessage(CommandError, 'Invalid --url'):
+            call_command('loadgen', url='ftp://127.0.0.1', users=1,
+                         requests=1, output=os.devnull, stdout=StringIO())
@@ -0,0 +1,154 @@
+import gzip
+from decimal import Decimal
+from unittest.mock import patch
+
+import brotli
+import orjson
+from django.contrib.auth import get_user_model
+from django.http import HttpResponse, StreamingHttpResponse
+from django.middleware.csrf import get_token
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from core.middleware import CompressionMiddleware, accepted_encoding
+from core.models import Recipe
+from core.renderers import FastJSONRenderer
+
+
+class FastJSONRendererTests(TestCase):
+
+    def test_matches_drf_output(self):
+        """Test that the output is the same as DRF's JSON renderer"""
+        data = {'price': Decimal('5.50'), 'title': 'Açaí bowl',
+                'errors': {0: ['Invalid pk']}, 'tags': [1, 2]}
+
+        self.assertEqual(
+            FastJSONRenderer().render(data),
+            JSONRenderer().render(data)
+        )
+
+    def test_rendered_by_orjson(self):
+        """Test that orjson does the rendering"""
+        with patch('core.renderers.orjson.dumps',
+                   wraps=orjson.dumps) as dumps:
+            FastJSONRenderer().render({'tags': [1, 2]})
+
+        dumps.assert_called_once()
+
+    def test_recipe_list_rendered(self):
+        """Test the recipe list is served by the fast renderer"""
+        user = get_user_model().objects.create_user('test@ufc.br', 'pass')
+        Recipe.objects.create(user=user, title='Soup', time_minutes=5,
+                              price=Decimal('5.50'))
+        client = APIClient()
+        client.force_authenticate(user)
+
+        res = client.get(reverse('recipe:recipe-list'))
+
+        self.assertIsInstance(res.accepted_renderer, FastJSONRenderer)
+        self.assertEqual(res.json()[0]['price'], '5.50')
+
+
+@override_settings(COMPRESSION_MIN_SIZE=100, COMPRESSION_STREAM_MIN_SIZE=1000)
+class CompressionMiddlewareTests(TestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def _process(self, response, accept='gzip'):
+        request = self.factory.get('/', HTTP_ACCEPT_ENCODING=accept)
+        return CompressionMiddleware(lambda request: response)(request)
+
+    def test_accepted_encoding(self):
+        """Test negotiating the encoding from q values"""
+        self.assertEqual(accepted_encoding('gzip, deflate'), 'gzip')
+        self.assertEqual(accepted_encoding('deflate'), None)
+        self.assertEqual(accepted_encoding('gzip;q=0, *'), 'br')
+        self.assertEqual(accepted_encoding('gzip;q=0, br;q=0, *'), None)
+        self.assertEqual(accepted_encoding('*;q=0.5'), 'br')
+        self.assertEqual(accepted_encoding('gzip, br;q=0.8'), 'gzip')
+
+    def test_small_response_not_compressed(self):
+        """Test that responses under the threshold are sent as they are"""
+        response = self._process(HttpResponse(b'x' * 99))
+
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.content, b'x' * 99)
+
+    def test_response_compressed(self):
+        """Test that larger responses are gzipped when accepted"""
+        response = self._process(HttpResponse(b'x' * 500))
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(gzip.decompress(response.content), b'x' * 500)
+        self.assertEqual(int(response['Content-Length']),
+                         len(response.content))
+
+    def test_response_brotli_compressed(self):
+        """Test that brotli is preferred when the client takes both"""
+        response = self._process(HttpResponse(b'x' * 500),
+                                 accept='gzip, br')
+
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(response.content), b'x' * 500)
+
+    def test_compressed_media_not_compressed(self):
+        """Test that images and other compressed media are left alone"""
+        for content_type in ('image/jpeg', 'image/png', 'application/zip'):
+            response = self._process(
+                HttpResponse(b'x' * 500, content_type=content_type)
+            )
+
+            self.assertFalse(response.has_header('Content-Encoding'))
+        response = self._process(HttpResponse(
+            b'x' * 500, content_type='application/problem+json'
+        ))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    def test_csrf_token_pages_not_compressed(self):
+        """Test that responses carrying a CSRF token are not compressed"""
+        request = self.factory.get('/', HTTP_ACCEPT_ENCODING='gzip')
+
+        def view(request):
+            return HttpResponse(get_token(request) + 'x' * 500)
+        response = CompressionMiddleware(view)(request)
+
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_not_accepted(self):
+        """Test that nothing is compressed if the client can't decode it"""
+        response = self._process(HttpResponse(b'x' * 500), accept='')
+
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+    def test_large_response_streamed(self):
+        """Test that large bodies are compressed while streamed"""
+        original = HttpResponse(b'x' * 5000, status=201)
+        original['ETag'] = '"abc"'
+        response = self._process(original)
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response['ETag'], 'W/"abc"')
+        self.assertFalse(response.has_header('Content-Length'))
+        self.assertEqual(
+            gzip.decompress(b''.join(response.streaming_content)),
+            b'x' * 5000
+        )
+
+    def test_streaming_response_compressed(self):
+        """Test that streaming responses are compressed chunk by chunk"""
+        response = self._process(
+            StreamingHttpResponse(b'x' * 100 for _ in range(10))
+        )
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(
+            gzip.decompress(b''.join(response.streaming_content)),
+            b'x' * 1000
+        )
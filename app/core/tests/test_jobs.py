@@ -0,0 +1,158 @@
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from core import jobs
+from core.models import Job
+
+calls = []
+
+
+@jobs.task('test_record')
+def record(*args, **kwargs):
+    calls.append((args, kwargs))
+
+
+@jobs.task('test_fail')
+def fail():
+    raise ValueError('boom')
+
+
+@override_settings(JOB_MAX_ATTEMPTS=3, JOB_RETRY_BACKOFF_SECONDS=10,
+                   JOB_RETRY_BACKOFF_MAX_SECONDS=25, JOB_LEASE_SECONDS=60)
+class JobTests(TestCase):
+
+    def setUp(self):
+        calls.clear()
+
+    def test_enqueue_unknown_task(self):
+        """Test queueing a task that isn't registered fails"""
+        with self.assertRaises(KeyError):
+            jobs.enqueue('nope')
+
+    def test_claim_due_jobs_once(self):
+        """Test due jobs are claimed in order, and only once"""
+        later = jobs.enqueue(
+            'test_record', run_at=timezone.now() + timedelta(hours=1)
+        )
+        first = jobs.enqueue('test_record', 1)
+        second = jobs.enqueue('test_record', 2)
+
+        claimed = jobs.claim('w1', limit=5)
+
+        self.assertEqual([job.id for job in claimed], [first.id, second.id])
+        self.assertEqual(claimed[0].status, Job.RUNNING)
+        self.assertEqual(claimed[0].locked_by, 'w1')
+        self.assertEqual(claimed[0].attempts, 1)
+        self.assertEqual(jobs.claim('w2', limit=5), [])
+        later.refresh_from_db()
+        self.assertEqual(later.status, Job.QUEUED)
+
+    def test_run_job(self):
+        """Test a job runs its task with the queued arguments"""
+        jobs.enqueue('test_record', 1, 'a', key=[2])
+        job, = jobs.claim('w1')
+
+        self.assertTrue(jobs.run_job(job))
+
+        self.assertEqual(calls, [((1, 'a'), {'key': [2]})])
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+        self.assertEqual(job.locked_by, '')
+        self.assertIsNotNone(job.finished_at)
+
+    def test_failed_job_retried_with_backoff(self):
+        """Test a failing job is retried later, then given up on"""
+        job = jobs.enqueue('test_fail')
+        delays = []
+        for _ in range(3):
+            Job.objects.filter(id=job.id).update(run_at=timezone.now())
+            claimed, = jobs.claim('w1')
+            before = timezone.now()
+            with self.assertLogs('core.jobs', 'ERROR'):
+                self.assertFalse(jobs.run_job(claimed))
+            job.refresh_from_db()
+            delays.append(round((job.run_at - before).total_seconds()))
+
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 3)
+        self.assertIn('ValueError: boom', job.last_error)
+        # Doubling from 10s, capped at 25s; the last try isn't rescheduled
+        self.assertEqual(delays[:2], [10, 20])
+        self.assertEqual(jobs.retry_delay(3), timedelta(seconds=25))
+
+    def test_requeue_stale(self):
+        """Test a job whose lease expired is queued again"""
+        jobs.enqueue('test_record')
+        job, = jobs.claim('dead')
+        self.assertEqual(jobs.requeue_stale(), 0)
+
+        later = timezone.now() + timedelta(seconds=61)
+        self.assertEqual(jobs.requeue_stale(now=later), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED)
+        # The dead worker finishing late doesn't overwrite the new run
+        jobs.run_job(job)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED)
+
+    def test_heartbeat_keeps_long_job(self):
+        """Test a job still beating isn't requeued however long it runs"""
+        jobs.enqueue('test_record')
+        job, = jobs.claim('w1')
+        later = timezone.now() + timedelta(hours=2)
+
+        self.assertTrue(jobs.Heartbeat(job).beat(now=later))
+        self.assertEqual(
+            jobs.requeue_stale(now=later + timedelta(seconds=59)), 0
+        )
+        self.assertEqual(
+            jobs.requeue_stale(now=later + timedelta(seconds=61)), 1
+        )
+        # The requeued job's lease can't be renewed by its old worker
+        self.assertFalse(jobs.Heartbeat(job).beat())
+
+    def test_claim_without_skip_locked(self):
+        """Test claiming falls back to conditional updates"""
+        jobs.enqueue('test_record')
+        with patch('django.db.backends.base.features.BaseDatabaseFeatures.'
+                   'has_select_for_update_skip_locked', False):
+            self.assertEqual(len(jobs.claim('w1', limit=2)), 1)
+
+
+class RunWorkerCommandTests(TestCase):
+
+    def setUp(self):
+        calls.clear()
+
+    def test_run_worker_burst(self):
+        """Test the worker runs the due jobs, reports them and exits"""
+        for i in range(3):
+            jobs.enqueue('test_record', i)
+        jobs.enqueue('test_fail')
+        out = StringIO()
+
+        with self.assertLogs('core.jobs', 'ERROR'):
+            call_command('run_worker', burst=True, stdout=out)
+
+        self.assertEqual(sorted(args for args, _ in calls),
+                         [(0,), (1,), (2,)])
+        self.assertEqual(Job.objects.filter(status=Job.DONE).count(), 3)
+        self.assertEqual(Job.objects.get(task='test_fail').status,
+                         Job.QUEUED)
+        report = out.getvalue()
+        self.assertRegex(report, r'test_record\s+3\s+0\s+0')
+        self.assertRegex(report, r'test_fail\s+0\s+1\s+0')
+
+    def test_run_worker_max_jobs(self):
+        """Test the worker stops after the given number of jobs"""
+        for i in range(3):
+            jobs.enqueue('test_record', i)
+
+        call_command('run_worker', burst=True, max_jobs=2, stdout=StringIO())
+
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(Job.objects.filter(status=Job.QUEUED).count(), 1)
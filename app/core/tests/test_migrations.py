@@ -0,0 +1,47 @@
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase
+
+
+class DataMigrationTests(TransactionTestCase):
+    """Run the data migrations against rows made with historical models"""
+
+    migrate_from = [('core', '0009_hot_path_indexes')]
+    migrate_to = [('core', '0011_recipe_count')]
+
+    def setUp(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.migrate_from)
+        self.apps = executor.loader.project_state(self.migrate_from).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def migrate(self):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(self.migrate_to)
+        return executor.loader.project_state(self.migrate_to).apps
+
+    def test_duplicates_merged_and_counted(self):
+        """Test duplicate names are folded and recipe counts filled in"""
+        User = self.apps.get_model('core', 'User')
+        Tag = self.apps.get_model('core', 'Tag')
+        Recipe = self.apps.get_model('core', 'Recipe')
+        user = User.objects.create(email='test@ufc.br', password='x')
+        vegan = Tag.objects.create(user=user, name='Vegan')
+        duplicate = Tag.objects.create(user=user, name='vegan')
+        other = Tag.objects.create(user=user, name='Dessert')
+        for i, tags in enumerate(([vegan], [duplicate], [vegan, duplicate])):
+            recipe = Recipe.objects.create(
+                user=user, title=f'Recipe {i}', time_minutes=5, price=1
+            )
+            recipe.tags.set(tags)
+
+        apps = self.migrate()
+
+        Tag = apps.get_model('core', 'Tag')
+        counts = dict(Tag.objects.values_list('id', 'recipe_count'))
+        self.assertEqual(counts, {vegan.id: 3, other.id: 0})
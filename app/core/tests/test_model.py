@@ -75,6 +75,40 @@ class ModelTests(TestCase):
 
         self.assertEqual(str(recipe), recipe.title)
 
+    def test_tag_recipe_count_follows_recipes(self):
+        """Test that tag usage counts track recipe link changes"""
+        user = sample_user()
+        tag1 = models.Tag.objects.create(user=user, name='Vegan')
+        tag2 = models.Tag.objects.create(user=user, name='Quick')
+        recipe1 = models.Recipe.objects.create(
+            user=user, title='Salad', time_minutes=5, price=5.00
+        )
+        recipe2 = models.Recipe.objects.create(
+            user=user, title='Soup', time_minutes=5, price=5.00
+        )
+
+        def counts():
+            return [models.Tag.objects.get(id=tag.id).recipe_count
+                    for tag in (tag1, tag2)]
+
+        recipe1.tags.add(tag1, tag2)
+        recipe1.tags.add(tag1)
+        recipe2.tags.add(tag1)
+        self.assertEqual(counts(), [2, 1])
+
+        recipe1.tags.remove(tag2)
+        recipe2.tags.remove(tag2)
+        self.assertEqual(counts(), [2, 0])
+
+        tag2.recipe_set.add(recipe1, recipe2)
+        self.assertEqual(counts(), [2, 2])
+
+        recipe1.tags.clear()
+        self.assertEqual(counts(), [1, 1])
+
+        recipe2.delete()
+        self.assertEqual(counts(), [0, 0])
+
     @patch('uuid.uuid4')
     def test_recipe_file_name_uuid(self, mock_uuid):
         """Test that image is is saved in the correct location"""
@@ -0,0 +1,124 @@
+import os
+import shutil
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import MiddlewareNotUsed
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core import profiling
+from core.models import Recipe
+
+RECIPES_URL = reverse('recipe:recipe-list')
+PROFILES_URL = reverse('core:profiles')
+
+
+class ProfilingTests(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        # The middleware reads the settings when the client loads it
+        override = override_settings(PROFILING_DIR=self.tmpdir,
+                                     PROFILING_MAX_FILES=3)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.staff = get_user_model().objects.create_superuser(
+            'admin@ufc.br', 'testpass'
+        )
+        self.user = get_user_model().objects.create_user(
+            'test@ufc.br', 'testpass'
+        )
+        Recipe.objects.create(user=self.staff, title='Soup', time_minutes=5,
+                              price=5.00)
+        self.client = APIClient()
+
+    def _get(self, user, url=RECIPES_URL, **extra):
+        token, _ = Token.objects.get_or_create(user=user)
+        return self.client.get(
+            url, HTTP_AUTHORIZATION=f'Token {token.key}', **extra
+        )
+
+    def test_staff_request_profiled(self):
+        """Test a staff request with the header is profiled"""
+        res = self._get(self.staff, HTTP_X_PROFILE='1')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        name = res['X-Profile-Id']
+        self.assertEqual(profiling.list_profiles(), [name])
+        self.assertTrue(
+            os.path.exists(os.path.join(self.tmpdir, f'{name}.prof'))
+        )
+        profile = profiling.read_profile(name)
+        self.assertEqual(profile['reason'], 'requested')
+        self.assertEqual(profile['path'], RECIPES_URL)
+        self.assertEqual(profile['status'], 200)
+        self.assertTrue(profile['functions'])
+        self.assertTrue(any('core_recipe' in query['sql']
+                            for query in profile['queries']))
+        starts = [query['start_ms'] for query in profile['queries']]
+        self.assertEqual(starts, sorted(starts))
+
+    def test_other_requests_not_profiled(self):
+        """Test the header is ignored for non staff and nothing is
+        profiled without it"""
+        self.assertNotIn('X-Profile-Id', self._get(self.user,
+                                                   HTTP_X_PROFILE='1'))
+        self.assertNotIn('X-Profile-Id', self._get(self.staff))
+        self.assertNotIn('X-Profile-Id', self.client.get(
+            RECIPES_URL, HTTP_X_PROFILE='1',
+            HTTP_AUTHORIZATION='Token invalid'
+        ))
+        self.assertEqual(profiling.list_profiles(), [])
+
+    @override_settings(PROFILING_SAMPLE_RATE=1)
+    def test_sampled_request_profiled(self):
+        """Test sampled requests are profiled"""
+        res = self._get(self.user)
+
+        profile = profiling.read_profile(res['X-Profile-Id'])
+        self.assertEqual(profile['reason'], 'sampled')
+
+    def test_ring_bounded(self):
+        """Test only the newest PROFILING_MAX_FILES profiles are kept"""
+        names = [self._get(self.staff, HTTP_X_PROFILE='1')['X-Profile-Id']
+                 for _ in range(5)]
+
+        self.assertEqual(profiling.list_profiles(), names[:-4:-1])
+        self.assertEqual(len(os.listdir(self.tmpdir)), 6)
+
+    def test_list_and_retrieve_profiles(self):
+        """Test staff can list and retrieve the profiles"""
+        name = self._get(self.staff, HTTP_X_PROFILE='1')['X-Profile-Id']
+
+        res = self._get(self.staff, PROFILES_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data), 1)
+        self.assertEqual(res.data[0]['name'], name)
+        self.assertNotIn('queries', res.data[0])
+
+        res = self._get(self.staff, reverse('core:profile', args=[name]))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn('queries', res.data)
+
+        for bad in ('1-00000000', '..', 'x'):
+            res = self._get(self.staff, reverse('core:profile', args=[bad]))
+            self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_profiles_staff_only(self):
+        """Test non staff can't list the profiles"""
+        res = self._get(self.user, PROFILES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    @override_settings(PROFILING_DIR='')
+    def test_middleware_unused_when_off(self):
+        """Test the middleware is left out without PROFILING_DIR"""
+        with self.assertRaises(MiddlewareNotUsed):
+            profiling.ProfilingMiddleware(lambda request: None)
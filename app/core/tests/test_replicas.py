@@ -0,0 +1,161 @@
+import os
+import tempfile
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connections
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe
+from core.replicas import (
+    ReplicaRouter, replica_reads, hit_counts, is_pinned_to_primary
+)
+
+RECIPES_URL = reverse('recipe:recipe-list')
+ME_URL = reverse('user:me')
+COOKABLE_URL = reverse('recipe:recipe-cookable')
+
+
+class ReplicaRouterTests(TestCase):
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+
+    @override_settings(REPLICA_DATABASES=['replica1', 'replica2'])
+    def test_reads_go_to_replicas_when_enabled(self):
+        """Test that only reads inside replica_reads use a replica"""
+        self.assertEqual(self.router.db_for_read(Recipe), 'default')
+        with replica_reads():
+            self.assertIn(
+                self.router.db_for_read(Recipe), ('replica1', 'replica2')
+            )
+            self.assertEqual(self.router.db_for_write(Recipe), 'default')
+        self.assertEqual(self.router.db_for_read(Recipe), 'default')
+
+    @override_settings(REPLICA_DATABASES=[])
+    def test_reads_use_default_without_replicas(self):
+        """Test that reads fall back to default when no replica exists"""
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(Recipe), 'default')
+
+    def test_migrations_only_on_default(self):
+        """Test that replicas are never migrated"""
+        self.assertTrue(self.router.allow_migrate('default', 'core'))
+        self.assertFalse(self.router.allow_migrate('replica1', 'core'))
+
+
+class SqliteReplicaTests(SimpleTestCase):
+    """Route reads to two real SQLite databases, as a local setup using
+    DB_REPLICA_ENGINE and DB_REPLICA_NAMES would"""
+    aliases = ('sqlite_replica1', 'sqlite_replica2')
+
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        User = get_user_model()
+        for alias in self.aliases:
+            connections.databases[alias] = {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': os.path.join(tmpdir.name, f'{alias}.sqlite3'),
+            }
+            connections.ensure_defaults(alias)
+            connections.prepare_test_settings(alias)
+            self.addCleanup(self._remove_alias, alias)
+            with connections[alias].schema_editor() as editor:
+                editor.create_model(User)
+            User.objects.using(alias).bulk_create(
+                [User(email=f'{alias}@ufc.br')]
+            )
+
+    def _remove_alias(self, alias):
+        connections[alias].close()
+        del connections[alias]
+        del connections.databases[alias]
+
+    def test_reads_routed_to_each_replica(self):
+        """Test each replica serves the reads it is picked for"""
+        emails = get_user_model().objects.values_list('email', flat=True)
+        with override_settings(REPLICA_DATABASES=list(self.aliases)):
+            for alias in self.aliases:
+                with patch('core.replicas.random.choice',
+                           return_value=alias), replica_reads():
+                    self.assertEqual(list(emails.all()), [f'{alias}@ufc.br'])
+
+
+# The replica is the default test database itself, so data written by the
+# test is visible and only the routing decision is being checked.
+@override_settings(REPLICA_DATABASES=['default'])
+class ReplicaRoutingApiTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            'test@ufc.br',
+            'testpass'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_safe_requests_read_from_replica(self):
+        """Test that listing recipes and the profile read from a replica"""
+        before = hit_counts()
+        self.client.get(RECIPES_URL)
+        self.client.get(ME_URL)
+
+        self.assertGreater(hit_counts()['replica'], before['replica'])
+
+    def test_reads_stick_to_primary_after_write(self):
+        """Test that a user reads their own writes from the primary"""
+        payload = {'title': 'Pie', 'time_minutes': 30, 'price': 5.00}
+        res = self.client.post(RECIPES_URL, payload)
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+        before = hit_counts()
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(len(res.data), 1)
+        self.assertEqual(hit_counts()['replica'], before['replica'])
+        self.assertGreater(hit_counts()['primary'], before['primary'])
+
+        # Once the sticky window is over reads go back to the replica
+        cache.clear()
+        self.client.get(RECIPES_URL)
+        self.assertGreater(hit_counts()['replica'], before['replica'])
+
+    def test_read_only_post_not_pinned(self):
+        """Test a POST that only reads, like cookable, reads from a replica
+        and doesn't send the user's next reads to the primary"""
+        before = hit_counts()
+        res = self.client.post(COOKABLE_URL, {'ingredients': [1]},
+                               format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertGreater(hit_counts()['replica'], before['replica'])
+        self.assertFalse(is_pinned_to_primary(self.user))
+
+    def test_etag_version_read_from_replica(self):
+        """Test a GET served by a replica takes its ETag version from that
+        replica, not from the user loaded by authentication"""
+        # Bumps the stored version, not the one of the client's user
+        Recipe.objects.create(user=self.user, title='Pie', time_minutes=30,
+                              price=5.00)
+        stored = get_user_model().objects.get(pk=self.user.pk).data_version
+        self.assertNotEqual(self.user.data_version, stored)
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res['ETag'].split('.')[1], str(stored))
+
+    def test_replica_picked_once_per_request(self):
+        """Test every read of a request goes to the same replica"""
+        router = ReplicaRouter()
+        with override_settings(REPLICA_DATABASES=['replica1', 'replica2']):
+            with replica_reads():
+                self.assertEqual(
+                    len({router.db_for_read(Recipe) for _ in range(20)}), 1
+                )
@@ -0,0 +1,124 @@
+from io import StringIO
+from unittest import skipUnless
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db.models.signals import post_delete
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag, Tombstone
+from core.shards import ShardRouter, assign_shard, use_shard
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+@override_settings(SHARD_DATABASES=['default', 'shard1'],
+                   NEW_USER_SHARDS=['default', 'shard1'])
+class ShardRouterTests(TestCase):
+
+    def setUp(self):
+        self.router = ShardRouter()
+
+    def test_recipe_data_routed_to_current_shard(self):
+        """Test that recipe models follow the shard of the request"""
+        self.assertIsNone(self.router.db_for_read(Recipe))
+        with use_shard('shard1'):
+            self.assertEqual(self.router.db_for_read(Recipe), 'shard1')
+            self.assertEqual(self.router.db_for_write(Tag), 'shard1')
+            self.assertEqual(
+                self.router.db_for_write(Recipe.tags.through), 'shard1'
+            )
+            # Users always stay on the default database
+            self.assertIsNone(self.router.db_for_read(get_user_model()))
+
+    def test_default_shard_left_to_next_router(self):
+        """Test that the default shard defers to the replica router"""
+        with use_shard('default'):
+            self.assertIsNone(self.router.db_for_read(Recipe))
+
+    def test_assign_shard(self):
+        """Test that new users are spread over the configured shards"""
+        shards = {assign_shard(f'user{i}@ufc.br') for i in range(20)}
+
+        self.assertEqual(shards, {'default', 'shard1'})
+        self.assertEqual(
+            assign_shard('test@ufc.br'), assign_shard('TEST@ufc.br')
+        )
+
+
+@skipUnless('shard1' in settings.SHARD_DATABASES,
+            'needs a second shard, see DB_SHARD_NAMES')
+class ShardedApiTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@ufc.br',
+            'testpass',
+            shard='shard1'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_recipes_stored_on_user_shard(self):
+        """Test that the api reads and writes the user's shard only"""
+        tag = Tag.objects.using('shard1').create(user=self.user, name='Vegan')
+        payload = {'title': 'Pie', 'time_minutes': 30, 'price': 5.00,
+                   'tags': [tag.id]}
+        res = self.client.post(RECIPES_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertFalse(Recipe.objects.using('default').exists())
+        recipe = Recipe.objects.for_user(self.user).get()
+        self.assertEqual(list(recipe.tags.all()), [tag])
+
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(len(res.data), 1)
+
+    def test_move_user_shard(self):
+        """Test moving a user's data to another shard"""
+        recipe = Recipe.objects.using('shard1').create(
+            user=self.user, title='Pie', time_minutes=30, price=5.00
+        )
+        recipe.tags.add(
+            Tag.objects.using('shard1').create(user=self.user, name='Vegan')
+        )
+
+        deleted = []
+
+        def receiver(sender, **kwargs):
+            deleted.append(sender)
+        post_delete.connect(receiver)
+        self.addCleanup(post_delete.disconnect, receiver)
+
+        call_command('move_user_shard', self.user.email, 'default',
+                     batch_size=1, stdout=StringIO())
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.shard, 'default')
+        # The old rows are deleted without going through the signals
+        self.assertEqual(deleted, [])
+        self.assertFalse(Tombstone.objects.using('shard1').exists())
+        self.assertFalse(Recipe.tags.through.objects.using('shard1').exists())
+        self.assertTrue(self.user.is_active)
+        self.assertFalse(Recipe.objects.using('shard1').exists())
+        moved = Recipe.objects.using('default').get(user=self.user)
+        self.assertEqual(
+            [tag.name for tag in moved.tags.all()], ['Vegan']
+        )
+        self.assertEqual(moved.tags.get().recipe_count, 1)
+
+    def test_delete_user_deletes_shard_data(self):
+        """Test that deleting a user removes its data on the shard"""
+        Recipe.objects.using('shard1').create(
+            user=self.user, title='Pie', time_minutes=30, price=5.00
+        )
+
+        self.user.delete()
+
+        self.assertFalse(Recipe.objects.using('shard1').exists())
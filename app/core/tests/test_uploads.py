@@ -0,0 +1,66 @@
+import struct
+from io import BytesIO
+
+from django.test import SimpleTestCase
+from PIL import Image
+
+from core.uploads import JpegHeader, SNIFF_SIZE
+
+
+def jpeg(size=(30, 20), app_segments=0, segment_size=60000):
+    """Return a JPEG preceded by app_segments APPn segments"""
+    image = BytesIO()
+    Image.new('RGB', size).save(image, format='JPEG')
+    data = image.getvalue()
+    segments = b''.join(
+        b'\xff' + bytes([0xe1 + i % 15]) +
+        struct.pack('>H', segment_size + 2) + b'\0' * segment_size
+        for i in range(app_segments)
+    )
+    return data[:2] + segments + data[2:]
+
+
+def feed(reader, data, chunk_size):
+    """Feed data in chunks until the header is complete and return it with
+    the largest unparsed tail seen"""
+    largest_tail = 0
+    for start in range(0, len(data), chunk_size):
+        header = reader.feed(data[start:start + chunk_size])
+        largest_tail = max(largest_tail, len(reader.tail))
+        if header is not None:
+            return header, largest_tail
+    return None, largest_tail
+
+
+class JpegHeaderTests(SimpleTestCase):
+
+    def test_header_parsed_once_complete(self):
+        """Test the kept header opens with the image's size, whatever the
+        chunk size"""
+        for chunk_size in (1, 7, 4096):
+            header, _ = feed(JpegHeader(), jpeg(), chunk_size)
+            with Image.open(BytesIO(header)) as image:
+                self.assertEqual((image.format, image.size),
+                                 ('JPEG', (30, 20)))
+
+    def test_metadata_skipped_unkept(self):
+        """Test large metadata segments are neither kept nor buffered"""
+        reader = JpegHeader()
+        header, largest_tail = feed(reader, jpeg(app_segments=40), 65536)
+
+        with Image.open(BytesIO(header)) as image:
+            self.assertEqual(image.size, (30, 20))
+        self.assertLess(len(header), 1024)
+        self.assertLess(largest_tail, 1024)
+
+    def test_invalid_rejected(self):
+        """Test broken segments and oversized headers raise ValueError"""
+        for data in (b'GIF89a', b'\xff\xd8' + b'\0' * 100,
+                     b'\xff\xd8\xff\xe1\x00\x01'):
+            with self.assertRaises(ValueError):
+                JpegHeader().feed(data)
+
+        # A kept segment can't grow past the sniff size
+        oversized = b'\xff\xd8\xff\xdb' + struct.pack('>H', SNIFF_SIZE - 1)
+        with self.assertRaises(ValueError):
+            JpegHeader().feed(oversized)
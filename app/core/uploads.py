@@ -0,0 +1,198 @@
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import (
+    InMemoryUploadedFile, TemporaryUploadedFile
+)
+from django.core.files.uploadhandler import FileUploadHandler
+from PIL import Image
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+# Room for the multipart boundaries and headers around the file
+MULTIPART_OVERHEAD = 16 * 1024
+
+# Headers longer than this aren't waited for; common formats need far less.
+# JPEGs may start with far more, as photos' EXIF and ICC segments come
+# first: those are skipped as they stream by (see JpegHeader) and only the
+# segments up to the start of scan count towards the limit.
+SNIFF_SIZE = 64 * 1024
+
+JPEG_START = b'\xff\xd8'
+# JPEG markers with no length, the metadata segments skipped unread and the
+# start of scan, which ends the header
+JPEG_STANDALONE = {0x01} | set(range(0xd0, 0xd8))
+JPEG_METADATA = set(range(0xe0, 0xf0)) | {0xfe}
+JPEG_SCAN = 0xda
+
+
+class JpegHeader:
+    """Walk a JPEG's segments as its chunks stream in.
+
+    Metadata segments are skipped by their length without being kept, so
+    they cost neither memory nor parsing however large they are. The other
+    segments up to the start of scan, which hold the quantization tables,
+    frame size and so on, are kept to be handed to Image.open once.
+    """
+
+    def __init__(self):
+        self.kept = [JPEG_START]
+        self.kept_size = len(JPEG_START)
+        # Unparsed bytes, at most one incomplete kept segment
+        self.tail = b''
+        # Bytes of a metadata segment still to come
+        self.skip = 0
+        self.started = False
+
+    def feed(self, data):
+        """Consume a chunk and return the header to parse once it is all
+        in, or None. Raises ValueError when the data isn't a JPEG or its
+        header would exceed SNIFF_SIZE."""
+        if self.skip:
+            skipped = min(self.skip, len(data))
+            self.skip -= skipped
+            data = data[skipped:]
+        buf = self.tail + data
+        pos = 0
+        if not self.started:
+            if len(buf) < len(JPEG_START):
+                self.tail = buf
+                return None
+            if not buf.startswith(JPEG_START):
+                raise ValueError('Not a JPEG')
+            pos, self.started = len(JPEG_START), True
+
+        while len(buf) - pos >= 2:
+            if buf[pos] != 0xff:
+                raise ValueError('No marker found')
+            marker = buf[pos + 1]
+            if marker == 0xff:
+                # Fill byte
+                pos += 1
+                continue
+            if marker in JPEG_STANDALONE:
+                pos += 2
+                continue
+            if len(buf) - pos < 4:
+                break
+            length = int.from_bytes(buf[pos + 2:pos + 4], 'big')
+            if length < 2:
+                raise ValueError('Invalid segment length')
+            end = pos + 2 + length
+            if marker in JPEG_METADATA:
+                self.skip = max(end - len(buf), 0)
+                pos = min(end, len(buf))
+                continue
+            if self.kept_size + 2 + length > SNIFF_SIZE:
+                raise ValueError('Header too long')
+            if end > len(buf):
+                break
+            self.kept.append(buf[pos:end])
+            self.kept_size += end - pos
+            pos = end
+            if marker == JPEG_SCAN:
+                return b''.join(self.kept)
+        self.tail = buf[pos:]
+        return None
+
+
+class UploadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'The upload is too large.'
+    default_code = 'upload_too_large'
+
+
+class ImageUploadHandler(FileUploadHandler):
+    """Upload handler checking images while they stream in.
+
+    The format and dimensions are read from the first bytes with
+    Image.open, which parses the header only; a JPEG's segments are walked
+    as they arrive and Image.open runs once its header is complete. A body
+    or file over RECIPE_IMAGE_MAX_SIZE, a format not allowed or more than
+    RECIPE_IMAGE_MAX_PIXELS pixels is rejected before the rest is read and
+    before anything is decoded. Uploads up to RECIPE_IMAGE_MEMORY_SIZE are
+    kept in memory, larger ones are spooled to a temp file.
+    """
+
+    def handle_raw_input(self, input_data, META, content_length, boundary,
+                         encoding=None):
+        # The client announced the size, so don't read any of it
+        if content_length > settings.RECIPE_IMAGE_MAX_SIZE + \
+                MULTIPART_OVERHEAD:
+            raise UploadTooLarge(self._too_large())
+        self.in_memory = content_length <= settings.RECIPE_IMAGE_MEMORY_SIZE
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.header = b''
+        self.jpeg = None
+        self.checked = False
+        if self.in_memory:
+            self.file = BytesIO()
+        else:
+            self.file = TemporaryUploadedFile(
+                self.file_name, self.content_type, 0, self.charset,
+                self.content_type_extra
+            )
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > settings.RECIPE_IMAGE_MAX_SIZE:
+            raise UploadTooLarge(self._too_large())
+        if not self.checked:
+            self._check_header(raw_data)
+        self.file.write(raw_data)
+
+    def _check_header(self, raw_data):
+        if self.jpeg is None and len(self.header) + len(raw_data) >= \
+                len(JPEG_START):
+            data = self.header + raw_data
+            if data.startswith(JPEG_START):
+                self.jpeg, self.header, raw_data = JpegHeader(), b'', data
+        if self.jpeg is not None:
+            try:
+                header = self.jpeg.feed(raw_data)
+            except ValueError:
+                self._reject('Upload a valid image.')
+            if header is None:
+                return
+        else:
+            self.header += raw_data
+            header = self.header
+
+        try:
+            with Image.open(BytesIO(header)) as image:
+                image_format, (width, height) = image.format, image.size
+        except Image.DecompressionBombError:
+            self._reject('The image has too many pixels.')
+        except Exception:
+            # Most likely the header isn't all there yet; a JPEG's is
+            if self.jpeg is not None or len(header) >= SNIFF_SIZE:
+                self._reject('Upload a valid image.')
+            return
+
+        if image_format not in settings.RECIPE_IMAGE_FORMATS:
+            self._reject(f'{image_format} images are not supported.')
+        if width * height > settings.RECIPE_IMAGE_MAX_PIXELS:
+            self._reject('The image has too many pixels.')
+        self.checked = True
+        self.header = b''
+        self.jpeg = None
+
+    def _reject(self, message):
+        raise ValidationError({self.field_name: [message]})
+
+    def _too_large(self):
+        return f'Images may be at most {settings.RECIPE_IMAGE_MAX_SIZE} ' \
+               f'bytes.'
+
+    def file_complete(self, file_size):
+        if not self.checked:
+            self._reject('Upload a valid image.')
+        self.file.seek(0)
+        if not self.in_memory:
+            self.file.size = file_size
+            return self.file
+        return InMemoryUploadedFile(
+            self.file, self.field_name, self.file_name, self.content_type,
+            file_size, self.charset, self.content_type_extra
+        )
@@ -0,0 +1,10 @@
+from django.urls import path
+from core import views
+
+app_name = 'core'
+
+urlpatterns = [
+    path('profiles/', views.ProfileListView.as_view(), name='profiles'),
+    path('profiles/<str:name>/', views.ProfileDetailView.as_view(),
+         name='profile'),
+]
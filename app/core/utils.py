@@ -0,0 +1,83 @@
+from django.db import connections, transaction
+from django.db.models import Count, Min, OuterRef, Subquery, F
+from django.db.models.functions import Coalesce, Lower
+
+
+def find_duplicate_names(model, using='default'):
+    """Return the groups of a model's rows sharing a user and a name when
+    case is ignored, with the lowest id of each group as the one to keep"""
+    return (
+        model.objects.using(using)
+        .annotate(lower_name=Lower('name'))
+        .values('user_id', 'lower_name')
+        .annotate(count=Count('id'), keep_id=Min('id'))
+        .filter(count__gt=1)
+        .order_by('user_id', 'lower_name')
+    )
+
+
+def merge_duplicate_names(model, through, column, using='default'):
+    """Fold every duplicate of model into the kept row of its group.
+
+    `through` is the Recipe m2m through model pointing at model via
+    `column`. Recipe links are rewritten in bulk: the kept row is linked
+    to every recipe of its duplicates, then the duplicates' links and the
+    duplicates themselves are deleted. Returns the number of rows removed.
+    """
+    removed = 0
+    for group in find_duplicate_names(model, using):
+        with transaction.atomic(using=using):
+            duplicate_ids = list(
+                model.objects.using(using)
+                .annotate(lower_name=Lower('name'))
+                .filter(user_id=group['user_id'],
+                        lower_name=group['lower_name'])
+                .exclude(id=group['keep_id'])
+                .values_list('id', flat=True)
+            )
+            links = through.objects.using(using) \
+                .filter(**{f'{column}__in': duplicate_ids})
+            recipe_ids = links.values_list('recipe_id', flat=True).distinct()
+            through.objects.using(using).bulk_create(
+                [through(recipe_id=recipe_id, **{column: group['keep_id']})
+                 for recipe_id in recipe_ids],
+                ignore_conflicts=True
+            )
+            links.delete()
+            model.objects.using(using).filter(id__in=duplicate_ids).delete()
+            removed += len(duplicate_ids)
+    return removed
+
+
+def reconcile_recipe_counts(model, through, column, using='default'):
+    """Recompute model.recipe_count from the through table where it has
+    drifted and return the number of rows fixed"""
+    counts = Subquery(
+        through.objects.using(using)
+        .filter(**{column: OuterRef('pk')})
+        .order_by()
+        .values(column)
+        .annotate(count=Count('*'))
+        .values('count')
+    )
+    drifted = model.objects.using(using).annotate(actual=Coalesce(counts, 0)) \
+        .exclude(recipe_count=F('actual'))
+    ids = list(drifted.values_list('id', flat=True))
+    if ids:
+        model.objects.using(using).filter(id__in=ids) \
+            .update(recipe_count=Coalesce(counts, 0))
+    return len(ids)
+
+
+def delete_ids(model, alias, column, ids):
+    """Delete the rows of model whose column is in ids with one statement,
+    skipping the collector and its signals, and return the count"""
+    connection = connections[alias]
+    table = connection.ops.quote_name(model._meta.db_table)
+    column = connection.ops.quote_name(column)
+    placeholders = ', '.join(['%s'] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {table} WHERE {column} IN ({placeholders})', ids
+        )
+        return cursor.rowcount
@@ -0,0 +1,132 @@
+import zlib
+from contextlib import contextmanager
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+
+from core.replicas import current_replica
+
+
+class PreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = 'The data changed since it was fetched.'
+    default_code = 'precondition_failed'
+
+
+class NotModified(Exception):
+    """Raised to answer a request with 304 before its handler runs"""
+
+
+def bump_data_version(user_id):
+    """Mark the user's recipe data as changed"""
+    get_user_model().objects.filter(pk=user_id) \
+        .update(data_version=F('data_version') + 1)
+
+
+def make_etag(request, version):
+    """Return the ETag of the url requested at a data version. The url is
+    part of it as each one shows a different slice of the user's data."""
+    digest = zlib.crc32(request.get_full_path().encode())
+    return f'W/"{request.user.pk}.{version}.{digest:x}"'
+
+
+def _opaque(etag):
+    etag = etag.strip()
+    return etag[2:] if etag.startswith('W/') else etag
+
+
+def etag_matches(header, etag):
+    """Compare an If-None-Match or If-Match header weakly to etag"""
+    return header is not None and (
+        header.strip() == '*' or
+        _opaque(etag) in {_opaque(tag) for tag in header.split(',')}
+    )
+
+
+class VersionedViewMixin:
+    """View mixin making requests conditional on the user's data version.
+
+    Every response carries an ETag made from the version. A GET matching
+    If-None-Match gets a 304 straight after authentication, before the
+    queryset or serializer run. A write with If-Match only proceeds if the
+    version is still the one the client saw: a stale one gets a 412 up
+    front, and the version is claimed atomically in the write's
+    transaction (see versioned_write), so one of two racing writers gets a
+    412 and a write that fails doesn't use the version up.
+
+    Put it before ReplicaReadMixin: reads served by a replica take the
+    version from that replica too, so a lagging replica can't hand out a
+    current ETag for a stale body.
+    """
+    if_match = False
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if current_replica() is not None:
+            request.user.data_version = get_user_model().objects \
+                .filter(pk=request.user.pk) \
+                .values_list('data_version', flat=True).first()
+        etag = make_etag(request, request.user.data_version)
+        if request.method in ('GET', 'HEAD'):
+            if etag_matches(request.META.get('HTTP_IF_NONE_MATCH'), etag):
+                raise NotModified()
+        elif 'HTTP_IF_MATCH' in request.META:
+            if not etag_matches(request.META['HTTP_IF_MATCH'], etag):
+                raise PreconditionFailed()
+            self.if_match = True
+
+    @contextmanager
+    def versioned_write(self):
+        """Run a validated write in a transaction claiming the If-Match
+        version first"""
+        if not self.if_match:
+            yield
+            return
+        user = self.request.user
+        with transaction.atomic(), transaction.atomic(using=user.shard):
+            self._claim_version(user)
+            yield
+
+    def perform_update(self, serializer):
+        with self.versioned_write():
+            super().perform_update(serializer)
+
+    def perform_destroy(self, instance):
+        with self.versioned_write():
+            super().perform_destroy(instance)
+
+    def _claim_version(self, user):
+        claimed = get_user_model().objects \
+            .filter(pk=user.pk, data_version=user.data_version) \
+            .update(data_version=F('data_version') + 1)
+        if not claimed:
+            raise PreconditionFailed()
+        user.data_version += 1
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            etag = make_etag(self.request, self.request.user.data_version)
+            return Response(status=status.HTTP_304_NOT_MODIFIED,
+                            headers={'ETag': etag})
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        if not status.is_success(response.status_code) or \
+                not request.user.is_authenticated:
+            return response
+
+        version = request.user.data_version
+        if request.method in ('PUT', 'PATCH'):
+            # Hand out the version after this write for the next If-Match
+            version = get_user_model().objects.filter(pk=request.user.pk) \
+                .values_list('data_version', flat=True).first()
+        if request.method in ('GET', 'HEAD', 'PUT', 'PATCH'):
+            response['ETag'] = make_etag(request, version)
+        return response
@@ -0,0 +1,42 @@
+from django.http import Http404
+from rest_framework import authentication, permissions
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from core import profiling
+
+# Fields of a profile shown in the listing
+SUMMARY_FIELDS = ('name', 'reason', 'created_at', 'method', 'path', 'status',
+                  'duration_ms', 'sql_ms')
+
+
+class ProfileView(APIView):
+    """Base view of the stored request profiles, for staff only"""
+    authentication_classes = (authentication.TokenAuthentication,)
+    permission_classes = (permissions.IsAdminUser,)
+
+
+class ProfileListView(ProfileView):
+    """List the stored request profiles, newest first"""
+
+    def get(self, request):
+        summaries = []
+        for name in profiling.list_profiles():
+            profile = profiling.read_profile(name)
+            # Pruned since it was listed
+            if profile is not None:
+                summaries.append(
+                    {field: profile.get(field) for field in SUMMARY_FIELDS}
+                )
+        return Response(summaries)
+
+
+class ProfileDetailView(ProfileView):
+    """Retrieve a request profile with its SQL timeline and slowest
+    functions"""
+
+    def get(self, request, name):
+        profile = profiling.read_profile(name)
+        if profile is None:
+            raise Http404
+        return Response(profile)
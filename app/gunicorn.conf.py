@@ -0,0 +1,40 @@
+"""Gunicorn settings for serving the api: `gunicorn app.wsgi`
+
+Loaded automatically from the working directory. Every value can be
+overridden from the environment.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+
+# Prefork sync workers; one per core plus one keeps the cores busy while a
+# worker waits on the db
+workers = int(os.environ.get(
+    'WEB_CONCURRENCY', multiprocessing.cpu_count() + 1
+))
+
+# Load Django in the master before forking, so the workers share the pages
+# of the imported code instead of each importing it again
+preload_app = bool(int(os.environ.get('GUNICORN_PRELOAD', 1)))
+
+# Recycle a worker after this many requests, plus jitter so they don't all
+# restart at once, to bound memory creep
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 100))
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+# Request logs go to stdout with the time taken in microseconds
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+access_log_format = '%(h)s "%(r)s" %(s)s %(b)s %(D)s'
+
+
+def pre_fork(server, worker):
+    """Close any db connection the master opened while preloading, so no
+    worker inherits a socket shared with its siblings"""
+    from django.db import connections
+
+    connections.close_all()
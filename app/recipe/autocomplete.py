@@ -0,0 +1,96 @@
+import heapq
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models.functions import Lower
+
+# Sorts after any character that can follow a prefix
+_LAST_CHAR = '\U0010ffff'
+
+
+def _rank(entry):
+    # Most used first, then by name
+    lower_name, pk, name, recipe_count = entry
+    return -recipe_count, lower_name, pk
+
+
+class PrefixIndex:
+    """One user's tag or ingredient names, sorted for prefix lookups.
+
+    The names matching a prefix are a contiguous slice found by bisection;
+    only that slice is ranked.
+    """
+
+    def __init__(self, rows, version):
+        self.version = version
+        self.entries = sorted(
+            (name.lower(), pk, name, recipe_count)
+            for pk, name, recipe_count in rows
+        )
+        self.keys = [entry[0] for entry in self.entries]
+
+    def complete(self, prefix, limit):
+        """Return the (id, name, recipe_count) of the top limit matches"""
+        prefix = prefix.lower()
+        start = bisect_left(self.keys, prefix)
+        end = bisect_left(self.keys, prefix + _LAST_CHAR, start)
+        return [
+            (pk, name, recipe_count) for _, pk, name, recipe_count
+            in heapq.nsmallest(limit, self.entries[start:end], key=_rank)
+        ]
+
+
+def complete_in_db(queryset, prefix, limit):
+    """Rank the matches in the database. Filtering on lower(name) rather
+    than name__istartswith, which uses upper(), lets the prefix index on
+    (user_id, lower(name)) serve it."""
+    return list(
+        queryset.annotate(lower_name=Lower('name'))
+        .filter(lower_name__startswith=prefix.lower())
+        .order_by('-recipe_count', 'lower_name', 'id')
+        .values_list('id', 'name', 'recipe_count')[:limit]
+    )
+
+
+_indexes = OrderedDict()
+_lookups = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def complete(user, queryset, prefix, limit):
+    """Return the top matches among the user's objs in queryset.
+
+    Users who looked up at least AUTOCOMPLETE_INDEX_MIN_LOOKUPS times get
+    a PrefixIndex kept in memory, rebuilt when their data version changes.
+    Everyone else, and everyone when AUTOCOMPLETE_INDEX_MAX_USERS is 0, is
+    answered by the database.
+    """
+    max_users = settings.AUTOCOMPLETE_INDEX_MAX_USERS
+    if not max_users:
+        return complete_in_db(queryset, prefix, limit)
+
+    key = (user.id, queryset.model._meta.label_lower)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is not None and index.version == user.data_version:
+            _indexes.move_to_end(key)
+            return index.complete(prefix, limit)
+        lookups = _lookups.pop(key, 0) + 1
+        _lookups[key] = lookups
+        while len(_lookups) > max_users * 10:
+            _lookups.popitem(last=False)
+    if index is None and lookups < settings.AUTOCOMPLETE_INDEX_MIN_LOOKUPS:
+        return complete_in_db(queryset, prefix, limit)
+
+    index = PrefixIndex(
+        queryset.values_list('id', 'name', 'recipe_count'),
+        user.data_version
+    )
+    with _indexes_lock:
+        _indexes[key] = index
+        _indexes.move_to_end(key)
+        while len(_indexes) > max_users:
+            _indexes.popitem(last=False)
+    return index.complete(prefix, limit)
@@ -0,0 +1,185 @@
+"""Set-based changes to many of a user's recipes at once.
+
+Each function runs a fixed number of statements in one transaction,
+however many rows it touches. They bypass the per-object signals, so they
+keep recipe_count, updated_at, the tombstones, the data version and the
+similarity index in step themselves.
+"""
+from django.db import connections, transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from core.models import Tag, Ingredient, Recipe, Tombstone
+from core.utils import delete_ids
+from core.versions import bump_data_version
+from recipe.similarity import TAG, INGREDIENT, feature, record_change
+
+# Request key -> through model, counted model, its column on the through
+# table and its similarity feature kind
+LINKS = {
+    'tags': (Recipe.tags.through, Tag, 'tag_id', TAG),
+    'ingredients': (Recipe.ingredients.through, Ingredient,
+                    'ingredient_id', INGREDIENT),
+}
+
+
+def _in(ids):
+    return ', '.join(['%s'] * len(ids))
+
+
+def _recount(through, counted, column, ids, using):
+    """Set recipe_count of the counted rows in ids from the through table"""
+    counts = Subquery(
+        through.objects.using(using)
+        .filter(**{column: OuterRef('pk')})
+        .order_by()
+        .values(column)
+        .annotate(count=Count('*'))
+        .values('count')
+    )
+    counted.objects.using(using).filter(id__in=ids) \
+        .update(recipe_count=Coalesce(counts, 0))
+
+
+def _touch(recipe_ids, using):
+    Recipe.objects.using(using).filter(id__in=recipe_ids) \
+        .update(updated_at=timezone.now())
+
+
+def _changed(user, apply, using):
+    """Invalidate the ETags and update the similarity index on commit"""
+    bump_data_version(user.pk)
+    transaction.on_commit(lambda: record_change(user.pk, apply), using=using)
+
+
+def add_links(user, recipe_ids, links):
+    """Link every recipe to every id of links, a dict of the LINKS keys to
+    ids, and return how many links were added per key.
+
+    The ids must be the user's; existing links are left alone.
+    """
+    using = user.shard
+    connection = connections[using]
+    quote_name = connection.ops.quote_name
+    recipes = quote_name(Recipe._meta.db_table)
+    added = {}
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        for key, ids in links.items():
+            through, counted, column, _ = LINKS[key]
+            table = quote_name(through._meta.db_table)
+            linked = quote_name(column)
+            cursor.execute(
+                f'INSERT INTO {table} (recipe_id, {linked}) '
+                f'SELECT r.id, c.id '
+                f'FROM {recipes} r, {quote_name(counted._meta.db_table)} c '
+                f'WHERE r.id IN ({_in(recipe_ids)}) '
+                f'AND c.id IN ({_in(ids)}) '
+                f'AND NOT EXISTS (SELECT 1 FROM {table} l '
+                f'WHERE l.recipe_id = r.id AND l.{linked} = c.id)',
+                [*recipe_ids, *ids]
+            )
+            added[key] = cursor.rowcount
+            if added[key]:
+                _recount(through, counted, column, ids, using)
+
+        if any(added.values()):
+            _touch(recipe_ids, using)
+            feats = {feature(LINKS[key][3], pk)
+                     for key, ids in links.items() for pk in ids}
+            _changed(user, lambda index: index.add_features_many(
+                recipe_ids, feats
+            ), using)
+    return added
+
+
+def remove_links(user, recipe_ids, links):
+    """Unlink the recipes from the ids of links and return how many links
+    were removed per key"""
+    using = user.shard
+    connection = connections[using]
+    quote_name = connection.ops.quote_name
+    removed = {}
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        for key, ids in links.items():
+            through, counted, column, _ = LINKS[key]
+            cursor.execute(
+                f'DELETE FROM {quote_name(through._meta.db_table)} '
+                f'WHERE recipe_id IN ({_in(recipe_ids)}) '
+                f'AND {quote_name(column)} IN ({_in(ids)})',
+                [*recipe_ids, *ids]
+            )
+            removed[key] = cursor.rowcount
+            if removed[key]:
+                _recount(through, counted, column, ids, using)
+
+        if any(removed.values()):
+            _touch(recipe_ids, using)
+            feats = {feature(LINKS[key][3], pk)
+                     for key, ids in links.items() for pk in ids}
+            _changed(user, lambda index: [
+                index.remove_features(pk, feats) for pk in recipe_ids
+            ], using)
+    return removed
+
+
+def delete_recipes(user, recipe_ids):
+    """Delete the recipes, which must be the user's, and return how many
+    went. Their images are deleted once the transaction commits."""
+    using = user.shard
+    connection = connections[using]
+    quote_name = connection.ops.quote_name
+    images = list(
+        Recipe.objects.using(using).filter(id__in=recipe_ids)
+        .exclude(image='').values_list('image', flat=True)
+    )
+    with transaction.atomic(using=using):
+        linked = {
+            key: list(
+                through.objects.using(using)
+                .filter(recipe_id__in=recipe_ids)
+                .values_list(column, flat=True).distinct()
+            )
+            for key, (through, _, column, _) in LINKS.items()
+        }
+        with connection.cursor() as cursor:
+            # Tombstones for the sync endpoint, straight from the rows
+            cursor.execute(
+                f'INSERT INTO {quote_name(Tombstone._meta.db_table)} '
+                f'(user_id, kind, object_id, deleted_at) '
+                f'SELECT user_id, %s, id, %s '
+                f'FROM {quote_name(Recipe._meta.db_table)} '
+                f'WHERE id IN ({_in(recipe_ids)})',
+                [Tombstone.RECIPE,
+                 connection.ops.adapt_datetimefield_value(timezone.now()),
+                 *recipe_ids]
+            )
+        for through, _, _, _ in LINKS.values():
+            delete_ids(through, using, 'recipe_id', recipe_ids)
+        deleted = delete_ids(Recipe, using, 'id', recipe_ids)
+        for key, (through, counted, column, _) in LINKS.items():
+            if linked[key]:
+                _recount(through, counted, column, linked[key], using)
+
+        if deleted:
+            _changed(user, lambda index: [
+                index.remove_recipe(pk) for pk in recipe_ids
+            ], using)
+            storage = Recipe._meta.get_field('image').storage
+            transaction.on_commit(
+                lambda: [storage.delete(image) for image in images],
+                using=using
+            )
+    return deleted
+
+
+def update_recipes(user, recipe_ids, fields):
+    """Set the same field values on every recipe and return how many were
+    updated"""
+    using = user.shard
+    with transaction.atomic(using=using):
+        updated = Recipe.objects.using(using).filter(id__in=recipe_ids) \
+            .update(updated_at=timezone.now(), **fields)
+        if updated:
+            bump_data_version(user.pk)
+    return updated
@@ -1,4 +1,8 @@
+from datetime import datetime, timezone
+
+from django.core.exceptions import ValidationError as DjangoValidationError
 from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
 
 from core.models import Tag, Ingredient, Recipe
 
@@ -21,16 +25,94 @@ class IngredientSerializer(serializers.ModelSerializer):
         read_only_fields = ('id',)
 
 
+class AutocompleteQuerySerializer(serializers.Serializer):
+    """Validate the query params of the autocomplete endpoints"""
+    q = serializers.CharField(max_length=255)
+    limit = serializers.IntegerField(min_value=1, max_value=50, default=10)
+
+
+class RecipeAttrFilterSerializer(serializers.Serializer):
+    """Validate the query params of the tag and ingredient lists"""
+    assigned_only = serializers.BooleanField(default=False)
+    ordering = serializers.ChoiceField(choices=(), default='-name')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Only the orderings the view has an index for
+        self.fields['ordering'].choices = list(self.context['view'].orderings)
+
+
+class AutocompleteMatchSerializer(serializers.Serializer):
+    """Serializer for a tag or ingredient matching a prefix"""
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    recipe_count = serializers.IntegerField()
+
+
+class BatchedManyRelatedField(serializers.ManyRelatedField):
+    """Validate a list of PKs with one query instead of one per PK"""
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+
+        child = self.child_relation
+        queryset = child.get_queryset()
+        pk_field = queryset.model._meta.pk
+        errors = {}
+        pks = []
+        for index, item in enumerate(data):
+            try:
+                if isinstance(item, bool):
+                    raise TypeError
+                pks.append((index, item, pk_field.to_python(item)))
+            except (TypeError, DjangoValidationError):
+                errors[index] = [child.error_messages['incorrect_type']
+                                 .format(data_type=type(item).__name__)]
+
+        objs = queryset.in_bulk({pk for _, _, pk in pks})
+        for index, item, pk in pks:
+            if pk not in objs:
+                errors[index] = [child.error_messages['does_not_exist']
+                                 .format(pk_value=item)]
+        if errors:
+            raise serializers.ValidationError(errors)
+
+        return [objs[pk] for _, _, pk in pks]
+
+
+class UserPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """PK field only accepting objects owned by the request user"""
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BatchedManyRelatedField(**list_kwargs)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        request = self.context.get('request')
+        if request is None:
+            return queryset.none()
+        return queryset.filter(user=request.user)
+
+
 # 63
 class RecipeSerializer(serializers.ModelSerializer):
     """Serialize a recipe"""
     # Needed for related models. Serializers creates a PK and queryset lists
-    # only the PK's that hold the relation, not the full recipe.
-    ingredients = serializers.PrimaryKeyRelatedField(
+    # only the PK's that hold the relation, not the full recipe. The ids are
+    # checked in one query against the auth user's own objects.
+    ingredients = UserPrimaryKeyRelatedField(
         many=True,
         queryset=Ingredient.objects.all()
     )
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = UserPrimaryKeyRelatedField(
         many=True,
         queryset=Tag.objects.all()
     )
@@ -55,3 +137,172 @@ class RecipeImageSerializer(serializers.ModelSerializer):
         model = Recipe
         fields = ('id', 'image')
         read_only_fields = ('id',)
+
+
+class RecipeFilterSerializer(serializers.Serializer):
+    """Validate the range filters and ordering of the recipe list"""
+    time_minutes_min = serializers.IntegerField(min_value=0, required=False)
+    time_minutes_max = serializers.IntegerField(min_value=0, required=False)
+    price_min = serializers.DecimalField(
+        max_digits=5, decimal_places=2, min_value=0, required=False
+    )
+    price_max = serializers.DecimalField(
+        max_digits=5, decimal_places=2, min_value=0, required=False
+    )
+    ordering = serializers.CharField(required=False)
+
+    def validate_ordering(self, value):
+        """Only allow the orderings the view has an index for"""
+        orderings = self.context['view'].orderings
+        if value not in orderings:
+            raise serializers.ValidationError(
+                f'Expected one of {", ".join(orderings)}.'
+            )
+        return value
+
+    def validate(self, attrs):
+        for field in ('time_minutes', 'price'):
+            low = attrs.get(f'{field}_min')
+            high = attrs.get(f'{field}_max')
+            if low is not None and high is not None and low > high:
+                raise serializers.ValidationError(
+                    {f'{field}_min': f'Must not exceed {field}_max.'}
+                )
+        return attrs
+
+
+class SimilarRecipesQuerySerializer(serializers.Serializer):
+    """Validate the query params of the similar recipes endpoint"""
+    metric = serializers.ChoiceField(
+        choices=('jaccard', 'cosine'), default='jaccard'
+    )
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=10)
+
+
+class SimilarRecipeSerializer(RecipeSerializer):
+    """Serialize a recipe along with its similarity score"""
+    score = serializers.FloatField(read_only=True)
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + ('score',)
+
+
+class CookableRecipesSerializer(serializers.Serializer):
+    """Validate the body of the cookable recipes endpoint"""
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False, max_length=500
+    )
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=20)
+
+
+class CookableRecipeSerializer(RecipeSerializer):
+    """Serialize a recipe with the share of its ingredients at hand and
+    the ids of those missing"""
+    coverage = serializers.FloatField(read_only=True)
+    missing = serializers.ListField(
+        child=serializers.IntegerField(), read_only=True
+    )
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + ('coverage', 'missing')
+
+
+class ShoppingListSerializer(serializers.Serializer):
+    """Validate the recipe ids a shopping list is built from"""
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False, max_length=500
+    )
+
+
+class BulkRecipesSerializer(serializers.Serializer):
+    """Validate the recipe ids a bulk change applies to"""
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False, max_length=500
+    )
+
+
+class BulkLinksSerializer(BulkRecipesSerializer):
+    """Validate the tags and ingredients linked to or unlinked from many
+    recipes, which must be the auth user's"""
+    tags = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        max_length=100, default=list
+    )
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        max_length=100, default=list
+    )
+
+    def _validate_owned(self, model, ids):
+        ids = sorted(set(ids))
+        owned = set(
+            model.objects.filter(user=self.context['request'].user,
+                                 id__in=ids)
+            .values_list('id', flat=True)
+        ) if ids else set()
+        unknown = [pk for pk in ids if pk not in owned]
+        if unknown:
+            raise serializers.ValidationError(
+                f'Invalid pk "{unknown[0]}" - object does not exist.'
+            )
+        return ids
+
+    def validate_tags(self, value):
+        return self._validate_owned(Tag, value)
+
+    def validate_ingredients(self, value):
+        return self._validate_owned(Ingredient, value)
+
+    def validate(self, attrs):
+        if not attrs['tags'] and not attrs['ingredients']:
+            raise serializers.ValidationError(
+                'Give tags or ingredients to change.'
+            )
+        return attrs
+
+
+class BulkRecipeFieldsSerializer(serializers.ModelSerializer):
+    """Validate the field values set on many recipes"""
+
+    class Meta:
+        model = Recipe
+        fields = ('title', 'time_minutes', 'price', 'link')
+        extra_kwargs = {
+            'title': {'required': False},
+            'time_minutes': {'required': False},
+            'price': {'required': False},
+        }
+
+
+class BulkUpdateSerializer(BulkRecipesSerializer):
+    """Validate a bulk update of recipe fields"""
+    values = BulkRecipeFieldsSerializer()
+
+    def validate_values(self, value):
+        if not value:
+            raise serializers.ValidationError('Give fields to update.')
+        return value
+
+
+class ShoppingListItemSerializer(serializers.Serializer):
+    """Serialize an ingredient with the recipes needing it"""
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    recipes = serializers.ListField(child=serializers.IntegerField())
+
+
+class SyncQuerySerializer(serializers.Serializer):
+    """Validate the cursor of the sync endpoint"""
+    since = serializers.CharField(required=False)
+
+    def validate_since(self, value):
+        """Return the (shard, time) a cursor was issued for"""
+        shard, _, micros = value.partition(':')
+        try:
+            since = datetime.fromtimestamp(int(micros) / 1e6, timezone.utc)
+        except (ValueError, OverflowError, OSError):
+            raise serializers.ValidationError('Invalid cursor.')
+        return shard, since
@@ -0,0 +1,84 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_save, post_delete
+from django.dispatch import receiver
+
+from core.models import Tag, Ingredient, Recipe
+from recipe.similarity import TAG, INGREDIENT, feature, record_change
+
+# Through model -> (feature kind, its column on the through table)
+KINDS = {
+    Recipe.tags.through: (TAG, 'tag_id'),
+    Recipe.ingredients.through: (INGREDIENT, 'ingredient_id'),
+}
+
+
+def _on_commit(user_id, apply, using):
+    """Update the similarity index once the change is committed"""
+    transaction.on_commit(lambda: record_change(user_id, apply), using=using)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def update_similarity_links(sender, instance, action, reverse, pk_set, using,
+                            **kwargs):
+    """Mirror tag and ingredient link changes in the similarity index"""
+    kind, column = KINDS[sender]
+    if not reverse:
+        recipe_id = instance.pk
+        if action == 'post_add' and pk_set:
+            feats = {feature(kind, pk) for pk in pk_set}
+            _on_commit(instance.user_id,
+                       lambda index: index.add_features(recipe_id, feats),
+                       using)
+        elif action == 'post_remove' and pk_set:
+            feats = {feature(kind, pk) for pk in pk_set}
+            _on_commit(instance.user_id,
+                       lambda index: index.remove_features(recipe_id, feats),
+                       using)
+        elif action == 'post_clear':
+            _on_commit(instance.user_id,
+                       lambda index: index.clear_features(recipe_id, kind),
+                       using)
+        return
+
+    # tag.recipe_set changes: the recipes gain or lose a single feature
+    key = feature(kind, instance.pk)
+    if action == 'pre_clear':
+        recipe_ids = list(
+            sender.objects.using(using)
+            .filter(**{column: instance.pk})
+            .values_list('recipe_id', flat=True)
+        )
+        _on_commit(instance.user_id,
+                   lambda index: [index.remove_features(pk, {key})
+                                  for pk in recipe_ids],
+                   using)
+    elif action in ('post_add', 'post_remove') and pk_set:
+        method = 'add_features' if action == 'post_add' else 'remove_features'
+        recipe_ids = list(pk_set)
+        _on_commit(instance.user_id,
+                   lambda index: [getattr(index, method)(pk, {key})
+                                  for pk in recipe_ids],
+                   using)
+
+
+@receiver(post_save, sender=Recipe)
+def add_similarity_recipe(sender, instance, created, using, **kwargs):
+    if created:
+        recipe_id = instance.pk
+        _on_commit(instance.user_id,
+                   lambda index: index.add_recipe(recipe_id), using)
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_similarity_recipe(sender, instance, using, **kwargs):
+    recipe_id = instance.pk
+    _on_commit(instance.user_id,
+               lambda index: index.remove_recipe(recipe_id), using)
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def drop_similarity_feature(sender, instance, using, **kwargs):
+    key = feature(TAG if sender is Tag else INGREDIENT, instance.pk)
+    _on_commit(instance.user_id, lambda index: index.drop_feature(key), using)
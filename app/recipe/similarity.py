@@ -0,0 +1,306 @@
+import random
+import threading
+from collections import OrderedDict, defaultdict
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from core.models import Recipe
+
+# Tags and ingredients share one feature space: tag t is feature 2t and
+# ingredient i is feature 2i + 1
+TAG, INGREDIENT = 0, 1
+
+
+def feature(kind, pk):
+    return 2 * pk + kind
+
+
+class RecipeSimilarityIndex:
+    """In-memory tag/ingredient index over one user's recipes.
+
+    Conceptually a sparse recipes x features matrix stored column-wise:
+    each feature maps to the sorted array of rows (recipes) having it.
+    Scoring a recipe against all others is a sparse matrix-vector product,
+    done with one np.bincount over the postings of the recipe's features.
+    The ingredient postings double as the inverted index used to find the
+    recipes cookable from a set of ingredients.
+    """
+
+    def __init__(self, version=None):
+        self.version = version
+        self.lock = threading.Lock()
+        self.rows = {}
+        self.recipe_ids = np.full(16, -1, dtype=np.int64)
+        self.sizes = np.zeros(16, dtype=np.int32)
+        self.ingredient_counts = np.zeros(16, dtype=np.int32)
+        self.features = []
+        self.postings = {}
+
+    @classmethod
+    def build(cls, recipe_ids, links, version=None):
+        """Build the index from recipe ids and (recipe_id, feature) pairs"""
+        index = cls(version)
+        recipe_ids = np.asarray(sorted(recipe_ids), dtype=np.int64)
+        n = len(recipe_ids)
+        index.recipe_ids = np.concatenate(
+            [recipe_ids, np.full(max(16, n), -1, dtype=np.int64)]
+        )
+        index.sizes = np.zeros(len(index.recipe_ids), dtype=np.int32)
+        index.ingredient_counts = np.zeros_like(index.sizes)
+        index.rows = {pk: row for row, pk in enumerate(recipe_ids.tolist())}
+        index.features = [set() for _ in range(n)]
+
+        links = np.asarray(links, dtype=np.int64).reshape(-1, 2)
+        if len(links):
+            rows = np.searchsorted(recipe_ids, links[:, 0]).astype(np.int32)
+            feats = links[:, 1]
+            index.sizes[:n] = np.bincount(rows, minlength=n)
+            index.ingredient_counts[:n] = np.bincount(
+                rows[feats % 2 == INGREDIENT], minlength=n
+            )
+            order = np.argsort(feats, kind='stable')
+            feats, rows = feats[order], rows[order]
+            keys, starts = np.unique(feats, return_index=True)
+            groups = np.split(rows, starts[1:])
+            for key, postings in zip(keys.tolist(), groups):
+                index.postings[key] = postings
+                for row in postings.tolist():
+                    index.features[row].add(key)
+        return index
+
+    def add_recipe(self, recipe_id):
+        if recipe_id in self.rows:
+            return
+        row = len(self.features)
+        if row == len(self.recipe_ids):
+            self.recipe_ids = np.concatenate(
+                [self.recipe_ids, np.full(row, -1, dtype=np.int64)]
+            )
+            self.sizes = np.concatenate(
+                [self.sizes, np.zeros(row, dtype=np.int32)]
+            )
+            self.ingredient_counts = np.concatenate(
+                [self.ingredient_counts, np.zeros(row, dtype=np.int32)]
+            )
+        self.recipe_ids[row] = recipe_id
+        self.rows[recipe_id] = row
+        self.features.append(set())
+
+    def remove_recipe(self, recipe_id):
+        """Drop a recipe; its row stays allocated but never matches"""
+        row = self.rows.pop(recipe_id, None)
+        if row is None:
+            return
+        self._unlink(row, set(self.features[row]))
+        self.recipe_ids[row] = -1
+
+    def add_features(self, recipe_id, feats):
+        self.add_features_many([recipe_id], feats)
+
+    def add_features_many(self, recipe_ids, feats):
+        """Give every recipe the features, growing each posting array
+        once however many recipes there are"""
+        feats = set(feats)
+        added = defaultdict(list)
+        for recipe_id in recipe_ids:
+            self.add_recipe(recipe_id)
+            row = self.rows[recipe_id]
+            for key in feats - self.features[row]:
+                added[key].append(row)
+                self.features[row].add(key)
+            self._resize(row)
+        for key, rows in added.items():
+            postings = self.postings.get(key)
+            rows = np.array(rows, dtype=np.int32)
+            if postings is not None:
+                rows = np.concatenate([postings, rows])
+            self.postings[key] = np.sort(rows)
+
+    def remove_features(self, recipe_id, feats):
+        row = self.rows.get(recipe_id)
+        if row is not None:
+            self._unlink(row, set(feats) & self.features[row])
+
+    def clear_features(self, recipe_id, kind):
+        """Remove all tags or all ingredients from a recipe"""
+        row = self.rows.get(recipe_id)
+        if row is not None:
+            self._unlink(
+                row, {key for key in self.features[row] if key % 2 == kind}
+            )
+
+    def drop_feature(self, key):
+        """Forget a deleted tag or ingredient"""
+        postings = self.postings.pop(key, None)
+        if postings is None:
+            return
+        for row in postings.tolist():
+            self.features[row].discard(key)
+        self.sizes[postings] -= 1
+        if key % 2 == INGREDIENT:
+            self.ingredient_counts[postings] -= 1
+
+    def _unlink(self, row, feats):
+        for key in feats:
+            postings = self.postings[key]
+            postings = postings[postings != row]
+            if len(postings):
+                self.postings[key] = postings
+            else:
+                del self.postings[key]
+            self.features[row].discard(key)
+        self._resize(row)
+
+    def _resize(self, row):
+        feats = self.features[row]
+        self.sizes[row] = len(feats)
+        self.ingredient_counts[row] = sum(
+            1 for key in feats if key % 2 == INGREDIENT
+        )
+
+    def similar(self, recipe_id, metric='jaccard', limit=10):
+        """Return up to limit (recipe_id, score) pairs, best first"""
+        with self.lock:
+            return self._similar(recipe_id, metric, limit)
+
+    def _similar(self, recipe_id, metric, limit):
+        row = self.rows.get(recipe_id)
+        if row is None or not self.features[row]:
+            return []
+
+        hits = np.concatenate([self.postings[key]
+                               for key in self.features[row]])
+        shared = np.bincount(hits, minlength=len(self.features))
+        shared[row] = 0
+        candidates = np.flatnonzero(shared)
+        shared = shared[candidates]
+        sizes = self.sizes[candidates]
+        size = len(self.features[row])
+        if metric == 'cosine':
+            scores = shared / np.sqrt(size * sizes)
+        else:
+            scores = shared / (size + sizes - shared)
+
+        if len(candidates) > limit:
+            top = np.argpartition(-scores, limit - 1)[:limit]
+            candidates, scores = candidates[top], scores[top]
+        recipe_ids = self.recipe_ids[candidates]
+        # Best score first, ties broken by the newest recipe
+        order = np.lexsort((-recipe_ids, -scores))
+        return list(zip(recipe_ids[order].tolist(), scores[order].tolist()))
+
+    def cookable(self, ingredient_ids, limit=20):
+        """Return up to limit (recipe_id, coverage, missing ingredient ids)
+        for the recipes using any of the ingredients, best covered first"""
+        with self.lock:
+            return self._cookable(ingredient_ids, limit)
+
+    def _cookable(self, ingredient_ids, limit):
+        keys = {feature(INGREDIENT, pk) for pk in ingredient_ids}
+        postings = [self.postings[key] for key in keys if key in self.postings]
+        if not postings:
+            return []
+
+        have = np.bincount(np.concatenate(postings),
+                           minlength=len(self.features))
+        candidates = np.flatnonzero(have)
+        have = have[candidates]
+        missing = self.ingredient_counts[candidates] - have
+        coverage = have / self.ingredient_counts[candidates]
+
+        recipe_ids = self.recipe_ids[candidates]
+        # Best coverage first, then fewest missing, then the newest recipe.
+        # Full matches often tie, so sort all candidates rather than
+        # partition around the limit.
+        order = np.lexsort((-recipe_ids, missing, -coverage))[:limit]
+
+        cookable = []
+        for row, coverage in zip(candidates[order].tolist(),
+                                 coverage[order].tolist()):
+            missing_ids = sorted(
+                (key - INGREDIENT) // 2 for key in self.features[row]
+                if key % 2 == INGREDIENT and key not in keys
+            )
+            cookable.append((int(self.recipe_ids[row]), coverage, missing_ids))
+        return cookable
+
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def _version_key(user_id):
+    return f'recipe-similarity:{user_id}'
+
+
+def _current_version(key):
+    # Versions start at a random number, so a key evicted from the cache
+    # and added again doesn't repeat ones processes already hold
+    cache.add(key, random.getrandbits(48), None)
+    return cache.get(key)
+
+
+def get_index(user):
+    """Return the user's index, building it if missing or out of date.
+
+    A version counter in the cache is incremented on every write, so
+    processes that did not see a change themselves rebuild their copy.
+    """
+    version = _current_version(_version_key(user.id))
+    with _indexes_lock:
+        index = _indexes.get(user.id)
+        if index is not None and index.version == version:
+            _indexes.move_to_end(user.id)
+            return index
+
+    index = _build_index(user, version)
+    with _indexes_lock:
+        _indexes[user.id] = index
+        _indexes.move_to_end(user.id)
+        while len(_indexes) > settings.SIMILARITY_INDEX_MAX_USERS:
+            _indexes.popitem(last=False)
+    return index
+
+
+def _build_index(user, version):
+    """Load the user's recipes and through rows in three queries"""
+    recipes = Recipe.objects.for_user(user)
+    tags = Recipe.tags.through.objects.using(user.shard) \
+        .filter(recipe__user=user).values_list('recipe_id', 'tag_id')
+    ingredients = Recipe.ingredients.through.objects.using(user.shard) \
+        .filter(recipe__user=user).values_list('recipe_id', 'ingredient_id')
+
+    links = [(r, feature(TAG, t)) for r, t in tags.iterator()]
+    links += [(r, feature(INGREDIENT, i)) for r, i in ingredients.iterator()]
+    return RecipeSimilarityIndex.build(
+        recipes.values_list('id', flat=True), links, version
+    )
+
+
+def record_change(user_id, apply):
+    """Apply a change to this process' copy of the user's index, if no
+    other change came in since it was current, and invalidate every other
+    copy"""
+    key = _version_key(user_id)
+    _current_version(key)
+    try:
+        # Atomic, so two concurrent writers never get the same version
+        version = cache.incr(key)
+    except ValueError:
+        # Evicted since; the next get_index starts a new version
+        version = None
+    with _indexes_lock:
+        index = _indexes.get(user_id)
+    if index is None:
+        return
+    with index.lock:
+        if version is not None and index.version == version - 1:
+            apply(index)
+            index.version = version
+            return
+    # Another writer got in between, so patching would miss its change
+    with _indexes_lock:
+        if _indexes.get(user_id) is index:
+            del _indexes[user_id]
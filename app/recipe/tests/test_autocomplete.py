@@ -0,0 +1,125 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag, Ingredient
+
+from recipe import autocomplete
+from recipe.autocomplete import PrefixIndex
+
+
+TAGS_AUTOCOMPLETE_URL = reverse('recipe:tag-autocomplete')
+INGREDIENTS_AUTOCOMPLETE_URL = reverse('recipe:ingredient-autocomplete')
+
+
+class PrefixIndexTests(TestCase):
+    """Test prefix lookups without the database"""
+
+    def setUp(self):
+        self.index = PrefixIndex([
+            (1, 'Salt', 3), (2, 'salmon', 7), (3, 'Sage', 0),
+            (4, 'Saffron', 3), (5, 'Pepper', 9), (6, 'sal', 3),
+        ], version=0)
+
+    def test_ranked_by_use_then_name(self):
+        """Test matches are ranked by use, ties broken by name"""
+        self.assertEqual(self.index.complete('SAL', 10), [
+            (2, 'salmon', 7), (6, 'sal', 3), (1, 'Salt', 3),
+        ])
+
+    def test_limit(self):
+        """Test only the top matches are returned"""
+        self.assertEqual(
+            [pk for pk, _, _ in self.index.complete('sa', 2)], [2, 4]
+        )
+
+    def test_no_match(self):
+        """Test a prefix matching nothing"""
+        self.assertEqual(self.index.complete('z', 10), [])
+        self.assertEqual(self.index.complete('peppers', 10), [])
+
+
+class AutocompleteApiTests(TestCase):
+
+    def setUp(self):
+        autocomplete._indexes.clear()
+        autocomplete._lookups.clear()
+        self.user = get_user_model().objects.create_user(
+            'test@ufc.br', 'testpass'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        self.salt = Tag.objects.create(user=self.user, name='Salty')
+        self.salad = Tag.objects.create(user=self.user, name='Salad')
+        Tag.objects.create(user=self.user, name='Sweet')
+        other = get_user_model().objects.create_user('o@ufc.br', 'testpass')
+        Tag.objects.create(user=other, name='Salsa')
+        recipe = Recipe.objects.create(
+            user=self.user, title='Greens', time_minutes=5, price=5.00
+        )
+        recipe.tags.add(self.salad)
+
+    def _names(self, url, q, **params):
+        res = self.client.get(url, {'q': q, **params})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [match['name'] for match in res.data]
+
+    def test_autocomplete_tags(self):
+        """Test the auth user's tags matching a prefix, most used first"""
+        res = self.client.get(TAGS_AUTOCOMPLETE_URL, {'q': 'sa'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [
+            {'id': self.salad.id, 'name': 'Salad', 'recipe_count': 1},
+            {'id': self.salt.id, 'name': 'Salty', 'recipe_count': 0},
+        ])
+
+    def test_autocomplete_ingredients(self):
+        """Test autocompleting ingredients, escaping LIKE wildcards"""
+        Ingredient.objects.create(user=self.user, name='50% cream')
+        Ingredient.objects.create(user=self.user, name='500 g flour')
+
+        self.assertEqual(
+            self._names(INGREDIENTS_AUTOCOMPLETE_URL, '50%'), ['50% cream']
+        )
+
+    @override_settings(AUTOCOMPLETE_INDEX_MIN_LOOKUPS=2)
+    def test_hot_user_answered_from_memory(self):
+        """Test repeated lookups are answered from memory until the data
+        changes"""
+        self.assertEqual(self._names(TAGS_AUTOCOMPLETE_URL, 'sal'),
+                         ['Salad', 'Salty'])
+        self.assertEqual(self._names(TAGS_AUTOCOMPLETE_URL, 'sal'),
+                         ['Salad', 'Salty'])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                self.client.get(TAGS_AUTOCOMPLETE_URL, {'q': 'salt'}).data,
+                [{'id': self.salt.id, 'name': 'Salty', 'recipe_count': 0}]
+            )
+
+        Tag.objects.create(user=self.user, name='Salt flakes')
+        self.user.refresh_from_db()
+        self.assertEqual(self._names(TAGS_AUTOCOMPLETE_URL, 'salt'),
+                         ['Salt flakes', 'Salty'])
+
+    @override_settings(AUTOCOMPLETE_INDEX_MAX_USERS=0)
+    def test_database_only(self):
+        """Test lookups keep working with the in-memory index off"""
+        for _ in range(5):
+            self.assertEqual(
+                self._names(TAGS_AUTOCOMPLETE_URL, 's', limit=1), ['Salad']
+            )
+        self.assertEqual(autocomplete._indexes, {})
+
+    def test_invalid_params(self):
+        """Test a missing prefix or a limit out of range is rejected"""
+        for params in ({}, {'q': ' '}, {'q': 's', 'limit': 0},
+                       {'q': 's', 'limit': 51}):
+            res = self.client.get(TAGS_AUTOCOMPLETE_URL, params)
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,187 @@
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag, Ingredient, Tombstone
+
+from recipe.tests.utils import sample_recipe
+
+
+BULK_ADD_URL = reverse('recipe:recipe-bulk-add')
+BULK_REMOVE_URL = reverse('recipe:recipe-bulk-remove')
+BULK_DELETE_URL = reverse('recipe:recipe-bulk-delete')
+BULK_UPDATE_URL = reverse('recipe:recipe-bulk-update')
+
+
+class BulkApiTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@ufc.br', 'testpass'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.other = get_user_model().objects.create_user(
+            'other@ufc.br', 'testpass'
+        )
+        self.recipes = [sample_recipe(self.user, f'R{i}') for i in range(3)]
+        self.ids = [recipe.id for recipe in self.recipes]
+        self.vegan = Tag.objects.create(user=self.user, name='Vegan')
+        self.quick = Tag.objects.create(user=self.user, name='Quick')
+        self.salt = Ingredient.objects.create(user=self.user, name='Salt')
+
+    def _version(self):
+        self.user.refresh_from_db()
+        return self.user.data_version
+
+    def test_bulk_add(self):
+        """Test linking tags and ingredients to many recipes"""
+        self.recipes[0].tags.add(self.vegan)
+        foreign = sample_recipe(self.other)
+        version = self._version()
+
+        res = self.client.post(BULK_ADD_URL, {
+            'recipes': self.ids + [foreign.id, 9999],
+            'tags': [self.vegan.id, self.quick.id],
+            'ingredients': [self.salt.id],
+        }, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, {
+            'recipes': 3, 'missing': sorted([foreign.id, 9999]),
+            'tags': 5, 'ingredients': 3,
+        })
+        for recipe in self.recipes:
+            self.assertEqual(set(recipe.tags.all()), {self.vegan, self.quick})
+            self.assertEqual(list(recipe.ingredients.all()), [self.salt])
+        self.vegan.refresh_from_db()
+        self.salt.refresh_from_db()
+        self.assertEqual(self.vegan.recipe_count, 3)
+        self.assertEqual(self.salt.recipe_count, 3)
+        self.assertFalse(foreign.tags.exists())
+        self.assertGreater(self._version(), version)
+
+    def test_bulk_add_other_users_tag(self):
+        """Test linking another user's tag is rejected"""
+        tag = Tag.objects.create(user=self.other, name='Theirs')
+
+        res = self.client.post(BULK_ADD_URL, {
+            'recipes': self.ids, 'tags': [tag.id]
+        }, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('tags', res.data)
+        self.assertFalse(Recipe.tags.through.objects.exists())
+
+    def test_bulk_add_needs_links(self):
+        """Test a bulk add without tags or ingredients is rejected"""
+        res = self.client.post(BULK_ADD_URL, {'recipes': self.ids},
+                               format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_remove(self):
+        """Test unlinking tags from many recipes"""
+        for recipe in self.recipes[:2]:
+            recipe.tags.add(self.vegan, self.quick)
+
+        res = self.client.post(BULK_REMOVE_URL, {
+            'recipes': self.ids, 'tags': [self.vegan.id]
+        }, format='json')
+
+        self.assertEqual(res.data['tags'], 2)
+        self.assertEqual(res.data['ingredients'], 0)
+        self.vegan.refresh_from_db()
+        self.quick.refresh_from_db()
+        self.assertEqual(self.vegan.recipe_count, 0)
+        self.assertEqual(self.quick.recipe_count, 2)
+        self.assertEqual(list(self.recipes[0].tags.all()), [self.quick])
+
+    def test_bulk_delete(self):
+        """Test deleting many recipes keeps counts and tombstones right"""
+        for recipe in self.recipes:
+            recipe.tags.add(self.vegan)
+        foreign = sample_recipe(self.other)
+
+        res = self.client.post(BULK_DELETE_URL, {
+            'recipes': self.ids[:2] + [foreign.id]
+        }, format='json')
+
+        self.assertEqual(res.data, {
+            'recipes': 2, 'missing': [foreign.id], 'deleted': 2
+        })
+        self.assertEqual(
+            list(Recipe.objects.filter(user=self.user)), self.recipes[2:]
+        )
+        self.assertTrue(Recipe.objects.filter(id=foreign.id).exists())
+        self.assertEqual(Recipe.tags.through.objects.count(), 1)
+        self.vegan.refresh_from_db()
+        self.assertEqual(self.vegan.recipe_count, 1)
+        self.assertEqual(
+            sorted(Tombstone.objects.filter(user=self.user, kind='recipe')
+                   .values_list('object_id', flat=True)),
+            self.ids[:2]
+        )
+
+    def test_bulk_update(self):
+        """Test setting field values on many recipes"""
+        res = self.client.post(BULK_UPDATE_URL, {
+            'recipes': self.ids[:2], 'values': {'price': '3.50'}
+        }, format='json')
+
+        self.assertEqual(res.data['updated'], 2)
+        prices = [recipe.price for recipe in
+                  Recipe.objects.filter(user=self.user).order_by('id')]
+        self.assertEqual(prices, [Decimal('3.50'), Decimal('3.50'),
+                                  Decimal('5.00')])
+
+    def test_bulk_update_invalid(self):
+        """Test bulk updates without values or with bad ones fail"""
+        for values in ({}, {'price': 'cheap'}, {'time_minutes': 'soon'}):
+            res = self.client.post(BULK_UPDATE_URL, {
+                'recipes': self.ids, 'values': values
+            }, format='json')
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_size_capped(self):
+        """Test at most 500 recipes are changed at once"""
+        res = self.client.post(BULK_DELETE_URL, {
+            'recipes': list(range(1, 502))
+        }, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_query_count_independent_of_size(self):
+        """Test bulk changes run as many queries for 3 recipes as for 60"""
+        def count_queries(recipe_ids):
+            counts = []
+            for url, data in (
+                (BULK_ADD_URL, {'tags': [self.vegan.id, self.quick.id],
+                                'ingredients': [self.salt.id]}),
+                (BULK_REMOVE_URL, {'tags': [self.vegan.id]}),
+                (BULK_UPDATE_URL, {'values': {'time_minutes': 20}}),
+                (BULK_DELETE_URL, {}),
+            ):
+                with CaptureQueriesContext(connection) as queries:
+                    res = self.client.post(
+                        url, {'recipes': recipe_ids, **data}, format='json'
+                    )
+                self.assertEqual(res.status_code, status.HTTP_200_OK)
+                counts.append(len(queries))
+            return counts
+
+        few = count_queries(self.ids)
+        many = count_queries(
+            [sample_recipe(self.user).id for _ in range(60)]
+        )
+
+        self.assertEqual(few, many)
+        self.assertLessEqual(max(many), 15)
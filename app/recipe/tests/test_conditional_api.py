@@ -0,0 +1,145 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag
+
+from recipe.tests.utils import sample_recipe
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+
+
+def detail_url(recipe_id):
+    """Return recipe detail url"""
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+class DataVersionTests(TestCase):
+
+    def test_version_bumped_on_changes(self):
+        """Test creates, updates, relinks and deletes bump the version"""
+        user = get_user_model().objects.create_user('test@ufc.br', 'pass')
+        versions = []
+
+        def snapshot():
+            user.refresh_from_db()
+            versions.append(user.data_version)
+
+        recipe = sample_recipe(user)
+        snapshot()
+        tag = Tag.objects.create(user=user, name='Vegan')
+        snapshot()
+        recipe.tags.add(tag)
+        snapshot()
+        recipe.title = 'Stew'
+        recipe.save()
+        snapshot()
+        recipe.delete()
+        snapshot()
+
+        self.assertEqual(versions, sorted(set(versions)))
+        self.assertGreater(versions[0], 0)
+
+
+class ConditionalApiTests(TestCase):
+
+    def setUp(self):
+        # Token auth loads the user, and so its version, on every request
+        self.user = get_user_model().objects.create_user(
+            'test@ufc.br',
+            'testpass'
+        )
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.user)}'
+        )
+
+    def test_not_modified_without_running_queryset(self):
+        """Test a matching If-None-Match gets 304 after only the auth
+        query"""
+        sample_recipe(self.user)
+        res = self.client.get(RECIPES_URL)
+        etag = res['ETag']
+
+        with self.assertNumQueries(1):
+            res = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res['ETag'], etag)
+        self.assertEqual(res.content, b'')
+
+    def test_changes_invalidate_etag(self):
+        """Test a change to the user's data yields a new ETag"""
+        recipe = sample_recipe(self.user)
+        etag = self.client.get(TAGS_URL)['ETag']
+
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Vegan'))
+        res = self.client.get(TAGS_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+        self.assertEqual(len(res.data), 1)
+
+    def test_etag_differs_per_url(self):
+        """Test that each query string has its own ETag"""
+        etag = self.client.get(TAGS_URL)['ETag']
+
+        res = self.client.get(TAGS_URL, {'ordering': 'name'},
+                              HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_if_match_update(self):
+        """Test writes succeed only against the version the client saw"""
+        recipe = sample_recipe(self.user)
+        url = detail_url(recipe.id)
+        etag = self.client.get(url)['ETag']
+
+        res = self.client.patch(url, {'title': 'Stew'}, HTTP_IF_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        new_etag = res['ETag']
+        self.assertNotEqual(new_etag, etag)
+
+        res = self.client.patch(url, {'title': 'Broth'}, HTTP_IF_MATCH=etag)
+        self.assertEqual(res.status_code,
+                         status.HTTP_412_PRECONDITION_FAILED)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, 'Stew')
+
+        res = self.client.patch(url, {'title': 'Broth'},
+                                HTTP_IF_MATCH=new_etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_if_match_delete_other_version(self):
+        """Test a delete against an old version is refused"""
+        recipe = sample_recipe(self.user)
+        url = detail_url(recipe.id)
+        etag = self.client.get(url)['ETag']
+        sample_recipe(self.user, 'Steak')
+
+        res = self.client.delete(url, HTTP_IF_MATCH=etag)
+
+        self.assertEqual(res.status_code,
+                         status.HTTP_412_PRECONDITION_FAILED)
+        self.assertTrue(Recipe.objects.filter(id=recipe.id).exists())
+
+    def test_if_match_failed_write_keeps_version(self):
+        """Test a write failing validation doesn't use up the version"""
+        recipe = sample_recipe(self.user)
+        url = detail_url(recipe.id)
+        etag = self.client.get(url)['ETag']
+
+        res = self.client.patch(url, {'time_minutes': 'nope'},
+                                HTTP_IF_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = self.client.patch(url, {'title': 'Stew'}, HTTP_IF_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, 'Stew')
@@ -0,0 +1,112 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Ingredient
+
+from recipe.similarity import (
+    RecipeSimilarityIndex, get_index, feature, TAG, INGREDIENT
+)
+from recipe.tests.utils import sample_recipe
+
+
+COOKABLE_URL = reverse('recipe:recipe-cookable')
+
+
+class CookableIndexTests(TestCase):
+    """Test ranking by ingredient coverage without the database"""
+
+    def setUp(self):
+        # Recipe 1 needs ingredients {1, 2}, 2 needs {1, 2, 3, 4} and
+        # 3 needs {3}; recipe 1 also has tag 1, which is never counted
+        self.index = RecipeSimilarityIndex.build(
+            [1, 2, 3],
+            [(1, feature(INGREDIENT, 1)), (1, feature(INGREDIENT, 2)),
+             (1, feature(TAG, 1)),
+             (2, feature(INGREDIENT, 1)), (2, feature(INGREDIENT, 2)),
+             (2, feature(INGREDIENT, 3)), (2, feature(INGREDIENT, 4)),
+             (3, feature(INGREDIENT, 3))]
+        )
+
+    def test_ranked_by_coverage(self):
+        """Test full matches come first and missing ingredients are listed"""
+        self.assertEqual(
+            self.index.cookable([1, 2]), [(1, 1.0, []), (2, 0.5, [3, 4])]
+        )
+
+    def test_unknown_ingredients_ignored(self):
+        """Test ingredients no recipe uses don't match anything"""
+        self.assertEqual(self.index.cookable([99]), [])
+        self.assertEqual(self.index.cookable([3, 99]),
+                         [(3, 1.0, []), (2, 0.25, [1, 2, 4])])
+
+    def test_limit_and_updates(self):
+        """Test the limit and that counts follow incremental updates"""
+        self.index.remove_features(2, {feature(INGREDIENT, 4)})
+        self.index.drop_feature(feature(INGREDIENT, 3))
+
+        self.assertEqual(self.index.cookable([1, 2, 3], limit=1),
+                         [(2, 1.0, [])])
+
+
+class CookableRecipesApiTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@ufc.br',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_cookable_recipes(self):
+        """Test listing recipes by the share of ingredients at hand"""
+        rice = Ingredient.objects.create(user=self.user, name='Rice')
+        beans = Ingredient.objects.create(user=self.user, name='Beans')
+        egg = Ingredient.objects.create(user=self.user, name='Egg')
+        sample_recipe(self.user, 'Rice and beans').ingredients.add(
+            rice, beans
+        )
+        sample_recipe(self.user, 'Fried rice').ingredients.add(rice, egg)
+        sample_recipe(self.user, 'Omelette').ingredients.add(egg)
+        get_index(self.user)
+
+        # The index is loaded: one query for the recipes, two prefetches
+        with self.assertNumQueries(3):
+            res = self.client.post(
+                COOKABLE_URL, {'ingredients': [rice.id, beans.id]},
+                format='json'
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(item['title'], item['coverage'], item['missing'])
+             for item in res.data],
+            [('Rice and beans', 1.0, []), ('Fried rice', 0.5, [egg.id])]
+        )
+
+    def test_cookable_limited_to_user(self):
+        """Test another user's recipes are not matched"""
+        user2 = get_user_model().objects.create_user('other@ufc.br', 'pass')
+        rice = Ingredient.objects.create(user=user2, name='Rice')
+        sample_recipe(user2, 'Rice').ingredients.add(rice)
+
+        res = self.client.post(
+            COOKABLE_URL, {'ingredients': [rice.id]}, format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [])
+
+    def test_cookable_invalid(self):
+        """Test that at least one ingredient id is required"""
+        res = self.client.post(
+            COOKABLE_URL, {'ingredients': []}, format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,148 @@
+import shutil
+import tempfile
+from io import BytesIO
+
+from PIL import Image
+
+from django.contrib.auth import get_user_model
+from django.test import override_settings
+
+from core import testing
+from core.models import Recipe, Tag, Ingredient
+from core.testing import Endpoint
+
+from recipe import autocomplete, similarity, urls
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def recipe_pk(context):
+    return {'pk': context['recipe'].id}
+
+
+def recipe_ids(context):
+    return [recipe.id for recipe in context['recipes']]
+
+
+def image_file(context):
+    upload = BytesIO()
+    Image.new('RGB', (10, 10)).save(upload, format='JPEG')
+    upload.name = 'upload.jpg'
+    upload.seek(0)
+    return {'image': upload}
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class RecipeQueryBudgetTests(testing.QueryBudgetTestCase):
+    """Every recipe api route runs a bounded number of queries, however
+    many recipes, tags and ingredients the user has"""
+    endpoints = {
+        ('recipe:api-root', 'get'): Endpoint(0),
+        ('recipe:tag-list', 'get'): Endpoint(1),
+        ('recipe:tag-list', 'post'): Endpoint(
+            4, data=lambda context: {'name': 'New tag'}
+        ),
+        ('recipe:tag-autocomplete', 'get'): Endpoint(
+            1, data=lambda context: {'q': 'ta'}
+        ),
+        ('recipe:ingredient-list', 'get'): Endpoint(1),
+        ('recipe:ingredient-list', 'post'): Endpoint(
+            4, data=lambda context: {'name': 'New ingredient'}
+        ),
+        ('recipe:ingredient-autocomplete', 'get'): Endpoint(
+            1, data=lambda context: {'q': 'in'}
+        ),
+        ('recipe:recipe-list', 'get'): Endpoint(3),
+        ('recipe:recipe-list', 'post'): Endpoint(18, data=lambda context: {
+            'title': 'New', 'time_minutes': 5, 'price': '5.00',
+            'tags': [tag.id for tag in context['tags'][:2]],
+            'ingredients': [ingr.id for ingr in context['ingredients'][:2]],
+        }),
+        ('recipe:recipe-detail', 'get'): Endpoint(3, kwargs=recipe_pk),
+        ('recipe:recipe-detail', 'put'): Endpoint(
+            17, kwargs=recipe_pk, data=lambda context: {
+                'title': 'Changed', 'time_minutes': 5, 'price': '5.00',
+                'tags': [context['tags'][-1].id], 'ingredients': [],
+            }
+        ),
+        ('recipe:recipe-detail', 'patch'): Endpoint(
+            6, kwargs=recipe_pk, data=lambda context: {'title': 'Changed'}
+        ),
+        ('recipe:recipe-detail', 'delete'): Endpoint(8, kwargs=recipe_pk),
+        ('recipe:recipe-similar', 'get'): Endpoint(7, kwargs=recipe_pk),
+        ('recipe:recipe-cookable', 'post'): Endpoint(
+            6, data=lambda context: {
+                'ingredients': [ingr.id for ingr in context['ingredients']]
+            }
+        ),
+        ('recipe:recipe-upload-image', 'post'): Endpoint(
+            3, kwargs=recipe_pk, data=image_file, format='multipart'
+        ),
+        ('recipe:recipe-bulk-add', 'post'): Endpoint(
+            11, data=lambda context: {
+                'recipes': recipe_ids(context),
+                'tags': [context['unused_tag'].id],
+                'ingredients': [context['unused_ingredient'].id],
+            }
+        ),
+        ('recipe:recipe-bulk-remove', 'post'): Endpoint(
+            8, data=lambda context: {
+                'recipes': recipe_ids(context),
+                'tags': [context['tags'][0].id],
+            }
+        ),
+        ('recipe:recipe-bulk-delete', 'post'): Endpoint(
+            13, data=lambda context: {'recipes': recipe_ids(context)}
+        ),
+        ('recipe:recipe-bulk-update', 'post'): Endpoint(
+            5, data=lambda context: {
+                'recipes': recipe_ids(context), 'values': {'price': '2.00'}
+            }
+        ),
+        ('recipe:shopping-list', 'post'): Endpoint(
+            1, data=lambda context: {'recipes': recipe_ids(context)}
+        ),
+        ('recipe:sync', 'get'): Endpoint(5),
+    }
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def reset(self):
+        similarity._indexes.clear()
+        autocomplete._indexes.clear()
+        autocomplete._lookups.clear()
+
+    def populate(self, size):
+        user = get_user_model().objects.create_user(
+            'budget@ufc.br', 'testpass'
+        )
+        self.client.force_authenticate(user)
+        tags = [Tag.objects.create(user=user, name=f'Tag {i}')
+                for i in range(size)]
+        ingredients = [
+            Ingredient.objects.create(user=user, name=f'Ingredient {i}')
+            for i in range(size)
+        ]
+        recipes = []
+        for i in range(size):
+            recipe = Recipe.objects.create(
+                user=user, title=f'Recipe {i}', time_minutes=i, price=i
+            )
+            recipe.tags.add(tags[i], tags[i - 1])
+            recipe.ingredients.add(ingredients[i], ingredients[i - 1])
+            recipes.append(recipe)
+        return {
+            'user': user, 'tags': tags, 'ingredients': ingredients,
+            'recipes': recipes, 'recipe': recipes[0],
+            'unused_tag': Tag.objects.create(user=user, name='Unused'),
+            'unused_ingredient': Ingredient.objects.create(
+                user=user, name='Unused'
+            ),
+        }
+
+    def test_every_route_budgeted(self):
+        """Test no recipe route is left without a query budget"""
+        self.assertRoutesBudgeted(urls.urlpatterns, 'recipe')
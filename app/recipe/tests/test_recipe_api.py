@@ -1,18 +1,22 @@
+import struct
 import tempfile
 import os
+import zlib
+from io import BytesIO
 
 from PIL import Image
 
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse
 
 from rest_framework import status
-from rest_framework.test import APIClient
+from rest_framework.test import APIClient, APIRequestFactory
 
 from core.models import Recipe, Tag, Ingredient
 
 from recipe.serializers import RecipeSerializer, RecipeDetailSerializer
+from recipe.tests.utils import sample_recipe
 
 RECIPES_URL = reverse('recipe:recipe-list')
 
@@ -28,6 +32,37 @@ def detail_url(recipe_id):
     return reverse('recipe:recipe-detail', args=[recipe_id])
 
 
+def png_header(width, height):
+    """Return the start of a PNG of any size, up to its pixel data"""
+    ihdr = b'IHDR' + struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + struct.pack('>I', 13) + ihdr + \
+        struct.pack('>I', zlib.crc32(ihdr)) + struct.pack('>I', 1024) + \
+        b'IDAT'
+
+
+def image_file(size=(10, 10), image_format='JPEG'):
+    """Return an image file to upload"""
+    upload = BytesIO()
+    Image.new('RGB', size).save(upload, format=image_format)
+    upload.name = f'upload.{image_format.lower()}'
+    upload.seek(0)
+    return upload
+
+
+def jpeg_with_app_segments(count, size=60000):
+    """Return a JPEG whose APPn segments, like a photo's EXIF and ICC
+    profile, push its frame header past the first count * size bytes"""
+    jpeg = image_file().getvalue()
+    segments = b''.join(
+        b'\xff' + bytes([0xe1 + i]) + struct.pack('>H', size + 2) +
+        b'\0' * size
+        for i in range(count)
+    )
+    upload = BytesIO(jpeg[:2] + segments + jpeg[2:])
+    upload.name = 'photo.jpg'
+    return upload
+
+
 def sample_tag(user, name='Main course'):
     """Create and return a sample tag"""
     return Tag.objects.create(user=user, name=name)
@@ -38,23 +73,6 @@ def sample_ingredient(user, name='Cinnamon'):
     return Ingredient.objects.create(user=user, name=name)
 
 
-# ** means any additional param off user will get passed as a dic named params
-def sample_recipe(user, **params):
-    """Create and return a sample recipe"""
-    # No need to pass user to the default dic because it passed evey single
-    # the def sample_recipe is called
-    defaults = {
-        'title': 'Sample recipe',
-        'time_minutes': 10,
-        'price': 5.00
-    }
-    # Any params passed in off the user will override the default
-    defaults.update(params)
-
-    # ** here converts the dic into the args
-    return Recipe.objects.create(user=user, **defaults)
-
-
 class PublicRecipeApiTests(TestCase):
     """Test unauthenticated recipe api access"""
 
@@ -145,6 +163,50 @@ class PrivateRecipeApiTests(TestCase):
         serializer = RecipeDetailSerializer(recipe)
         self.assertEqual(res.data, serializer.data)
 
+    def test_batch_retrieve_recipe_details(self):
+        """Test fetching the details of many recipes in fixed queries"""
+        recipes = []
+        for i in range(5):
+            recipe = sample_recipe(user=self.user, title=f'Recipe {i}')
+            recipe.tags.add(sample_tag(user=self.user, name=f'Tag {i}'))
+            recipe.ingredients.add(
+                sample_ingredient(user=self.user, name=f'Ingredient {i}')
+            )
+            recipes.append(recipe)
+        ids = ','.join(str(recipe.id) for recipe in reversed(recipes))
+
+        with self.assertNumQueries(3):
+            res = self.client.get(RECIPES_URL, {'ids': ids, 'detail': 1})
+
+        serializer = RecipeDetailSerializer(reversed(recipes), many=True)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'], serializer.data)
+        self.assertEqual(res.data['missing'], [])
+
+    def test_batch_retrieve_reports_missing(self):
+        """Test unknown and other users' ids are reported, not fetched"""
+        recipe = sample_recipe(user=self.user)
+        user2 = get_user_model().objects.create_user('other@ufc.br', 'pass')
+        other = sample_recipe(user=user2)
+
+        res = self.client.get(
+            RECIPES_URL, {'ids': f'{recipe.id},{other.id},9999'}
+        )
+
+        serializer = RecipeSerializer([recipe], many=True)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'], serializer.data)
+        self.assertEqual(res.data['missing'], [other.id, 9999])
+
+    def test_batch_retrieve_invalid_ids(self):
+        """Test malformed and too many ids are rejected"""
+        res = self.client.get(RECIPES_URL, {'ids': '1,a'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        ids = ','.join(str(i) for i in range(1, 102))
+        res = self.client.get(RECIPES_URL, {'ids': ids})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_create_basic_recipe(self):
         """Test creating recipe"""
         payload = {
@@ -162,8 +224,8 @@ class PrivateRecipeApiTests(TestCase):
 
     def test_create_recipe_with_tags(self):
         """Test creating recipes with tags"""
-        tag1 = sample_tag(user=self.user)
-        tag2 = sample_tag(user=self.user)
+        tag1 = sample_tag(user=self.user, name='Vegan')
+        tag2 = sample_tag(user=self.user, name='Dessert')
         payload = {
             'title': 'Avocado lime cheesecake',
             # List of tags id assigned to the recipe.
@@ -205,6 +267,50 @@ class PrivateRecipeApiTests(TestCase):
         # DETAIL:  Failing row contains (4, Avocado lime cheesecake, 60, 20.00,
         # ,null).
 
+    def test_create_recipe_validates_ids_in_one_query(self):
+        """Test that related ids are checked with a single query"""
+        ingredients = [
+            sample_ingredient(user=self.user, name=f'Ingredient {i}')
+            for i in range(10)
+        ]
+        payload = {
+            'title': 'Minestrone',
+            'ingredients': [ingredient.id for ingredient in ingredients],
+            'tags': [],
+            'time_minutes': 40,
+            'price': 8.00
+        }
+        request = APIRequestFactory().post(RECIPES_URL)
+        request.user = self.user
+        serializer = RecipeSerializer(
+            data=payload, context={'request': request}
+        )
+
+        with self.assertNumQueries(1):
+            self.assertTrue(serializer.is_valid())
+        self.assertEqual(serializer.validated_data['ingredients'], ingredients)
+
+    def test_create_recipe_with_other_users_tag(self):
+        """Test that tags of another user are rejected per id"""
+        user2 = get_user_model().objects.create_user(
+            'other@ufc.br',
+            'pasrd'
+        )
+        tag = sample_tag(user=self.user)
+        other_tag = sample_tag(user=user2)
+        payload = {
+            'title': 'Pad thai',
+            'tags': [tag.id, other_tag.id, 'abc'],
+            'time_minutes': 20,
+            'price': 7.00
+        }
+        res = self.client.post(RECIPES_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(set(res.data['tags']), {1, 2})
+        self.assertIn(str(other_tag.id), res.data['tags'][1][0])
+        self.assertFalse(Recipe.objects.exists())
+
     def test_partial_update_recipe(self):
         """Test updating a recipe with patch"""
         recipe = sample_recipe(user=self.user)
@@ -288,6 +394,83 @@ class RecipeImageUploadTests(TestCase):
 
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
 
+    @override_settings(RECIPE_IMAGE_MEMORY_SIZE=0)
+    def test_upload_image_spooled_to_disk(self):
+        """Test uploads above the memory size are spooled and still saved"""
+        res = self.client.post(image_upload_url(self.recipe.id),
+                               {'image': image_file()}, format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.recipe.refresh_from_db()
+        self.assertTrue(os.path.exists(self.recipe.image.path))
+
+    @override_settings(RECIPE_IMAGE_MAX_SIZE=1024)
+    def test_upload_image_too_large(self):
+        """Test a file over the size limit is rejected"""
+        upload = image_file(size=(200, 200), image_format='PNG')
+        upload.write(b'\0' * 4096)
+        upload.seek(0)
+
+        res = self.client.post(image_upload_url(self.recipe.id),
+                               {'image': upload}, format='multipart')
+
+        self.assertEqual(res.status_code,
+                         status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.recipe.refresh_from_db()
+        self.assertFalse(self.recipe.image)
+
+    def test_upload_image_too_many_pixels(self):
+        """Test images whose header claims too many pixels are rejected
+        without being decoded"""
+        for width in (6000, 100000):
+            upload = BytesIO(png_header(width, 5000) + b'\0' * 1024)
+            upload.name = 'bomb.png'
+
+            res = self.client.post(image_upload_url(self.recipe.id),
+                                   {'image': upload}, format='multipart')
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(res.data['image'],
+                             ['The image has too many pixels.'])
+
+    def test_upload_image_format_not_allowed(self):
+        """Test images of formats not allowed are rejected"""
+        res = self.client.post(image_upload_url(self.recipe.id),
+                               {'image': image_file(image_format='BMP')},
+                               format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data['image'],
+                         ['BMP images are not supported.'])
+
+    def test_upload_image_large_app_segments(self):
+        """Test JPEGs whose metadata puts the frame header past the
+        first chunk are accepted"""
+        res = self.client.post(image_upload_url(self.recipe.id),
+                               {'image': jpeg_with_app_segments(3)},
+                               format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        # Broken segments aren't waited on past the usual sniff size
+        upload = BytesIO(b'\xff\xd8' + b'\0' * 200 * 1024)
+        upload.name = 'broken.jpg'
+        res = self.client.post(image_upload_url(self.recipe.id),
+                               {'image': upload}, format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_upload_not_an_image(self):
+        """Test files that aren't images are rejected"""
+        upload = BytesIO(b'not an image' * 10)
+        upload.name = 'notes.txt'
+
+        res = self.client.post(image_upload_url(self.recipe.id),
+                               {'image': upload}, format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data['image'], ['Upload a valid image.'])
+
     def test_filter_recipes_by_tags(self):
         """Test returning recipes with specific tags"""
         recipe1 = sample_recipe(user=self.user, title='Thai vegetabe curry')
@@ -331,3 +514,37 @@ class RecipeImageUploadTests(TestCase):
         self.assertIn(serializer1.data, res.data)
         self.assertIn(serializer2.data, res.data)
         self.assertNotIn(serializer3.data, res.data)
+
+    def test_filter_recipes_by_ranges(self):
+        """Test returning recipes within time and price ranges"""
+        quick = sample_recipe(user=self.user, time_minutes=20, price=8.00)
+        sample_recipe(user=self.user, time_minutes=45, price=8.00)
+        sample_recipe(user=self.user, time_minutes=20, price=12.00)
+
+        res = self.client.get(RECIPES_URL, {
+            'time_minutes_max': 30, 'price_min': '6', 'price_max': '10.00'
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['id'] for r in res.data], [quick.id])
+
+    def test_order_recipes(self):
+        """Test ordering recipes, with the id breaking ties"""
+        first = sample_recipe(user=self.user, price=9.00)
+        second = sample_recipe(user=self.user, price=3.00)
+        third = sample_recipe(user=self.user, price=9.00)
+
+        res = self.client.get(RECIPES_URL, {'ordering': '-price'})
+
+        self.assertEqual([r['id'] for r in res.data],
+                         [third.id, first.id, self.recipe.id, second.id])
+
+    def test_invalid_filters_rejected(self):
+        """Test unknown orderings and inverted ranges are rejected"""
+        for params in ({'ordering': 'link'},
+                       {'ordering': 'user__email'},
+                       {'time_minutes_min': 'soon'},
+                       {'price_min': '10', 'price_max': '5'}):
+            res = self.client.get(RECIPES_URL, params)
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,94 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Ingredient
+
+from recipe.tests.utils import sample_recipe
+
+
+SHOPPING_LIST_URL = reverse('recipe:shopping-list')
+
+
+class PublicShoppingListApiTests(TestCase):
+    """Test unauthenticated shopping list access"""
+
+    def test_auth_required(self):
+        res = APIClient().post(SHOPPING_LIST_URL, {'recipes': [1]})
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateShoppingListApiTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@ufc.br',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_ingredients_merged(self):
+        """Test shared ingredients are listed once with their recipes"""
+        rice = Ingredient.objects.create(user=self.user, name='Rice')
+        beans = Ingredient.objects.create(user=self.user, name='Beans')
+        recipe1 = sample_recipe(self.user, 'Rice and beans')
+        recipe2 = sample_recipe(self.user, 'Fried rice')
+        recipe1.ingredients.add(rice, beans)
+        recipe2.ingredients.add(rice)
+
+        res = self.client.post(
+            SHOPPING_LIST_URL, {'recipes': [recipe1.id, recipe2.id]},
+            format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [
+            {'id': beans.id, 'name': 'Beans', 'recipes': [recipe1.id]},
+            {'id': rice.id, 'name': 'Rice',
+             'recipes': [recipe1.id, recipe2.id]},
+        ])
+
+    def test_query_count_bounded(self):
+        """Test that one query builds the list however many recipes"""
+        salt = Ingredient.objects.create(user=self.user, name='Salt')
+        ids = []
+        for i in range(50):
+            recipe = sample_recipe(self.user, f'Recipe {i}')
+            recipe.ingredients.add(
+                salt, Ingredient.objects.create(user=self.user, name=f'I{i}')
+            )
+            ids.append(recipe.id)
+
+        with self.assertNumQueries(1):
+            res = self.client.post(
+                SHOPPING_LIST_URL, {'recipes': ids}, format='json'
+            )
+
+        self.assertEqual(len(res.data), 51)
+
+    def test_other_users_recipes_ignored(self):
+        """Test that another user's recipes add nothing to the list"""
+        user2 = get_user_model().objects.create_user('other@ufc.br', 'pass')
+        recipe = sample_recipe(user2, 'Soup')
+        recipe.ingredients.add(Ingredient.objects.create(user=user2, name='X'))
+
+        res = self.client.post(
+            SHOPPING_LIST_URL, {'recipes': [recipe.id]}, format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [])
+
+    def test_too_many_recipes(self):
+        """Test that the number of recipes is capped"""
+        res = self.client.post(
+            SHOPPING_LIST_URL, {'recipes': list(range(1, 502))},
+            format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
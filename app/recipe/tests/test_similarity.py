@@ -0,0 +1,176 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Tag, Ingredient
+
+from recipe.similarity import (
+    RecipeSimilarityIndex, _version_key, get_index, record_change
+)
+from recipe.tests.utils import sample_recipe
+
+
+def similar_url(recipe_id):
+    """Return the similar recipes url of a recipe"""
+    return reverse('recipe:recipe-similar', args=[recipe_id])
+
+
+class RecipeSimilarityIndexTests(TestCase):
+    """Test the similarity index without the database"""
+
+    def setUp(self):
+        # Recipe 1 has features {1, 2, 3}, 2 has {1, 2}, 3 has {3, 4, 5, 6}
+        self.index = RecipeSimilarityIndex.build(
+            [1, 2, 3, 4],
+            [(1, 1), (1, 2), (1, 3), (2, 1), (2, 2),
+             (3, 3), (3, 4), (3, 5), (3, 6)]
+        )
+
+    def test_jaccard(self):
+        """Test ranking by shared features over all features"""
+        self.assertEqual(
+            self.index.similar(1), [(2, 2 / 3), (3, 1 / 6)]
+        )
+
+    def test_cosine(self):
+        """Test ranking by cosine similarity of the feature vectors"""
+        ranked = self.index.similar(1, metric='cosine')
+
+        self.assertEqual([pk for pk, _ in ranked], [2, 3])
+        self.assertAlmostEqual(ranked[0][1], 2 / (3 * 2) ** 0.5)
+
+    def test_limit(self):
+        """Test that only the top matches are returned"""
+        self.assertEqual(self.index.similar(1, limit=1), [(2, 2 / 3)])
+
+    def test_incremental_updates(self):
+        """Test that updates are reflected without rebuilding"""
+        self.index.add_features(4, {1, 2, 3})
+        self.assertEqual(self.index.similar(1)[0], (4, 1.0))
+
+        self.index.remove_features(4, {3})
+        self.index.remove_recipe(2)
+        self.index.drop_feature(3)
+        self.assertEqual(self.index.similar(1), [(4, 1.0)])
+
+        self.index.add_recipe(5)
+        self.index.add_features(5, {1, 2})
+        self.assertEqual(
+            [pk for pk, _ in self.index.similar(1)], [5, 4]
+        )
+
+    def test_add_features_many(self):
+        """Test adding features to many recipes at once matches adding them
+        one recipe at a time"""
+        one_by_one = RecipeSimilarityIndex.build(
+            [1, 2, 3], [(1, 1), (1, 2), (2, 2)]
+        )
+        batched = RecipeSimilarityIndex.build(
+            [1, 2, 3], [(1, 1), (1, 2), (2, 2)]
+        )
+        for recipe_id in (6, 3, 2):
+            one_by_one.add_features(recipe_id, {2, 5})
+        batched.add_features_many([6, 3, 2], {2, 5})
+
+        self.assertEqual(batched.postings.keys(), one_by_one.postings.keys())
+        for key, postings in batched.postings.items():
+            self.assertEqual(postings.tolist(), sorted(postings.tolist()))
+            self.assertEqual(sorted(postings.tolist()),
+                             sorted(one_by_one.postings[key].tolist()))
+        self.assertEqual(batched.similar(3), one_by_one.similar(3))
+
+
+class SimilarRecipesApiTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@ufc.br',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_similar_recipes(self):
+        """Test listing recipes ranked by shared tags and ingredients"""
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+        rice = Ingredient.objects.create(user=self.user, name='Rice')
+        beans = Ingredient.objects.create(user=self.user, name='Beans')
+        recipe = sample_recipe(self.user, 'Rice and beans')
+        close = sample_recipe(self.user, 'Burrito')
+        far = sample_recipe(self.user, 'Fried rice')
+        sample_recipe(self.user, 'Steak')
+        recipe.tags.add(vegan)
+        recipe.ingredients.add(rice, beans)
+        close.tags.add(vegan)
+        close.ingredients.add(beans)
+        far.ingredients.add(rice)
+
+        res = self.client.get(similar_url(recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [item['title'] for item in res.data], ['Burrito', 'Fried rice']
+        )
+        self.assertAlmostEqual(res.data[0]['score'], 2 / 3)
+
+    def test_similar_recipes_invalid_metric(self):
+        """Test that an unknown metric is rejected"""
+        recipe = sample_recipe(self.user, 'Soup')
+        res = self.client.get(similar_url(recipe.id), {'metric': 'euclid'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_similar_recipes_limited_to_user(self):
+        """Test that another user's recipe can't be used"""
+        user2 = get_user_model().objects.create_user('other@ufc.br', 'pass')
+        recipe = sample_recipe(user2, 'Soup')
+        res = self.client.get(similar_url(recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class SimilarityIndexUpdateTests(TransactionTestCase):
+    """Test that committed changes update a loaded index in place"""
+
+    def test_index_follows_recipe_changes(self):
+        cache.clear()
+        user = get_user_model().objects.create_user('test@ufc.br', 'pass')
+        tag = Tag.objects.create(user=user, name='Vegan')
+        recipe1 = sample_recipe(user, 'Salad')
+        recipe1.tags.add(tag)
+        index = get_index(user)
+
+        recipe2 = sample_recipe(user, 'Soup')
+        recipe2.tags.add(tag)
+
+        self.assertIs(get_index(user), index)
+        self.assertEqual(index.similar(recipe1.id), [(recipe2.id, 1.0)])
+
+        tag.recipe_set.remove(recipe2)
+        self.assertEqual(index.similar(recipe1.id), [])
+
+        recipe2.tags.add(tag)
+        recipe2.delete()
+        self.assertEqual(index.similar(recipe1.id), [])
+        self.assertIs(get_index(user), index)
+
+    def test_index_dropped_after_concurrent_change(self):
+        """Test a change made by another process since the index was
+        current drops it instead of patching it"""
+        cache.clear()
+        user = get_user_model().objects.create_user('test@ufc.br', 'pass')
+        recipe = sample_recipe(user, 'Salad')
+        index = get_index(user)
+
+        # Another process recorded a change this one didn't see
+        cache.incr(_version_key(user.id))
+        record_change(user.id, lambda index: index.remove_recipe(recipe.id))
+
+        self.assertIsNot(get_index(user), index)
+        self.assertEqual(get_index(user).version,
+                         cache.get(_version_key(user.id)))
@@ -0,0 +1,128 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Tag, Ingredient, Tombstone
+
+from recipe.tests.utils import sample_recipe
+
+
+SYNC_URL = reverse('recipe:sync')
+
+
+@override_settings(SYNC_CURSOR_OVERLAP_SECONDS=0)
+class SyncApiTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@ufc.br',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def _sync(self, cursor=None):
+        res = self.client.get(SYNC_URL, {'since': cursor} if cursor else {})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.data
+
+    def test_auth_required(self):
+        res = APIClient().get(SYNC_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_full_sync(self):
+        """Test that everything is sent without a cursor"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe = sample_recipe(self.user)
+        recipe.tags.add(tag)
+
+        data = self._sync()
+
+        self.assertTrue(data['reset'])
+        self.assertEqual([t['name'] for t in data['tags']], ['Vegan'])
+        self.assertEqual(data['recipes'][0]['tags'], [tag.id])
+        self.assertEqual(
+            data['deleted'], {'tags': [], 'ingredients': [], 'recipes': []}
+        )
+        self.assertTrue(data['cursor'].startswith('default:'))
+
+    def test_incremental_sync(self):
+        """Test that only changes and deletions since the cursor are sent"""
+        Tag.objects.create(user=self.user, name='Vegan')
+        salt = Ingredient.objects.create(user=self.user, name='Salt')
+        recipe = sample_recipe(self.user)
+        sample_recipe(self.user, 'Steak')
+        cursor = self._sync()['cursor']
+
+        dessert = Tag.objects.create(user=self.user, name='Dessert')
+        recipe.tags.add(dessert)
+        salt_id = salt.id
+        salt.delete()
+
+        data = self._sync(cursor)
+
+        self.assertFalse(data['reset'])
+        self.assertEqual([t['name'] for t in data['tags']], ['Dessert'])
+        self.assertEqual([r['id'] for r in data['recipes']], [recipe.id])
+        self.assertEqual(data['deleted']['ingredients'], [salt_id])
+
+    def test_reverse_relink_and_cascade_touch_recipes(self):
+        """Test recipes changed through a tag are sent again"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe = sample_recipe(self.user)
+        cursor = self._sync()['cursor']
+
+        tag.recipe_set.add(recipe)
+        data = self._sync(cursor)
+        self.assertEqual([r['id'] for r in data['recipes']], [recipe.id])
+
+        cursor = data['cursor']
+        tag_id = tag.id
+        tag.delete()
+        data = self._sync(cursor)
+        self.assertEqual(data['recipes'][0]['tags'], [])
+        self.assertEqual(data['deleted']['tags'], [tag_id])
+
+    def test_query_count_fixed(self):
+        """Test a sync takes the same queries however much changed"""
+        cursor = self._sync()['cursor']
+        for i in range(10):
+            recipe = sample_recipe(self.user, f'Recipe {i}')
+            recipe.tags.add(Tag.objects.create(user=self.user, name=f'{i}'))
+        sample_recipe(self.user).delete()
+
+        # Tags, ingredients, recipes and their two relations, tombstones
+        with self.assertNumQueries(6):
+            data = self._sync(cursor)
+
+        self.assertEqual(len(data['recipes']), 10)
+        self.assertEqual(len(data['deleted']['recipes']), 1)
+
+    def test_invalid_cursor(self):
+        """Test that a malformed cursor is rejected"""
+        res = self.client.get(SYNC_URL, {'since': 'default:yesterday'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_cursor_of_other_shard_resets(self):
+        """Test that a cursor issued before a shard move resyncs all"""
+        Tag.objects.create(user=self.user, name='Vegan')
+        cursor = self._sync()['cursor'].replace('default:', 'shard9:')
+
+        data = self._sync(cursor)
+
+        self.assertTrue(data['reset'])
+        self.assertEqual(len(data['tags']), 1)
+
+    def test_deleted_user_leaves_no_tombstones(self):
+        """Test that deleting a user doesn't record its data's deletion"""
+        sample_recipe(self.user).tags.add(
+            Tag.objects.create(user=self.user, name='Vegan')
+        )
+        self.user.delete()
+
+        self.assertFalse(Tombstone.objects.exists())
@@ -5,7 +5,7 @@ from django.test import TestCase
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from core.models import Tag
+from core.models import Tag, Recipe
 
 from recipe.serializers import TagSerializer
 
@@ -83,9 +83,86 @@ class PrivateTagsApiTests(TestCase):
         ).exists()
         self.assertTrue(exists)
 
+    def test_create_existing_tag_is_idempotent(self):
+        """Test creating a tag that exists in another case returns it"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        res = self.client.post(TAGS_URL, {'name': 'VEGAN'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['id'], tag.id)
+        self.assertEqual(res.data['name'], 'Vegan')
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 1)
+
+    def test_same_tag_name_for_different_users(self):
+        """Test that tag names are only unique per user"""
+        user2 = get_user_model().objects.create_user(
+            'other@ufc.br',
+            'testpass'
+        )
+        Tag.objects.create(user=user2, name='Vegan')
+        res = self.client.post(TAGS_URL, {'name': 'Vegan'})
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Tag.objects.filter(name='Vegan').count(), 2)
+
     def test_create_tag_invalid(self):
         """Create tag with an invalid payload"""
         payload = {'name': ''}
         res = self.client.post(TAGS_URL, payload)
 
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_retrieve_tags_assigned_to_recipes(self):
+        """Test filtering tags by those assigned to recipes"""
+        tag1 = Tag.objects.create(user=self.user, name='Breakfast')
+        tag2 = Tag.objects.create(user=self.user, name='Lunch')
+        recipe = Recipe.objects.create(
+            title='Coriander eggs on toast',
+            time_minutes=10,
+            price=5.00,
+            user=self.user
+        )
+        recipe.tags.add(tag1)
+
+        res = self.client.get(TAGS_URL, {'assigned_only': 1})
+
+        serializer1 = TagSerializer(tag1)
+        serializer2 = TagSerializer(tag2)
+        self.assertIn(serializer1.data, res.data)
+        self.assertNotIn(serializer2.data, res.data)
+
+    def test_retrieve_tags_ordered_by_usage(self):
+        """Test ordering tags by the number of recipes using them"""
+        tags = [
+            Tag.objects.create(user=self.user, name=name)
+            for name in ('Breakfast', 'Lunch', 'Dinner')
+        ]
+        for i in range(3):
+            recipe = Recipe.objects.create(
+                title=f'Recipe {i}', time_minutes=10, price=5.00,
+                user=self.user
+            )
+            recipe.tags.set(tags[:i + 1])
+
+        res = self.client.get(TAGS_URL, {'ordering': '-usage'})
+
+        self.assertEqual(
+            [tag['name'] for tag in res.data], ['Breakfast', 'Lunch', 'Dinner']
+        )
+
+    def test_retrieve_tags_assigned_only_true(self):
+        """Test assigned_only accepts boolean words"""
+        Tag.objects.create(user=self.user, name='Lunch')
+
+        res = self.client.get(TAGS_URL, {'assigned_only': 'true'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [])
+
+    def test_retrieve_tags_invalid_params(self):
+        """Test invalid assigned_only and ordering values return 400"""
+        for params in ({'assigned_only': 'maybe'}, {'ordering': 'user'}):
+            res = self.client.get(TAGS_URL, params)
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn(next(iter(params)), res.data)
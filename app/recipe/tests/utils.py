@@ -0,0 +1,13 @@
+from core.models import Recipe
+
+
+def sample_recipe(user, title='Sample recipe', **params):
+    """Create and return a sample recipe"""
+    # Any params passed in off the user and title override the defaults
+    defaults = {
+        'time_minutes': 10,
+        'price': 5.00
+    }
+    defaults.update(params)
+
+    return Recipe.objects.create(user=user, title=title, **defaults)
@@ -15,4 +15,7 @@ app_name = 'recipe'
 urlpatterns = [
     # router.urls NOT a str
     path('', include(router.urls)),
+    path('shopping-list/', views.ShoppingListView.as_view(),
+         name='shopping-list'),
+    path('sync/', views.SyncView.as_view(), name='sync'),
 ]
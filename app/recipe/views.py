@@ -1,16 +1,31 @@
+from datetime import timedelta
+from itertools import groupby
+
+from django.conf import settings
+from django.db import connections, router
+from django.utils import timezone
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from rest_framework import viewsets, mixins, status
+from rest_framework import generics, viewsets, mixins, status
 from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 
-from core.models import Tag, Ingredient, Recipe
+from core.models import Tag, Ingredient, Recipe, Tombstone
+from core.replicas import ReplicaReadMixin
+from core.shards import ShardedViewMixin
+from core.uploads import ImageUploadHandler
+from core.versions import VersionedViewMixin
 
-from recipe import serializers
+from recipe import autocomplete, bulk, serializers
+from recipe.similarity import get_index
 
 
 # Gone use only list mixin. There are update, delete mixins ...
-class BaseRecipeAttrViewSet(viewsets.GenericViewSet,
+class BaseRecipeAttrViewSet(ShardedViewMixin,
+                            VersionedViewMixin,
+                            ReplicaReadMixin,
+                            viewsets.GenericViewSet,
                             mixins.ListModelMixin,
                             mixins.CreateModelMixin):
     # Case viewset for user owned recipe attr
@@ -18,20 +33,84 @@ class BaseRecipeAttrViewSet(viewsets.GenericViewSet,
     authentication_classes = (TokenAuthentication,)
     permission_classes = (IsAuthenticated,)
 
+    # ?ordering= values and the columns they sort on. Each one is backed by
+    # a (user, ...) index on the model.
+    orderings = {
+        'name': ('name',),
+        '-name': ('-name',),
+        'usage': ('recipe_count', '-name'),
+        '-usage': ('-recipe_count', '-name'),
+    }
+
     # When ViewSet/ListModelMixin is involked, the get_queryset function is
     # called to retrieve the objects
     def get_queryset(self):
         """Return objects for current auth user only"""
-        return self.queryset.filter(user=self.request.user).order_by('-name')
+        params = serializers.RecipeAttrFilterSerializer(
+            data=self.request.query_params,
+            context=self.get_serializer_context()
+        )
+        params.is_valid(raise_exception=True)
+        queryset = self.queryset.filter(user=self.request.user)
+        if params.validated_data['assigned_only']:
+            # recipe_count avoids joining the recipe through table
+            queryset = queryset.filter(recipe_count__gt=0)
+
+        return queryset.order_by(
+            *self.orderings[params.validated_data['ordering']]
+        )
+
+    @action(methods=['GET'], detail=False)
+    def autocomplete(self, request):
+        """List the auth user's objs whose name starts with ?q=, most used
+        first"""
+        params = serializers.AutocompleteQuerySerializer(
+            data=request.query_params
+        )
+        params.is_valid(raise_exception=True)
+
+        matches = autocomplete.complete(
+            request.user, self.queryset.filter(user=request.user),
+            params.validated_data['q'], params.validated_data['limit']
+        )
+        serializer = serializers.AutocompleteMatchSerializer([
+            {'id': pk, 'name': name, 'recipe_count': recipe_count}
+            for pk, name, recipe_count in matches
+        ], many=True)
+        return Response(serializer.data)
+
+    # Names are unique per user ignoring case, so creating is idempotent:
+    # posting an existing name returns that obj with 200 instead of 201.
+    def create(self, request, *args, **kwargs):
+        """Get or create the named obj for the auth user"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        created = self.perform_create(serializer)
+        headers = self.get_success_headers(serializer.data)
+
+        return Response(
+            serializer.data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+            headers=headers
+        )
 
     # When create is invoked, perform_create is called, receives serializer
     # as arg, so one can customize the creation: set the user to the auth
     # user.
     def perform_create(self, serializer):
-        """Override the perform_create function and create a new obj for
-        an auth user only"""
-        # Atention to the arg of save(). 'user' is in the request
-        serializer.save(user=self.request.user)
+        """Get or create the obj for an auth user only in one query and
+        return whether it was created"""
+        # Atention to the arg of get_or_create_by_name. 'user' is in the
+        # request
+        with self.versioned_write():
+            obj, created = \
+                self.queryset.model.objects.get_or_create_by_name(
+                    user=self.request.user,
+                    name=serializer.validated_data['name']
+                )
+        serializer.instance = obj
+
+        return created
 
 
 # Gone use only list mixin. There are update, delete mixins ...
@@ -50,12 +129,33 @@ class IngredientViewSet(BaseRecipeAttrViewSet):
     serializer_class = serializers.IngredientSerializer
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ShardedViewMixin,
+                    VersionedViewMixin,
+                    ReplicaReadMixin,
+                    viewsets.ModelViewSet):
     """Manage recipes in the db"""
     serializer_class = serializers.RecipeSerializer
     queryset = Recipe.objects.all()
     authentication_classes = (TokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    # Most recipes fetched at once with ?ids=
+    max_batch_size = 100
+    # Sent as POST for its body, but only reads
+    read_only_actions = frozenset({'cookable'})
+
+    # ?ordering= values and the columns they sort on, with the id breaking
+    # ties so pages are stable. Each one is backed by a (user, column, id)
+    # index; a range filter on another column is applied while scanning it.
+    orderings = {
+        'id': ('id',),
+        '-id': ('-id',),
+        'title': ('title', 'id'),
+        '-title': ('-title', '-id'),
+        'time_minutes': ('time_minutes', 'id'),
+        '-time_minutes': ('-time_minutes', '-id'),
+        'price': ('price', 'id'),
+        '-price': ('-price', '-id'),
+    }
 
     def _params_to_ints(sel, qs):
         """Convert a list of string IDs to a list of integers"""
@@ -72,25 +172,216 @@ class RecipeViewSet(viewsets.ModelViewSet):
         if ingredients:
             ingredient_ids = self._params_to_ints(ingredients)
             queryset = queryset.filter(ingredients__id__in=ingredient_ids)
+        if self.action == 'list':
+            queryset = self._filter_list(queryset)
 
         return queryset.filter(user=self.request.user)
 
+    def _filter_list(self, queryset):
+        """Apply the validated range filters and ordering of the list"""
+        params = serializers.RecipeFilterSerializer(
+            data=self.request.query_params,
+            context=self.get_serializer_context()
+        )
+        params.is_valid(raise_exception=True)
+        bounds = params.validated_data
+        for field in ('time_minutes', 'price'):
+            if f'{field}_min' in bounds:
+                queryset = queryset.filter(
+                    **{f'{field}__gte': bounds[f'{field}_min']}
+                )
+            if f'{field}_max' in bounds:
+                queryset = queryset.filter(
+                    **{f'{field}__lte': bounds[f'{field}_max']}
+                )
+
+        # Two queries for the tag and ingredient ids of the whole page
+        return queryset.prefetch_related('tags', 'ingredients').order_by(
+            *self.orderings[bounds.get('ordering', 'id')]
+        )
+
     def get_serializer_class(self):
         """Return appropriate serializer class"""
-        if self.action == 'retrieve':
+        if self.action == 'retrieve' or (
+                self.action == 'list' and
+                self.request.query_params.get('detail') == '1'):
             return serializers.RecipeDetailSerializer
         elif self.action == 'upload_image':
             return serializers.RecipeImageSerializer
 
         return self.serializer_class
 
+    def list(self, request, *args, **kwargs):
+        """List the recipes, or fetch a batch of them with ?ids="""
+        if 'ids' not in request.query_params:
+            return super().list(request, *args, **kwargs)
+
+        try:
+            ids = self._params_to_ints(request.query_params['ids'])
+        except ValueError:
+            raise ValidationError({'ids': 'Expected comma separated ids.'})
+        if len(ids) > self.max_batch_size:
+            raise ValidationError({
+                'ids': f'At most {self.max_batch_size} ids are allowed.'
+            })
+
+        # Three queries however many ids: recipes, tags and ingredients.
+        # Ids not found among the auth user's recipes are reported rather
+        # than failing the batch.
+        recipes = self.get_queryset() \
+            .prefetch_related('tags', 'ingredients') \
+            .in_bulk(ids)
+        found = [recipes[pk] for pk in dict.fromkeys(ids) if pk in recipes]
+        serializer = self.get_serializer(found, many=True)
+
+        return Response({
+            'results': serializer.data,
+            'missing': [pk for pk in dict.fromkeys(ids) if pk not in recipes],
+        })
+
     def perform_create(self, serializer):
         """Create a new recipe"""
-        serializer.save(user=self.request.user)
+        with self.versioned_write():
+            serializer.save(user=self.request.user)
+
+    @action(methods=['GET'], detail=True)
+    def similar(self, request, pk=None):
+        """List the auth user's recipes sharing the most tags and
+        ingredients with this one"""
+        recipe = self.get_object()
+        params = serializers.SimilarRecipesQuerySerializer(
+            data=request.query_params
+        )
+        params.is_valid(raise_exception=True)
+
+        ranked = get_index(request.user).similar(
+            recipe.id, **params.validated_data
+        )
+        similar = self._load_ranked(
+            (recipe_id, {'score': score}) for recipe_id, score in ranked
+        )
+
+        serializer = serializers.SimilarRecipeSerializer(
+            similar, many=True, context=self.get_serializer_context()
+        )
+        return Response(serializer.data)
+
+    @action(methods=['POST'], detail=False)
+    def cookable(self, request):
+        """List the auth user's recipes using the given ingredients, those
+        needing the fewest others first"""
+        params = serializers.CookableRecipesSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+
+        # Served from the in-memory ingredient postings, so the through
+        # table is not scanned
+        ranked = get_index(request.user).cookable(
+            params.validated_data['ingredients'],
+            params.validated_data['limit']
+        )
+        cookable = self._load_ranked(
+            (recipe_id, {'coverage': coverage, 'missing': missing})
+            for recipe_id, coverage, missing in ranked
+        )
+
+        serializer = serializers.CookableRecipeSerializer(
+            cookable, many=True, context=self.get_serializer_context()
+        )
+        return Response(serializer.data)
+
+    def _load_ranked(self, ranked):
+        """Fetch the recipes of (recipe_id, attrs) pairs in order, setting
+        attrs on each. Ids no longer in the db are skipped."""
+        ranked = list(ranked)
+        recipes = self.get_queryset() \
+            .prefetch_related('tags', 'ingredients') \
+            .in_bulk([recipe_id for recipe_id, _ in ranked])
+        loaded = []
+        for recipe_id, attrs in ranked:
+            if recipe_id in recipes:
+                for name, value in attrs.items():
+                    setattr(recipes[recipe_id], name, value)
+                loaded.append(recipes[recipe_id])
+        return loaded
+
+    def _bulk_params(self, serializer_class):
+        """Validate a bulk request and split its recipe ids into the auth
+        user's and the missing ones"""
+        params = serializer_class(
+            data=self.request.data, context=self.get_serializer_context()
+        )
+        params.is_valid(raise_exception=True)
+        requested = params.validated_data['recipes']
+        found = set(
+            self.queryset.filter(user=self.request.user, id__in=requested)
+            .values_list('id', flat=True)
+        )
+        recipe_ids = sorted(found)
+        missing = sorted(set(requested) - found)
+        return params.validated_data, recipe_ids, missing
+
+    def _bulk_links(self, change):
+        params, recipe_ids, missing = self._bulk_params(
+            serializers.BulkLinksSerializer
+        )
+        links = {key: params[key] for key in bulk.LINKS if params[key]}
+        counts = {}
+        if recipe_ids:
+            with self.versioned_write():
+                counts = change(self.request.user, recipe_ids, links)
+        return Response({
+            'recipes': len(recipe_ids),
+            'missing': missing,
+            **{key: counts.get(key, 0) for key in bulk.LINKS},
+        })
+
+    # Bulk changes run a fixed number of queries in one transaction, and
+    # answer with the number of recipes found, the ids that weren't and
+    # how many links or rows changed
+
+    @action(methods=['POST'], detail=False, url_path='bulk-add')
+    def bulk_add(self, request):
+        """Link tags and ingredients to many recipes"""
+        return self._bulk_links(bulk.add_links)
+
+    @action(methods=['POST'], detail=False, url_path='bulk-remove')
+    def bulk_remove(self, request):
+        """Unlink tags and ingredients from many recipes"""
+        return self._bulk_links(bulk.remove_links)
+
+    @action(methods=['POST'], detail=False, url_path='bulk-delete')
+    def bulk_delete(self, request):
+        """Delete many recipes"""
+        _, recipe_ids, missing = self._bulk_params(
+            serializers.BulkRecipesSerializer
+        )
+        deleted = 0
+        if recipe_ids:
+            with self.versioned_write():
+                deleted = bulk.delete_recipes(request.user, recipe_ids)
+        return Response({'recipes': len(recipe_ids), 'missing': missing,
+                         'deleted': deleted})
+
+    @action(methods=['POST'], detail=False, url_path='bulk-update')
+    def bulk_update(self, request):
+        """Set the same field values on many recipes"""
+        params, recipe_ids, missing = self._bulk_params(
+            serializers.BulkUpdateSerializer
+        )
+        updated = 0
+        if recipe_ids:
+            with self.versioned_write():
+                updated = bulk.update_recipes(
+                    request.user, recipe_ids, params['values']
+                )
+        return Response({'recipes': len(recipe_ids), 'missing': missing,
+                         'updated': updated})
 
     @action(methods=['POST'], detail=True, url_path='upload-image')
     def upload_image(self, request, pk=None):
         """Upload an image to a recipe"""
+        # Check the file as it streams in, before the body is parsed
+        request.upload_handlers = [ImageUploadHandler(request)]
         recipe = self.get_object()
         serializer = self.get_serializer(
             recipe,
@@ -98,7 +389,8 @@ class RecipeViewSet(viewsets.ModelViewSet):
         )
 
         if serializer.is_valid():
-            serializer.save()
+            with self.versioned_write():
+                serializer.save()
             return Response(
                 serializer.data,
                 status.HTTP_200_OK
@@ -108,3 +400,111 @@ class RecipeViewSet(viewsets.ModelViewSet):
             serializer.errors,
             status=status.HTTP_400_BAD_REQUEST
         )
+
+
+class ShoppingListView(ShardedViewMixin, generics.GenericAPIView):
+    """Merge the ingredients of many recipes into a shopping list"""
+    serializer_class = serializers.ShoppingListSerializer
+    authentication_classes = (TokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request):
+        """Return each ingredient of the auth user's given recipes once,
+        with the ids of the recipes using it"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        through = Recipe.ingredients.through
+        links = through.objects.filter(
+            recipe_id__in=serializer.validated_data['recipes'],
+            recipe__user=request.user
+        ).order_by('ingredient__name', 'ingredient_id')
+        items = self._aggregate(links, router.db_for_read(through))
+
+        return Response(
+            serializers.ShoppingListItemSerializer(items, many=True).data
+        )
+
+    def _aggregate(self, links, alias):
+        """Group the links by ingredient in one query"""
+        if connections[alias].vendor == 'postgresql':
+            from django.contrib.postgres.aggregates import ArrayAgg
+
+            rows = links.values('ingredient_id', 'ingredient__name') \
+                .annotate(recipe_ids=ArrayAgg('recipe_id',
+                                              ordering='recipe_id'))
+            return [
+                {'id': row['ingredient_id'], 'name': row['ingredient__name'],
+                 'recipes': row['recipe_ids']}
+                for row in rows
+            ]
+
+        # No portable array aggregate, so group the ordered rows here
+        rows = links.order_by(
+            'ingredient__name', 'ingredient_id', 'recipe_id'
+        ).values_list('ingredient_id', 'ingredient__name', 'recipe_id')
+        return [
+            {'id': pk, 'name': name,
+             'recipes': [recipe_id for _, _, recipe_id in group]}
+            for (pk, name), group in groupby(rows, lambda row: row[:2])
+        ]
+
+
+class SyncView(ShardedViewMixin, generics.GenericAPIView):
+    """Send what changed in the auth user's recipe data since a cursor"""
+    serializer_class = serializers.SyncQuerySerializer
+    authentication_classes = (TokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+
+    # Response key, model and serializer of each synced resource
+    resources = (
+        ('tags', Tag, serializers.TagSerializer),
+        ('ingredients', Ingredient, serializers.IngredientSerializer),
+        ('recipes', Recipe, serializers.RecipeSerializer),
+    )
+
+    # Reads go to the primary: a lagging replica could hide changes older
+    # than the cursor handed out
+    def get(self, request):
+        """Return the tags, ingredients and recipes changed or deleted since
+        ?since=, or all of them, with the cursor to send next time"""
+        params = self.get_serializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        user = request.user
+
+        now = timezone.now()
+        shard, since = params.validated_data.get('since', (None, None))
+        # A cursor from another shard predates a move that renumbered the
+        # user's data, and an old one may have missed pruned tombstones
+        reset = since is None or shard != user.shard or \
+            since < now - timedelta(days=settings.SYNC_TOMBSTONE_DAYS)
+
+        data = {'reset': reset}
+        deleted = {}
+        for key, model, serializer_class in self.resources:
+            queryset = model.objects.filter(user=user)
+            if not reset:
+                queryset = queryset.filter(updated_at__gt=since)
+            if model is Recipe:
+                queryset = queryset.prefetch_related('tags', 'ingredients')
+            data[key] = serializer_class(
+                queryset.order_by('updated_at', 'id'), many=True
+            ).data
+            deleted[model._meta.model_name] = []
+
+        if not reset:
+            tombstones = Tombstone.objects.filter(
+                user=user, deleted_at__gt=since
+            ).values_list('kind', 'object_id')
+            for kind, object_id in tombstones:
+                deleted[kind].append(object_id)
+        data['deleted'] = {
+            key: deleted[model._meta.model_name]
+            for key, model, _ in self.resources
+        }
+
+        # Rows saved while this request ran, or stamped by a server whose
+        # clock is a little behind, are sent again next time
+        cursor = now - timedelta(seconds=settings.SYNC_CURSOR_OVERLAP_SECONDS)
+        data['cursor'] = f'{user.shard}:{int(cursor.timestamp() * 1e6)}'
+        return Response(data)
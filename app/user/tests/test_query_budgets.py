@@ -0,0 +1,44 @@
+from django.contrib.auth import get_user_model
+
+from core import testing
+from core.models import Recipe, Tag
+from core.testing import Endpoint
+
+from user import urls
+
+
+class UserQueryBudgetTests(testing.QueryBudgetTestCase):
+    """Every user api route runs a bounded number of queries, however
+    much recipe data the user has"""
+    endpoints = {
+        ('user:create', 'post'): Endpoint(2, data=lambda context: {
+            'email': 'new@ufc.br', 'password': 'testpass', 'name': 'New',
+        }),
+        ('user:token', 'post'): Endpoint(5, data=lambda context: {
+            'email': 'budget@ufc.br', 'password': 'testpass',
+        }),
+        ('user:me', 'get'): Endpoint(0),
+        ('user:me', 'put'): Endpoint(3, data=lambda context: {
+            'email': 'budget@ufc.br', 'password': 'newpass', 'name': 'Me',
+        }),
+        ('user:me', 'patch'): Endpoint(
+            1, data=lambda context: {'name': 'Me'}
+        ),
+        ('user:me', 'delete'): Endpoint(2),
+    }
+
+    def populate(self, size):
+        user = get_user_model().objects.create_user(
+            'budget@ufc.br', 'testpass'
+        )
+        self.client.force_authenticate(user)
+        for i in range(size):
+            recipe = Recipe.objects.create(
+                user=user, title=f'Recipe {i}', time_minutes=i, price=i
+            )
+            recipe.tags.add(Tag.objects.create(user=user, name=f'Tag {i}'))
+        return {'user': user}
+
+    def test_every_route_budgeted(self):
+        """Test no user route is left without a query budget"""
+        self.assertRoutesBudgeted(urls.urlpatterns, 'user')
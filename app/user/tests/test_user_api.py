@@ -1,9 +1,13 @@
+from unittest.mock import patch
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 from django.urls import reverse
+from rest_framework.authtoken.models import Token
 from rest_framework.test import APIClient
 from rest_framework import status
 
+from core.models import Job, Recipe
+
 CREATE_USER_URL = reverse('user:create')
 TOKEN_URL = reverse('user:token')
 ME_URL = reverse('user:me')
@@ -152,3 +156,24 @@ class PrivateUserApiTests(TestCase):
         self.assertEqual(self.user.name, payload['name'])
         self.assertTrue(self.user.check_password(payload['password']))
         self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_delete_account(self):
+        """Test deleting closes the account and leaves the purge for later"""
+        Token.objects.create(user=self.user)
+        Recipe.objects.create(
+            user=self.user, title='Soup', time_minutes=5, price=5.00
+        )
+
+        # Tests run in a transaction that never commits
+        with patch('user.views.transaction.on_commit', lambda f: f()):
+            res = self.client.delete(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        self.assertIsNotNone(self.user.deleted_at)
+        self.assertFalse(Token.objects.filter(user=self.user).exists())
+        self.assertTrue(Recipe.objects.filter(user=self.user).exists())
+        job = Job.objects.get()
+        self.assertEqual(job.task, 'purge_deleted_user')
+        self.assertIn(self.user.email, job.payload)
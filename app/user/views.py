@@ -1,6 +1,11 @@
+from django.db import transaction
+from django.utils import timezone
 from rest_framework import generics, authentication, permissions
+from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.settings import api_settings
+from core import jobs
+from core.replicas import ReplicaReadMixin
 from user.serializers import UserSerializer, AuthTokenSerializer
 
 
@@ -15,7 +20,8 @@ class CreateTokenView(ObtainAuthToken):
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
 
 
-class ManageUserView(generics.RetrieveUpdateAPIView):
+class ManageUserView(ReplicaReadMixin,
+                     generics.RetrieveUpdateDestroyAPIView):
     """Manage the authenticated user"""
     serializer_class = UserSerializer
     # New way to set an instance of a class....
@@ -28,3 +34,15 @@ class ManageUserView(generics.RetrieveUpdateAPIView):
     def get_object(self):
         """Retrieve and return authentication user"""
         return self.request.user
+
+    # Deleting everything at once can take long for big accounts, so the
+    # account is only closed here and a background job removes the data.
+    def perform_destroy(self, instance):
+        """Close the account and sign it out"""
+        instance.is_active = False
+        instance.deleted_at = timezone.now()
+        instance.save(update_fields=['is_active', 'deleted_at'])
+        Token.objects.filter(user=instance).delete()
+        transaction.on_commit(lambda: jobs.enqueue(
+            'purge_deleted_user', instance.email
+        ))